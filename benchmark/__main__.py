@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.load_generator import LoadConfig, LoadStats, CLIENT_KINDS, generate_load, seed
+from benchmark.server_process import ServerProcess
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in CLIENT_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown client kind {kind}, expected one of {', '.join(CLIENT_KINDS)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def benchmark(args) -> dict:
+    config = LoadConfig(port=free_port(), clients=args.clients, projects=args.projects, seed_symbols=args.seed_symbols,
+                        rename_interval=args.rename_interval, bulk_symbols=args.bulk_symbols,
+                        bulk_interval=args.bulk_interval, join_interval=args.join_interval,
+                        churn_interval=args.churn_interval, codec=args.codec, compression=args.compression)
+    if args.mix is not None:
+        config.mix = args.mix
+
+    with tempfile.TemporaryDirectory(prefix='jsync-benchmark-') as directory:
+        stores = Path(directory) / 'stores'
+        resources = Path(directory) / 'resources'
+        stores.mkdir()
+        resources.mkdir()
+
+        server = ServerProcess(stores, resources, config.port, args.server_args, args.server_log)
+        await server.start()
+        sampler = asyncio.ensure_future(server.sample(0.5))
+        try:
+            await seed(config, LoadStats())
+
+            cpu_seconds = server.cpu_seconds
+            start = time.perf_counter()
+            stats = await generate_load(config, args.duration, args.seed)
+            duration = time.perf_counter() - start
+            cpu_seconds = server.cpu_seconds - cpu_seconds
+            rss_bytes = server.rss_bytes
+        finally:
+            sampler.cancel()
+            server.stop()
+
+    return {
+        'config': {**vars(config), 'duration': args.duration, 'server_args': args.server_args},
+        'duration': duration,
+        'results': stats.report(duration),
+        'server': {
+            'cpu_seconds': cpu_seconds,
+            'cpu_utilization': cpu_seconds / duration,
+            'rss_bytes': rss_bytes,
+            'peak_rss_bytes': max(server.peak_rss_bytes, rss_bytes),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-benchmark",
+                                     description="Drives a JSync server with simulated clients, reporting JSON")
+    parser.add_argument("-c", "--clients", type=int, default=LoadConfig.clients, help="Amount of simulated clients")
+    parser.add_argument("-m", "--mix", type=parse_mix, default=None,
+                        help="Weights of client kinds, e.g. interactive=0.8,bulk=0.05,join=0.1,churn=0.05")
+    parser.add_argument("--projects", type=int, default=LoadConfig.projects, help="Amount of projects")
+    parser.add_argument("--seed-symbols", type=int, default=LoadConfig.seed_symbols,
+                        help="Symbols uploaded to each project before measuring")
+    parser.add_argument("-t", "--duration", type=float, default=30, help="Seconds to measure for")
+    parser.add_argument("--rename-interval", type=float, default=LoadConfig.rename_interval,
+                        help="Mean seconds between renames of an interactive client")
+    parser.add_argument("--bulk-symbols", type=int, default=LoadConfig.bulk_symbols,
+                        help="Symbols in each upload of a bulk client")
+    parser.add_argument("--bulk-interval", type=float, default=LoadConfig.bulk_interval,
+                        help="Mean seconds between uploads of a bulk client")
+    parser.add_argument("--join-interval", type=float, default=LoadConfig.join_interval,
+                        help="Mean seconds between joins of a joining client")
+    parser.add_argument("--churn-interval", type=float, default=LoadConfig.churn_interval,
+                        help="Mean seconds between subscription changes of a churning client")
+    parser.add_argument("--codec", default=LoadConfig.codec, help="Codec the clients ask for")
+    parser.add_argument("--compression", default=LoadConfig.compression, help="Compression the clients ask for")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the clients' randomness")
+    parser.add_argument("--server-log", type=Path, default=None, help="File to write the server's output to")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="File to write the JSON report to")
+    parser.add_argument("server_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed on to the server (after --), e.g. -- --workers 4")
+
+    args = parser.parse_args()
+    if args.server_args[:1] == ['--']:
+        args.server_args = args.server_args[1:]
+
+    report = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    if args.output is not None:
+        args.output.write_text(report + '\n')
+    else:
+        sys.stdout.write(report + '\n')
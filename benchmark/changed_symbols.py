@@ -0,0 +1,80 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from common.symbol_store import SymbolStoreABC
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+
+
+def per_symbol_changed_symbols(store: SymbolStoreABC, symbols: Iterable[Symbol]) -> Iterator[Symbol]:
+    # `changed_symbols` as it was, querying each symbol's latest version on its own
+    for symbol in symbols:
+        existing_symbols = list(store.get_symbols(canonical_signature=symbol.canonical_signature, author=symbol.author))
+        if len(existing_symbols) == 0:
+            yield symbol
+        else:
+            existing_symbol, = existing_symbols
+            if symbol.name != existing_symbol.name:
+                yield symbol
+
+
+def signature(i: int) -> str:
+    return f'Lcom/example/pkg{i % 50}/Cls{i // 20};->method{i}(Ljava/lang/String;I)V'
+
+
+def candidates(count: int) -> List[Symbol]:
+    # Half unchanged, a quarter renamed and a quarter new (by signature, or by author)
+    result = []
+    for i in range(count):
+        name = f'name{i}' if i % 4 < 2 else f'renamed{i}'
+        if i % 4 != 3:
+            result.append(Symbol(SYMBOL_TYPE_METHOD, signature(i), name, timestamp=200, author='alice'))
+        elif i % 8 == 3:
+            result.append(Symbol(SYMBOL_TYPE_METHOD, signature(i) + 'x', name, timestamp=200, author='alice'))
+        else:
+            result.append(Symbol(SYMBOL_TYPE_METHOD, signature(i), f'name{i}', timestamp=200, author='bob'))
+    return result
+
+
+def timed(operation) -> tuple:
+    start = time.perf_counter()
+    result = list(operation())
+    return result, time.perf_counter() - start
+
+
+def measure(directory: Path, count: int) -> dict:
+    store = PySqliteSymbolStore(str(directory / f'{count}.db'))
+    try:
+        store.import_symbols(((SYMBOL_TYPE_METHOD, signature(i), f'name{i}') for i in range(count)), 'alice', 100)
+        symbols = candidates(count)
+        joined, join_seconds = timed(lambda: store.changed_symbols(symbols))
+        per_symbol, per_symbol_seconds = timed(lambda: per_symbol_changed_symbols(store, symbols))
+    finally:
+        store.close()
+    return {
+        'changed': len(joined),
+        'join_seconds': join_seconds,
+        'per_symbol_seconds': per_symbol_seconds,
+        'identical': joined == per_symbol,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-changed-symbols",
+                                     description="Measures diffing candidate symbols against a server store's latest"
+                                                 " symbols, by a single join versus a query per symbol, and checks"
+                                                 " both find the same changes, reporting JSON")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help="Symbols in the store, and candidates diffed against it")
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='jsync-changed-symbols-') as temporary_directory:
+        report = {str(count): measure(Path(temporary_directory), count) for count in args.sizes}
+    sys.stdout.write(json.dumps(report, indent=2) + '\n')
+    if not all(result['identical'] for result in report.values()):
+        sys.exit(1)
@@ -0,0 +1,137 @@
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+from common.codecs import CODECS
+from common.commands import DownstreamSymbols, Command
+from common.compression import COMPRESSIONS, compress_packet, decompress_packet, packet_size
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_CLASS
+
+
+def page(symbols: int, classes: int, authors: int, seed: int) -> DownstreamSymbols:
+    # A full sync page, of symbols spread over classes (and their members) like those of an obfuscated application
+    rng = random.Random(seed)
+    timestamp = int(time.time())
+    result = []
+    for i in range(symbols):
+        cls = f'Lcom/example/{rng.randrange(classes):x}/a{rng.randrange(classes):x};'
+        symbol_type = rng.choice((SYMBOL_TYPE_METHOD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_CLASS))
+        if symbol_type == SYMBOL_TYPE_CLASS:
+            signature = cls
+        elif symbol_type == SYMBOL_TYPE_METHOD:
+            signature = f'{cls}->m{i}(Ljava/lang/String;I)V'
+        else:
+            signature = f'{cls}->f{i}:I'
+        result.append(Symbol(symbol_type, signature, f'renamed{i}', timestamp=timestamp - rng.randrange(1 << 20),
+                             author=f'author{rng.randrange(authors)}'))
+    return DownstreamSymbols('benchmark', result)
+
+
+def timed(operation: Callable[[], object], duration: float) -> List[float]:
+    # Runs the operation repeatedly (at least thrice) for about `duration` seconds, returning each run's time
+    times = []
+    deadline = time.perf_counter() + duration
+    while len(times) < 3 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+# A throttled link sends this many chunks a second
+LINK_CHUNKS_PER_SECOND = 100
+
+
+def send_throttled(sock: socket.socket, data: bytes, bytes_per_second: float):
+    # Sends the data in chunks, each once a link of that bandwidth would have carried it in full
+    chunk = max(int(bytes_per_second) // LINK_CHUNKS_PER_SECOND, 1)
+    start = time.perf_counter()
+    for offset in range(0, len(data), chunk):
+        end = min(offset + chunk, len(data))
+        delay = start + end / bytes_per_second - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sock.sendall(data[offset:end])
+
+
+def over_link(data: bytes, bytes_per_second: float) -> bytes:
+    # The data as received over a local socket throttled to `bytes_per_second`
+    sender, receiver = socket.socketpair()
+    thread = threading.Thread(target=send_throttled, args=(sender, data, bytes_per_second))
+    thread.start()
+    try:
+        received = bytearray()
+        while len(received) < len(data):
+            received += receiver.recv(len(data) - len(received))
+        return bytes(received)
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+
+
+def measure(codec_name: str, compression: str, command: Command, duration: float,
+            link_bytes_per_second: Optional[float] = None) -> dict:
+    codec = CODECS[codec_name]
+    compression = None if compression == 'none' else compression
+    encoded = codec.encode(command)
+    size_field, payload = compress_packet(encoded, compression)
+
+    encode_times = timed(lambda: compress_packet(codec.encode(command), compression), duration)
+    decode_times = timed(lambda: codec.decode(decompress_packet(payload, packet_size(size_field)[1])), duration)
+    symbols = len(command.symbols)
+    result = {
+        'encoded_bytes': len(encoded),
+        'wire_bytes': len(payload),
+        'encode_seconds': min(encode_times),
+        'decode_seconds': min(decode_times),
+        'encode_symbols_per_second': symbols / min(encode_times),
+        'decode_symbols_per_second': symbols / min(decode_times),
+    }
+    if link_bytes_per_second:
+        # Sending the page over the link, and end to end: encoding, sending and decoding it
+        def send():
+            size_field, payload = compress_packet(codec.encode(command), compression)
+            codec.decode(decompress_packet(over_link(payload, link_bytes_per_second), packet_size(size_field)[1]))
+
+        transfer_times = timed(lambda: over_link(payload, link_bytes_per_second), duration)
+        send_times = timed(send, duration)
+        result.update({
+            'transfer_seconds': min(transfer_times),
+            'send_seconds': min(send_times),
+            'send_symbols_per_second': symbols / min(send_times),
+        })
+    return result
+
+
+def benchmark(args) -> dict:
+    command = page(args.symbols, args.classes, args.authors, args.seed)
+    report = {'config': vars(args)}
+    for codec_name in args.codecs:
+        for compression in args.compressions:
+            report[f'{codec_name}/{compression}'] = measure(codec_name, compression, command, args.duration,
+                                                            args.link_bytes_per_second)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-codecs",
+                                     description="Measures the encoded size and the (de)serialization time of a full"
+                                                 " sync page by each codec and compression (and optionally the time"
+                                                 " to send it over a throttled link), reporting JSON")
+    parser.add_argument("-t", "--duration", type=float, default=2, help="Seconds to measure each operation for")
+    parser.add_argument("--symbols", type=int, default=5000, help="Symbols in the page")
+    parser.add_argument("--classes", type=int, default=500, help="Distinct classes the symbols are members of")
+    parser.add_argument("--authors", type=int, default=5, help="Distinct authors of the symbols")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--codecs", nargs='+', choices=sorted(CODECS), default=sorted(CODECS))
+    parser.add_argument("--compressions", nargs='+', choices=['none'] + COMPRESSIONS, default=['none'] + COMPRESSIONS)
+    parser.add_argument("--link-bytes-per-second", type=float,
+                        help="Also measure sending the page over a local link throttled to this bandwidth")
+
+    sys.stdout.write(json.dumps(benchmark(parser.parse_args()), indent=2) + '\n')
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, TypeVar
+
+from benchmark.load_generator import percentile
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from common.symbol_store import SymbolStoreABC
+from server.async_symbol_store import AsyncSymbolStore
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+
+
+T = TypeVar('T')
+
+
+class InlineSymbolStore:
+    # Runs store operations on the event loop itself, as the server did before offloading them
+    def __init__(self, store: SymbolStoreABC):
+        self._store = store
+
+    async def write(self, operation: Callable[[SymbolStoreABC], T], name: str = 'write') -> T:
+        return operation(self._store)
+
+    async def read(self, operation: Callable[[SymbolStoreABC], T], name: str = 'read') -> T:
+        return operation(self._store)
+
+    def close(self):
+        self._store.close()
+
+
+async def probe_lag(interval: float, lags: List[float]):
+    # Like monitor_event_loop_lag, recording every sample
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(max(time.monotonic() - start - interval, 0))
+
+
+async def upload(store, batch_symbols: int, interval: float, counts: dict):
+    for batch in range(1 << 30):
+        timestamp = int(time.time())
+        symbols = [Symbol(SYMBOL_TYPE_METHOD, f'Lcom/example/Cls{i // 20};->m{i}()V', f'name{batch}_{i}',
+                          timestamp=timestamp, author='uploader') for i in range(batch_symbols)]
+        await store.write(lambda sqlite_store: sqlite_store.push_symbols(symbols), 'push_symbols')
+        counts['uploads'] += 1
+        await asyncio.sleep(interval)
+
+
+async def full_sync(store, page_symbols: int, interval: float, counts: dict):
+    while True:
+        after = None
+        while True:
+            page = await store.read(lambda sqlite_store: sqlite_store.get_symbols_page(after=after,
+                                                                                       limit=page_symbols),
+                                    'get_symbols_page')
+            if len(page) < page_symbols:
+                break
+            after = page[-1].author, page[-1].canonical_signature
+        counts['full_syncs'] += 1
+        await asyncio.sleep(interval)
+
+
+async def measure(mode: str, path: Path, args) -> dict:
+    if mode == 'offloaded':
+        store = AsyncSymbolStore('benchmark', lambda: PySqliteSymbolStore(str(path)))
+    else:
+        store = InlineSymbolStore(PySqliteSymbolStore(str(path)))
+
+    lags = []
+    counts = {'uploads': 0, 'full_syncs': 0}
+    tasks = [asyncio.ensure_future(probe_lag(args.probe_interval, lags))]
+    tasks += [asyncio.ensure_future(upload(store, args.batch_symbols, args.upload_interval, counts))
+              for _ in range(args.uploaders)]
+    tasks += [asyncio.ensure_future(full_sync(store, args.page_symbols, args.sync_interval, counts))
+              for _ in range(args.syncers)]
+    try:
+        await asyncio.sleep(args.duration)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        store.close()
+
+    return {
+        'lag_p50': percentile(lags, 0.5),
+        'lag_p99': percentile(lags, 0.99),
+        'lag_max': max(lags, default=None),
+        'samples': len(lags),
+        **counts,
+    }
+
+
+async def benchmark(args) -> dict:
+    report = {'config': vars(args)}
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory(prefix='jsync-loop-lag-') as directory:
+            report[mode] = await measure(mode, Path(directory) / 'benchmark.db', args)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-loop-lag",
+                                     description="Measures the event loop's lag under store load, with store operations"
+                                                 " offloaded to their threads and run inline, reporting JSON")
+    parser.add_argument("-t", "--duration", type=float, default=10, help="Seconds to measure each mode for")
+    parser.add_argument("--modes", nargs='+', choices=('offloaded', 'inline'), default=['offloaded', 'inline'])
+    parser.add_argument("--uploaders", type=int, default=2, help="Concurrent uploading tasks")
+    parser.add_argument("--batch-symbols", type=int, default=5000, help="Symbols in each upload")
+    parser.add_argument("--upload-interval", type=float, default=0.1, help="Seconds between uploads of a task")
+    parser.add_argument("--syncers", type=int, default=2, help="Concurrent full syncing tasks")
+    parser.add_argument("--page-symbols", type=int, default=5000, help="Symbols in each full sync page")
+    parser.add_argument("--sync-interval", type=float, default=0.5, help="Seconds between full syncs of a task")
+    parser.add_argument("--probe-interval", type=float, default=0.005, help="Seconds between lag samples")
+
+    sys.stdout.write(json.dumps(asyncio.run(benchmark(parser.parse_args())), indent=2) + '\n')
@@ -0,0 +1,272 @@
+import asyncio
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from common.codecs import CODECS, JSON_CODEC
+from common.commands import (Command, Subscribe, Unsubscribe, UpstreamSymbols, DownstreamSymbols, FullSyncRequest,
+                             FullSyncComplete, Handshake, HandshakeResponse, ResyncRequired)
+from common.consts import PROTOCOL_VERSION
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.utils import recv_packet, send_packet
+
+
+# Simulated client kinds
+CLIENT_INTERACTIVE = 'interactive'  # Subscribes to a project and renames a symbol every now and then
+CLIENT_BULK = 'bulk'  # Subscribes to a project and uploads large batches of symbols (e.g. an initial analysis)
+CLIENT_JOIN = 'join'  # Repeatedly connects, subscribes to a project and fully syncs it, then leaves
+CLIENT_CHURN = 'churn'  # Stays connected, repeatedly subscribing to and unsubscribing from projects
+CLIENT_KINDS = (CLIENT_INTERACTIVE, CLIENT_BULK, CLIENT_JOIN, CLIENT_CHURN)
+
+
+@dataclass
+class LoadConfig:
+    port: int
+    clients: int = 200
+    # Relative weights of the simulated client kinds
+    mix: Dict[str, float] = field(default_factory=lambda: {CLIENT_INTERACTIVE: 0.8, CLIENT_BULK: 0.05,
+                                                           CLIENT_JOIN: 0.1, CLIENT_CHURN: 0.05})
+    projects: int = 10
+    # Symbols uploaded to each project before measuring
+    seed_symbols: int = 20000
+    # Mean seconds between renames of an interactive client
+    rename_interval: float = 1.0
+    bulk_symbols: int = 5000
+    bulk_interval: float = 5.0
+    join_interval: float = 5.0
+    churn_interval: float = 1.0
+    codec: str = 'binary'
+    compression: Optional[str] = None
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+@dataclass
+class LoadStats:
+    renames_sent: int = 0
+    symbols_uploaded: int = 0
+    symbols_delivered: int = 0
+    full_syncs: int = 0
+    full_sync_symbols: int = 0
+    resyncs: int = 0
+    subscriptions: int = 0
+    errors: int = 0
+    # Send time of each rename in flight, by its (unique) name
+    renames: Dict[str, float] = field(default_factory=dict, repr=False)
+    fan_out_latencies: List[float] = field(default_factory=list, repr=False)
+    full_sync_durations: List[float] = field(default_factory=list, repr=False)
+
+    def delivered(self, symbols, received: float):
+        self.symbols_delivered += len(symbols)
+        for symbol in symbols:
+            sent = self.renames.get(symbol.name)
+            if sent is not None:
+                self.fan_out_latencies.append(received - sent)
+
+    def report(self, duration: float) -> dict:
+        return {
+            'renames_sent': self.renames_sent,
+            'renames_per_second': self.renames_sent / duration,
+            'symbols_uploaded': self.symbols_uploaded,
+            'symbols_uploaded_per_second': self.symbols_uploaded / duration,
+            'symbols_delivered': self.symbols_delivered,
+            'symbols_delivered_per_second': self.symbols_delivered / duration,
+            'fan_out_deliveries': len(self.fan_out_latencies),
+            'fan_out_latency_p50': percentile(self.fan_out_latencies, 0.5),
+            'fan_out_latency_p99': percentile(self.fan_out_latencies, 0.99),
+            'fan_out_latency_max': max(self.fan_out_latencies, default=None),
+            'full_syncs': self.full_syncs,
+            'full_sync_symbols': self.full_sync_symbols,
+            'full_sync_duration_p50': percentile(self.full_sync_durations, 0.5),
+            'full_sync_duration_p99': percentile(self.full_sync_durations, 0.99),
+            'subscriptions': self.subscriptions,
+            'resyncs': self.resyncs,
+            'errors': self.errors,
+        }
+
+
+def project_name(index: int) -> str:
+    return f'bench-{index}'
+
+
+def signature(project: int, index: int) -> str:
+    return f'Lcom/bench/P{project}/C{index // 16};->m{index % 16}()V'
+
+
+class SimulatedClient:
+    # A client speaking the real protocol, whose responses are read by a background task
+    _ids = itertools.count()
+
+    def __init__(self, kind: str, config: LoadConfig, stats: LoadStats, rng: random.Random):
+        self.kind = kind
+        self.name = f'{kind}-{next(self._ids)}'
+        self._config = config
+        self._stats = stats
+        self._rng = rng
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._codec = JSON_CODEC
+        self._compression = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._full_sync: Optional[asyncio.Future] = None
+        self._full_sync_symbols = 0
+        self._renames = itertools.count()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection('127.0.0.1', self._config.port)
+        await send_packet(self._writer, self.name.encode('utf-8'))
+        compressions = [self._config.compression] if self._config.compression else None
+        await send_packet(self._writer, JSON_CODEC.encode(Handshake(PROTOCOL_VERSION, [self._config.codec],
+                                                                     compressions)))
+        response = JSON_CODEC.decode(await recv_packet(self._reader))
+        if not isinstance(response, HandshakeResponse):
+            raise TypeError(f"Unexpected handshake response {type(response).__name__}")
+        self._codec = CODECS[response.codec]
+        self._compression = response.compression
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def send(self, command: Command):
+        await send_packet(self._writer, self._codec.encode(command), self._compression)
+
+    async def _receive(self):
+        while True:
+            try:
+                command = self._codec.decode(await recv_packet(self._reader))
+            except (ConnectionResetError, asyncio.IncompleteReadError):
+                if self._full_sync is not None and not self._full_sync.done():
+                    self._full_sync.set_exception(ConnectionResetError())
+                return
+
+            received = time.perf_counter()
+            if isinstance(command, DownstreamSymbols):
+                if self._full_sync is not None:
+                    self._full_sync_symbols += len(command.symbols)
+                else:
+                    self._stats.delivered(command.symbols, received)
+            elif isinstance(command, FullSyncComplete):
+                if self._full_sync is not None and not self._full_sync.done():
+                    self._full_sync.set_result(None)
+            elif isinstance(command, ResyncRequired):
+                self._stats.resyncs += 1
+
+    async def subscribe(self, project: str):
+        await self.send(Subscribe(project))
+        self._stats.subscriptions += 1
+
+    async def upload(self, project: int, symbols: List[Symbol]):
+        await self.send(UpstreamSymbols(project_name(project), symbols, False))
+        self._stats.symbols_uploaded += len(symbols)
+
+    async def full_sync(self, project: str) -> int:
+        self._full_sync = asyncio.get_running_loop().create_future()
+        self._full_sync_symbols = 0
+        start = time.perf_counter()
+        await self.send(FullSyncRequest(project, 0, 0))
+        await self._full_sync
+        self._full_sync = None
+        self._stats.full_sync_durations.append(time.perf_counter() - start)
+        self._stats.full_syncs += 1
+        self._stats.full_sync_symbols += self._full_sync_symbols
+        return self._full_sync_symbols
+
+    async def run_interactive(self, project: int):
+        await self.connect()
+        await self.subscribe(project_name(project))
+        while True:
+            await asyncio.sleep(self._rng.expovariate(1 / self._config.rename_interval))
+            name = f'{self.name}_{next(self._renames)}'
+            index = self._rng.randrange(self._config.seed_symbols or 1)
+            self._stats.renames[name] = time.perf_counter()
+            await self.upload(project, [Symbol(SYMBOL_TYPE_METHOD, signature(project, index), name)])
+            self._stats.renames_sent += 1
+
+    async def run_bulk(self, project: int):
+        await self.connect()
+        await self.subscribe(project_name(project))
+        uploads = itertools.count()
+        while True:
+            await asyncio.sleep(self._rng.uniform(0, 2 * self._config.bulk_interval))
+            upload = next(uploads)
+            await self.upload(project, [Symbol(SYMBOL_TYPE_METHOD, signature(project, index), f'{self.name}_{upload}')
+                                        for index in range(self._config.bulk_symbols)])
+
+    async def run_join(self, project: int):
+        while True:
+            await asyncio.sleep(self._rng.uniform(0, 2 * self._config.join_interval))
+            await self.connect()
+            try:
+                await self.subscribe(project_name(project))
+                await self.full_sync(project_name(project))
+            finally:
+                self.close()
+
+    async def run_churn(self, project: int):
+        await self.connect()
+        while True:
+            await self.subscribe(project_name(project))
+            await asyncio.sleep(self._rng.uniform(0, 2 * self._config.churn_interval))
+            await self.send(Unsubscribe(project_name(project)))
+            project = self._rng.randrange(self._config.projects)
+
+    async def run(self, project: int):
+        try:
+            await getattr(self, f'run_{self.kind}')(project)
+        except (ConnectionResetError, asyncio.IncompleteReadError, OSError):
+            self._stats.errors += 1
+        finally:
+            self.close()
+
+
+async def seed(config: LoadConfig, stats: LoadStats):
+    # Every project starts with `seed_symbols` symbols, which joining clients sync
+    client = SimulatedClient('seed', config, stats, random.Random(0))
+    await client.connect()
+    batch = 5000
+    try:
+        for project in range(config.projects):
+            for start in range(0, config.seed_symbols, batch):
+                await client.upload(project, [Symbol(SYMBOL_TYPE_METHOD, signature(project, index), f'seed_{index}')
+                                              for index in range(start, min(start + batch, config.seed_symbols))])
+            # Uploads are committed in order, so a full sync completes only after all of them
+            await client.full_sync(project_name(project))
+    finally:
+        client.close()
+
+
+def assign_kinds(config: LoadConfig, rng: random.Random) -> List[str]:
+    total = sum(config.mix.values())
+    kinds = []
+    for kind, weight in config.mix.items():
+        kinds.extend([kind] * round(config.clients * weight / total))
+    while len(kinds) < config.clients:
+        kinds.append(rng.choices(list(config.mix), list(config.mix.values()))[0])
+    return kinds[:config.clients]
+
+
+async def generate_load(config: LoadConfig, duration: float, seed_value: int = 0) -> LoadStats:
+    # Runs the clients for `duration` seconds, spreading each kind over the projects round-robin
+    rng = random.Random(seed_value)
+    stats = LoadStats()
+    clients = [SimulatedClient(kind, config, stats, random.Random(rng.random()))
+               for kind in assign_kinds(config, rng)]
+    tasks = [asyncio.ensure_future(client.run(i % config.projects)) for i, client in enumerate(clients)]
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+
+def run(workers: int, args, load_args: List[str]) -> dict:
+    # A run of the load benchmark against a server with `workers` worker processes (0 serves all in one process)
+    with tempfile.TemporaryDirectory(prefix='jsync-scaling-') as directory:
+        output = Path(directory) / 'report.json'
+        subprocess.run([sys.executable, '-m', 'benchmark', '--clients', str(args.clients), '--projects',
+                        str(args.projects), '--duration', str(args.duration), '-o', str(output)] + load_args +
+                       ['--', '--workers', str(workers)], check=True)
+        return json.loads(output.read_text())
+
+
+def summary(report: dict) -> dict:
+    results = report['results']
+    return {
+        'renames_per_second': results['renames_per_second'],
+        'symbols_uploaded_per_second': results['symbols_uploaded_per_second'],
+        'symbols_delivered_per_second': results['symbols_delivered_per_second'],
+        'fan_out_latency_p99': results['fan_out_latency_p99'],
+        'errors': results['errors'],
+        'server_cpu_utilization': report['server']['cpu_utilization'],
+        'server_peak_rss_bytes': report['server']['peak_rss_bytes'],
+    }
+
+
+def benchmark(args, load_args: List[str]) -> dict:
+    report = {'config': {**vars(args), 'load_args': load_args, 'cpus': os.cpu_count()}, 'runs': {}}
+    baseline = None
+    for workers in args.workers:
+        result = summary(run(workers, args, load_args))
+        if baseline is None:
+            baseline = result['symbols_delivered_per_second'] or 1
+        result['delivered_speedup'] = result['symbols_delivered_per_second'] / baseline
+        report['runs'][str(workers)] = result
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-scaling",
+                                     description="Runs the load benchmark against servers with increasing amounts of"
+                                                 " worker processes, reporting throughput (and its speedup over the"
+                                                 " first run) as JSON")
+    parser.add_argument("--workers", type=int, nargs='+', default=[0, 1, 2, 4],
+                        help="Amounts of worker processes to run the server with, 0 serves all projects in one process")
+    parser.add_argument("-c", "--clients", type=int, default=400, help="Amount of simulated clients")
+    parser.add_argument("--projects", type=int, default=16,
+                        help="Amount of projects, spread over the workers")
+    parser.add_argument("-t", "--duration", type=float, default=30, help="Seconds to measure each run for")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="File to write the JSON report to")
+    parser.add_argument("load_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed on to the load benchmark (after --), e.g. -- --bulk-symbols 1000")
+
+    args = parser.parse_args()
+    load_args = args.load_args[1:] if args.load_args[:1] == ['--'] else args.load_args
+    del args.load_args
+    if max(args.workers) >= (os.cpu_count() or 1):
+        sys.stderr.write(f"Only {os.cpu_count()} CPUs (shared with the simulated clients), workers beyond them"
+                         f" don't run in parallel\n")
+    report = json.dumps(benchmark(args, load_args), indent=2)
+    if args.output is not None:
+        args.output.write_text(report + '\n')
+    else:
+        sys.stdout.write(report + '\n')
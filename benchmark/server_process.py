@@ -0,0 +1,108 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+REPOSITORY = Path(__file__).absolute().parent.parent
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def _stat_fields(pid: int) -> List[str]:
+    with open(f'/proc/{pid}/stat') as f:
+        # Fields following the (parenthesized, possibly spaced) command name, starting from the 3rd one
+        return f.read().rsplit(')', 1)[1].split()
+
+
+def _process_tree(pid: int) -> List[int]:
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                parents[int(entry)] = int(_stat_fields(int(entry))[1])
+            except OSError:
+                pass
+
+    pids = [pid]
+    for process in pids:
+        pids.extend(child for child, parent in parents.items() if parent == process)
+    return pids
+
+
+def _cpu_seconds(pid: int) -> float:
+    try:
+        fields = _stat_fields(pid)
+    except OSError:
+        return 0
+    # utime & stime are the 14th & 15th fields
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class ServerProcess:
+    # Runs the server (`python -m server`) in its own process, measuring the CPU time & RSS of it and the processes
+    # it started (i.e. workers) through /proc
+    def __init__(self, store_directory: Path, resources: Path, port: int, arguments: List[str],
+                 log: Optional[Path] = None):
+        self._command = [sys.executable, '-m', 'server', '-d', str(store_directory), '-r', str(resources),
+                         '-p', str(port)] + arguments
+        self._port = port
+        self._log = log
+        self._process: Optional[subprocess.Popen] = None
+        self.peak_rss_bytes = 0
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    async def start(self, timeout: float = 30):
+        output = open(self._log, 'wb') if self._log is not None else subprocess.DEVNULL
+        self._process = subprocess.Popen(self._command, cwd=REPOSITORY, stdout=output, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self._process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', self._port)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+            else:
+                writer.close()
+                return
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(_cpu_seconds(pid) for pid in _process_tree(self.pid))
+
+    @property
+    def rss_bytes(self) -> int:
+        return sum(_rss_bytes(pid) for pid in _process_tree(self.pid))
+
+    async def sample(self, interval: float):
+        while True:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, self.rss_bytes)
+            await asyncio.sleep(interval)
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
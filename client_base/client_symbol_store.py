@@ -1,19 +1,42 @@
+import sys
 from abc import ABCMeta
 
 from common.symbol_store import SymbolStoreABC
 from common.symbol import Symbol
+from common.symbol_batch import signature_symbol_type
+from common.sql_queries import CREATE_METADATA_TABLE_QUERY
 from .sql_queries import (CLIENT_CREATE_SYMBOLS_TABLE_QUERY, CREATE_RENAME_RECORDS_TABLE_QUERY, PUSH_RENAME_QUERY,
                           DELETE_RENAME_QUERY, GET_RENAME_BY_CANONICAL_SIGNATURE_QUERY, GET_RENAMES_QUERY,
-                          CLIENT_DELETE_SYMBOLS_QUERY, CREATE_METADATA_TABLE_QUERY, WRITE_METADATA_PROPERTY_QUERY,
-                          READ_METADATA_PROPERTY_QUERY)
+                          GET_CANDIDATE_RENAMES_QUERY, CLIENT_DELETE_SYMBOLS_QUERY, CLIENT_SCHEMA_MIGRATIONS)
+
+# Rough per-entry overhead (of the dictionary slot and the two strings' headers) and per-character size of cached
+# rename records, for estimating the cache's memory use. The plugins run on Jython, whose strings wrap a Java string
+# and its array, in a ConcurrentHashMap's node - estimated conservatively, for a 64-bit JVM without compressed pointers
+# and with 2-byte characters. On CPython (as measured) these are ~130 bytes per entry and 1 byte per character.
+if sys.platform.startswith('java'):
+    RENAME_CACHE_ENTRY_BYTES = 256
+    RENAME_CACHE_CHAR_BYTES = 2
+else:
+    RENAME_CACHE_ENTRY_BYTES = 130
+    RENAME_CACHE_CHAR_BYTES = 1
 
 
 class ClientSymbolStoreABC(SymbolStoreABC):
     __metaclass__ = ABCMeta
 
+    # Rename records are cached (in full) unless they'd take more than this many (estimated) bytes, in which case
+    # they're read from the database as needed
+    MAX_RENAME_CACHE_BYTES = 256 << 20
+
     def __init__(self, path):
         # type: (str) -> None
         SymbolStoreABC.__init__(self, path)
+        # The store is the only writer of its `rename_records`, so the cache is written through and never goes stale.
+        # Names are kept by signature, along with the symbol types differing from the type the signature implies.
+        self._renames = None  # type: dict[str, str] | None
+        self._rename_types = {}  # type: dict[str, int]
+        self._cached_chars = 0
+        self._load_renames()
 
     def initialize_database(self):
         # type: () -> None
@@ -21,15 +44,86 @@ class ClientSymbolStoreABC(SymbolStoreABC):
         self._conn.execute(CREATE_RENAME_RECORDS_TABLE_QUERY)
         self._conn.execute(CREATE_METADATA_TABLE_QUERY)
 
+        # Client symbols are already unique per (author, canonical_signature), so no materialization is needed
+        self.migrate(CLIENT_SCHEMA_MIGRATIONS)
+
+    def _load_renames(self):
+        # type: () -> None
+        renames = {}
+        rename_types = {}
+        chars = 0
+        for canonical_signature, symbol_type, name in self._conn.execute_query(GET_RENAMES_QUERY):
+            renames[canonical_signature] = name
+            chars += len(canonical_signature) + len(name)
+            if self.rename_cache_bytes(len(renames), chars) > self.MAX_RENAME_CACHE_BYTES:
+                print("[JSync] Rename records of %s would take more than %.1f MB, not caching them"
+                      % (self._path, self.MAX_RENAME_CACHE_BYTES / float(1 << 20)))
+                return
+            if symbol_type != signature_symbol_type(canonical_signature):
+                rename_types[canonical_signature] = symbol_type
+
+        self._renames = renames
+        self._rename_types = rename_types
+        self._cached_chars = chars
+
+    def _cache_rename(self, renames, canonical_signature, symbol_type, name):
+        # type: (dict[str, str], str, int, str) -> None
+        previous = renames.get(canonical_signature)
+        if previous is None:
+            self._cached_chars += len(canonical_signature) + len(name)
+        else:
+            self._cached_chars += len(name) - len(previous)
+        renames[canonical_signature] = name
+
+        if symbol_type != signature_symbol_type(canonical_signature):
+            self._rename_types[canonical_signature] = symbol_type
+        else:
+            self._rename_types.pop(canonical_signature, None)
+
+    def _uncache_rename(self, canonical_signature):
+        # type: (str) -> None
+        name = self._renames.pop(canonical_signature, None)
+        if name is not None:
+            self._cached_chars -= len(canonical_signature) + len(name)
+        self._rename_types.pop(canonical_signature, None)
+
+    def _cached_rename(self, canonical_signature, name):
+        # type: (str, str) -> Symbol
+        symbol_type = self._rename_types.get(canonical_signature)
+        if symbol_type is None:
+            symbol_type = signature_symbol_type(canonical_signature)
+        return Symbol(symbol_type, canonical_signature, name)
+
+    @staticmethod
+    def rename_cache_bytes(entries, chars):
+        # type: (int, int) -> int
+        return entries * RENAME_CACHE_ENTRY_BYTES + chars * RENAME_CACHE_CHAR_BYTES
+
+    @property
+    def rename_cache_size(self):
+        # type: () -> tuple[int, int]
+        # Amount of cached rename records, and (an estimate of) the memory they take in bytes
+        if self._renames is None:
+            return 0, 0
+        return len(self._renames), self.rename_cache_bytes(len(self._renames), self._cached_chars)
+
     @property
     def latest_known_renames(self):
         # type: () -> dict[str, Symbol]
+        if self._renames is not None:
+            return {canonical_signature: self._cached_rename(canonical_signature, name)
+                    for canonical_signature, name in list(self._renames.items())}
+
         results = self._conn.execute_query(GET_RENAMES_QUERY)
         return {canonical_signature: Symbol(symbol_type, canonical_signature, name)
                 for canonical_signature, symbol_type, name in results}
 
     def get_latest_known_rename(self, canonical_signature):
         # type: (str) -> Symbol | None
+        if self._renames is not None:
+            name = self._renames.get(canonical_signature)
+            return None if name is None else self._cached_rename(canonical_signature, name)
+
         results = list(self._conn.execute_query(GET_RENAME_BY_CANONICAL_SIGNATURE_QUERY, canonical_signature))
         if len(results) == 0:
             return None
@@ -37,30 +131,53 @@ class ClientSymbolStoreABC(SymbolStoreABC):
             name, symbol_type = results[0]
             return Symbol(symbol_type, canonical_signature, name)
 
+    def get_latest_known_renames_of(self, canonical_signatures):
+        # type: (iter[str]) -> dict[str, Symbol]
+        if self._renames is not None:
+            renames = {}
+            for canonical_signature in canonical_signatures:
+                name = self._renames.get(canonical_signature)
+                if name is not None:
+                    renames[canonical_signature] = self._cached_rename(canonical_signature, name)
+            return renames
+
+        results = self.query_candidate_signatures(GET_CANDIDATE_RENAMES_QUERY, canonical_signatures)
+        return {canonical_signature: Symbol(symbol_type, canonical_signature, name)
+                for canonical_signature, symbol_type, name in results}
+
     def record_latest_known_renames(self, symbols):
         # type: (list[Symbol]) -> None
         deleted_symbols = [symbol for symbol in symbols if symbol.name is None]
         changed_symbols = [symbol for symbol in symbols if symbol.name is not None]
 
-        if len(deleted_symbols) > 0:
-            self._conn.executemany(DELETE_RENAME_QUERY, [(symbol.canonical_signature, ) for symbol in deleted_symbols])
-        if len(changed_symbols) > 0:
-            self._conn.executemany(PUSH_RENAME_QUERY, [(symbol.canonical_signature, symbol.symbol_type, symbol.name)
-                                                       for symbol in changed_symbols])
+        with self._conn.transaction():
+            if len(deleted_symbols) > 0:
+                self._conn.executemany(DELETE_RENAME_QUERY,
+                                       [(symbol.canonical_signature, ) for symbol in deleted_symbols])
+            if len(changed_symbols) > 0:
+                self._conn.executemany(PUSH_RENAME_QUERY,
+                                       [(symbol.canonical_signature, symbol.symbol_type, symbol.name)
+                                        for symbol in changed_symbols])
+
+        # Applied in order, as the database applied the statements
+        if self._renames is not None:
+            for symbol in deleted_symbols:
+                self._uncache_rename(symbol.canonical_signature)
+            for symbol in changed_symbols:
+                self._cache_rename(self._renames, symbol.canonical_signature, symbol.symbol_type, symbol.name)
+            if self.rename_cache_bytes(len(self._renames), self._cached_chars) > self.MAX_RENAME_CACHE_BYTES:
+                print("[JSync] Rename records of %s take more than %.1f MB, no longer caching them"
+                      % (self._path, self.MAX_RENAME_CACHE_BYTES / float(1 << 20)))
+                self._renames = None
+                self._rename_types.clear()
+                self._cached_chars = 0
 
     def delete_symbols(self, symbols):
         batch = [(symbol.author, symbol.canonical_signature) for symbol in symbols]
 
-        return self._conn.executemany(CLIENT_DELETE_SYMBOLS_QUERY, batch)
-
-    def set_metadata_property(self, prop, value):
-        # type: (str, str) -> None
-        self._conn.execute(WRITE_METADATA_PROPERTY_QUERY, prop, value)
+        return self.delete_keys(batch)
 
-    def get_metadata_property(self, prop):
-        # type: (str) -> str | None
-        results = list(self._conn.execute_query(READ_METADATA_PROPERTY_QUERY, prop))
-        if len(results) == 0:
-            return None
-        else:
-            return results[0][0]
+    def delete_keys(self, keys):
+        # type: (list[tuple[str, str]]) -> None
+        # Deletes the symbols of (author, canonical_signature) keys
+        return self._conn.executemany(CLIENT_DELETE_SYMBOLS_QUERY, keys)
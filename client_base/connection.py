@@ -1,5 +1,8 @@
 from abc import ABCMeta, abstractmethod
 
+from common.codecs import JSON_CODEC
+from common.commands import Command
+
 
 class ConnectionABC(object):
     __metaclass__ = ABCMeta
@@ -8,6 +11,9 @@ class ConnectionABC(object):
         # type: (str, int) -> None
         self.host = host
         self.port = port
+        # Negotiated with the server during the handshake
+        self.codec = JSON_CODEC
+        self.server_version = 0
 
     @abstractmethod
     def send_packet(self, data):
@@ -19,6 +25,14 @@ class ConnectionABC(object):
         # type: () -> bytes
         raise NotImplementedError
 
+    def send_command(self, command):
+        # type: (Command) -> None
+        self.send_packet(self.codec.encode(command))
+
+    def recv_command(self):
+        # type: () -> Command
+        return self.codec.decode(self.recv_packet())
+
     @abstractmethod
     def close(self):
         # type: () -> None
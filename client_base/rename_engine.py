@@ -4,6 +4,7 @@ from threading import Lock
 
 from client_base.config import JSYNC_ROOT
 from common.symbol import Symbol
+from common.symbol_batch import SymbolBatch
 from common.lazy_dict import LazyDict
 from client_base.client_symbol_store import ClientSymbolStoreABC
 
@@ -27,13 +28,17 @@ def get_symbol_evaluator():
 
 class RenameEngineABC(object):
     __metaclass__ = ABCMeta
+    # Dirty symbols are flushed in batches of this many
+    FLUSH_BATCH_SYMBOLS = 5000
 
     def __init__(self, self_author):
         # type: (str) -> None
         self._self_author = self_author
         self._symbol_stores = LazyDict(lambda project:
                                        self.get_client_symbol_store(project))  # type: dict[str, ClientSymbolStoreABC]
+        # Symbols are recorded & flushed by the decompiler's, the update listener's and the rename outbox's threads
         self._dirty_symbols = {}  # type: dict[str, set[Symbol]]
+        self._dirty_lock = Lock()
         self._records_lock = Lock()
 
         self._symbol_evaluator = get_symbol_evaluator()  # type: evaluate_symbol
@@ -83,25 +88,36 @@ class RenameEngineABC(object):
             self._symbol_stores[project].record_latest_known_renames(symbols)
 
     def record_symbols(self, project, symbols, dirty=True):
-        # type: (str, list[Symbol], bool) -> None
-        symbols = symbols if isinstance(symbols, list) else list(symbols)
-
-        deleted_symbols = []
-        changed_symbols = []
-        for symbol in symbols:
-            original_name = self.get_original_name(project, symbol)
-            if symbol.name == original_name or symbol.name is None:
-                deleted_symbols.append(symbol)
+        # type: (str, list[Symbol] | SymbolBatch, bool) -> None
+        # Batches (e.g. of downstream symbols) are recorded by their rows, without building their symbols
+        if isinstance(symbols, SymbolBatch):
+            rows = symbols.rows
+        else:
+            rows = [(symbol.author, symbol.symbol_type, symbol.canonical_signature, symbol.name, symbol.timestamp)
+                    for symbol in symbols]
+
+        deleted_keys = []
+        changed_rows = []
+        stripped_symbols = []
+        for row in rows:
+            author, symbol_type, canonical_signature, name, _ = row
+            stripped = Symbol(symbol_type, canonical_signature, None)
+            stripped_symbols.append(stripped)
+            if name is None or name == self.get_original_name(project, stripped):
+                deleted_keys.append((author, canonical_signature))
             else:
-                changed_symbols.append(symbol)
+                changed_rows.append(row)
 
-        if changed_symbols:
-            self._symbol_stores[project].push_symbols(changed_symbols)
-        if deleted_symbols:
-            self._symbol_stores[project].delete_symbols(deleted_symbols)
+        symbol_store = self._symbol_stores[project]
+        with symbol_store.transaction():
+            if changed_rows:
+                symbol_store.push_rows(changed_rows)
+            if deleted_keys:
+                symbol_store.delete_keys(deleted_keys)
 
         if dirty:
-            self._dirty_symbols.setdefault(project, set()).update(symbol.stripped for symbol in symbols)
+            with self._dirty_lock:
+                self._dirty_symbols.setdefault(project, set()).update(stripped_symbols)
 
     def evaluate_symbol(self, project, symbol):
         # type: (str, Symbol) -> Symbol
@@ -124,12 +140,69 @@ class RenameEngineABC(object):
         if not self._enqueue_rename(project, symbol):
             self.record_latest_known_renames(project, [symbol.named(old_name)])
 
-        self._dirty_symbols.setdefault(project, set()).remove(symbol.stripped)
+        with self._dirty_lock:
+            self._dirty_symbols.setdefault(project, set()).discard(symbol.stripped)
+
+    def flush_symbols(self, project, symbols):
+        # type: (str, list[Symbol]) -> None
+        # Like `flush_symbol` for each of the symbols, with their symbols & latest known renames read by a query each,
+        # and the renames recorded & enqueued in bulk. The symbols are taken out of the dirty ones before they're
+        # evaluated, so those recorded meanwhile stay dirty
+        with self._dirty_lock:
+            dirty_symbols = self._dirty_symbols.setdefault(project, set())
+            for symbol in symbols:
+                dirty_symbols.discard(symbol.stripped)
+
+        symbol_store = self._symbol_stores[project]
+        canonical_signatures = [symbol.canonical_signature for symbol in symbols]
+        candidates = symbol_store.get_symbols_of(canonical_signatures)
+        old_renames = symbol_store.get_latest_known_renames_of(canonical_signatures)
+
+        evaluated = []
+        for symbol in symbols:
+            symbol = symbol.stripped
+            candidate_symbols = candidates.get(symbol.canonical_signature)
+            if not candidate_symbols:
+                _symbol = symbol.named(self.get_original_name(project, symbol))
+            else:
+                _symbol = self._symbol_evaluator(candidate_symbols, self.self_author)
+            if symbol.canonical_signature != _symbol.canonical_signature:
+                raise EnvironmentError("Symbol Evaluator is inconsistent - changes canonical signature!")
+            evaluated.append(_symbol)
+
+        self.record_latest_known_renames(project, evaluated)
+        enqueued = self._enqueue_renames(project, evaluated)
+        reverted = []
+        for symbol, is_enqueued in zip(evaluated, enqueued):
+            if not is_enqueued:
+                old_rename = old_renames.get(symbol.canonical_signature)
+                reverted.append(symbol.named(None if old_rename is None else old_rename.name))
+        if reverted:
+            self.record_latest_known_renames(project, reverted)
 
     def flush_all_symbols(self):
-        for project, dirty_symbols in self._dirty_symbols.items():
-            for dirty_symbol in list(dirty_symbols):
-                self.flush_symbol(project, dirty_symbol)
+        # Each project's dirty symbols are taken at once, so that concurrent flushes don't flush the same symbols
+        with self._dirty_lock:
+            taken = [(project, list(dirty_symbols)) for project, dirty_symbols in self._dirty_symbols.items()]
+            for dirty_symbols in self._dirty_symbols.values():
+                dirty_symbols.clear()
+
+        for index, (project, dirty_symbols) in enumerate(taken):
+            for i in range(0, len(dirty_symbols), self.FLUSH_BATCH_SYMBOLS):
+                try:
+                    self.flush_symbols(project, dirty_symbols[i:i + self.FLUSH_BATCH_SYMBOLS])
+                except BaseException:
+                    # Whatever wasn't flushed stays dirty
+                    with self._dirty_lock:
+                        self._dirty_symbols[project].update(dirty_symbols[i:])
+                        for other_project, other_symbols in taken[index + 1:]:
+                            self._dirty_symbols[other_project].update(other_symbols)
+                    raise
+
+    def _enqueue_renames(self, project, symbols):
+        # type: (str, list[Symbol]) -> list[bool]
+        # Whether each of the renames was enqueued
+        return [self._enqueue_rename(project, symbol) for symbol in symbols]
 
     @abstractmethod
     def _enqueue_rename(self, project, symbol):
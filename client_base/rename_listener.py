@@ -1,10 +1,10 @@
-import time
 from abc import ABCMeta, abstractmethod
 
 from common.symbol import Symbol
 from common.commands import UpstreamSymbols
 from .connection import ConnectionABC
 from .rename_engine import RenameEngineABC
+from .rename_outbox import RenameOutbox
 
 
 class RenameListenerABC(object):
@@ -14,21 +14,33 @@ class RenameListenerABC(object):
         # type: (ConnectionABC, RenameEngineABC) -> None
         self._connection = connection
         self._rename_engine = rename_engine
+        # Renames are flushed & sent by a background thread, so the decompiler's event thread isn't held up
+        self._outbox = RenameOutbox(self._send_renames)
 
     def on_rename(self, project, symbol):
         # type: (str, Symbol) -> None
+        # Renames applied by JSync itself are known, and not sent back
         if self._rename_engine.is_symbol_rename_known(project, symbol, True):
             return
 
+        # Recorded right away, so that the rename is known (e.g. once applied again by a flush) before it's sent
         symbol = symbol.timestamped.authored(self._rename_engine.self_author)
-
         self._rename_engine.record_latest_known_renames(project, [symbol])
         self._rename_engine.record_symbols(project, [symbol])
+        self._outbox.offer(project, symbol)
+
+    def _send_renames(self, project, symbols):
+        # type: (str, list[Symbol]) -> None
         self._rename_engine.flush_all_symbols()
 
-        command = UpstreamSymbols(project, [symbol], loggable=True)
-        self._connection.send_packet(command.encode())
+        command = UpstreamSymbols(project, symbols, loggable=True)
+        self._connection.send_command(command)
 
     @abstractmethod
     def start(self):
         raise NotImplementedError
+
+    def close(self):
+        # type: () -> None
+        # Sends the renames still pending
+        self._outbox.close()
@@ -0,0 +1,118 @@
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from threading import Condition, Thread
+
+from common.symbol import Symbol
+from .connection import ConnectionError
+
+
+class RenameOutbox(object):
+    # Renames made in the decompiler, queued by its event thread and handed in batches to `handle` (project, symbols)
+    # by a background sender thread. Renames arriving within `window` seconds of the first one pending are batched
+    # (up to `max_symbols`), and later renames of a signature replace pending ones. Batches failing to be handled are
+    # retried `retry_delay` seconds later, up to `max_attempts` times in all.
+    def __init__(self, handle, window=0.05, max_symbols=1000, retry_delay=1, max_attempts=3):
+        # type: (callable, float, int, float, int) -> None
+        self._handle = handle
+        self._window = window
+        self._max_symbols = max_symbols
+        self._retry_delay = retry_delay
+        self._max_attempts = max_attempts
+
+        self._condition = Condition()
+        self._pending = OrderedDict()  # type: OrderedDict[str, OrderedDict[str, Symbol]]
+        self._pending_count = 0
+        self._since = None  # type: float
+        self._closed = False
+        self._thread = None  # type: Thread
+
+    def offer(self, project, symbol):
+        # type: (str, Symbol) -> None
+        with self._condition:
+            if self._closed:
+                return
+
+            renames = self._pending.setdefault(project, OrderedDict())
+            if symbol.canonical_signature in renames:
+                # Moving the rename to the end keeps renames in the order they were last made
+                del renames[symbol.canonical_signature]
+            else:
+                self._pending_count += 1
+            renames[symbol.canonical_signature] = symbol
+
+            if self._since is None:
+                self._since = time.time()
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='jsync-rename-outbox')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self, timeout=5):
+        # type: (float) -> None
+        # Sends whatever's pending, then stops the sender thread
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+
+    def _take(self):
+        # type: () -> OrderedDict[str, OrderedDict[str, Symbol]] | None
+        with self._condition:
+            while True:
+                if self._pending:
+                    if self._closed or self._pending_count >= self._max_symbols:
+                        break
+                    remaining = self._since + self._window - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+            pending = self._pending
+            self._pending = OrderedDict()
+            self._pending_count = 0
+            self._since = None
+            return pending
+
+    def _run(self):
+        # type: () -> None
+        while True:
+            pending = self._take()
+            if pending is None:
+                return
+
+            for project, renames in pending.items():
+                symbols = list(renames.values())
+                for i in range(0, len(symbols), self._max_symbols):
+                    if not self._send(project, symbols[i:i + self._max_symbols]):
+                        # The connection is gone (and was closed by whoever noticed), nothing left to send to
+                        with self._condition:
+                            self._closed = True
+                            self._pending.clear()
+                        return
+
+    def _send(self, project, symbols):
+        # type: (str, list[Symbol]) -> bool
+        # Whether the connection is still there
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                self._handle(project, symbols)
+                return True
+            except ConnectionError:
+                return False
+            except Exception:  # noqa
+                traceback.print_exc(file=sys.stdout)
+                if attempt < self._max_attempts:
+                    time.sleep(self._retry_delay)
+
+        print("[JSync] Failed sending %d renames of %s, dropping them" % (len(symbols), project))
+        return True
@@ -0,0 +1,150 @@
+import glob
+import hashlib
+import os
+import time
+
+from common.commands import ResourceChunkRequest, ResourceChunk
+from .connection import ConnectionABC
+
+
+RESOURCE_FETCH_ATTEMPTS = 3
+PARTIAL_SUFFIX = '.part'
+HASH_BLOCK_SIZE = 1 << 16
+# The hash of a fetched resource is recorded next to it (along with its size & modification time), so it isn't
+# rehashed, and the server isn't asked about it again for RESOURCE_RECHECK_SECONDS
+HASH_SUFFIX = '.sha256'
+RESOURCE_RECHECK_SECONDS = 7 * 24 * 60 * 60
+
+
+def file_sha256(path):
+    # type: (str) -> str
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        block = f.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = f.read(HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+def _file_stamp(path):
+    # type: (str) -> str
+    stat = os.stat(path)
+    return '%d %d' % (stat.st_size, int(stat.st_mtime))
+
+
+def record_sha256(path, sha256):
+    # type: (str, str) -> None
+    with open(path + HASH_SUFFIX, 'w') as f:
+        f.write('%s %s' % (sha256, _file_stamp(path)))
+
+
+def recorded_sha256(path):
+    # type: (str) -> str | None
+    # The hash recorded for `path`, None if there's none or the file changed since
+    try:
+        with open(path + HASH_SUFFIX, 'r') as f:
+            sha256, stamp = f.read().split(' ', 1)
+        if stamp == _file_stamp(path):
+            return sha256
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def resource_is_fresh(path, max_age=RESOURCE_RECHECK_SECONDS):
+    # type: (str, float) -> bool
+    # Whether `path` is unchanged since it was fetched (or last checked with the server), less than `max_age` ago
+    if recorded_sha256(path) is None:
+        return False
+    return time.time() - os.path.getmtime(path + HASH_SUFFIX) < max_age
+
+
+def _partial_path(path, sha256):
+    # type: (str, str) -> str
+    # Partial downloads are named after the hash of the resource they belong to, so they are only ever resumed
+    # with the same content
+    return '%s.%s%s' % (path, sha256, PARTIAL_SUFFIX)
+
+
+def _find_partial(path):
+    # type: (str) -> tuple[str | None, int]
+    for partial in glob.glob(_partial_path(path, '*')):
+        size = os.path.getsize(partial)
+        if size > 0:
+            return partial[len(path) + 1:-len(PARTIAL_SUFFIX)], size
+        os.remove(partial)
+    return None, 0
+
+
+def _remove_partials(path):
+    # type: (str) -> None
+    for partial in glob.glob(_partial_path(path, '*')):
+        os.remove(partial)
+
+
+def _download(connection, name, path, sha256, offset):
+    # type: (ConnectionABC, str, str, str | None, int) -> bool | None
+    # Returns whether the resource was downloaded (False if it's up to date), or None if the download is corrupt
+    connection.send_command(ResourceChunkRequest(name, sha256, offset))
+
+    output = None
+    try:
+        while True:
+            chunk = connection.recv_command()
+            if not isinstance(chunk, ResourceChunk) or chunk.name != name:
+                raise TypeError("Unexpected response for ResourceChunkRequest")
+            if chunk.sha256 is None:
+                raise EnvironmentError("Server has no resource %s" % name)
+
+            if output is None:
+                if offset == 0 and chunk.sha256 == sha256:
+                    record_sha256(path, sha256)
+                    return False
+
+                partial = _partial_path(path, chunk.sha256)
+                if chunk.offset == 0:
+                    _remove_partials(path)
+                elif chunk.offset != offset or chunk.sha256 != sha256:
+                    raise TypeError("Unexpected offset for ResourceChunk")
+                output = open(partial, 'wb' if chunk.offset == 0 else 'ab')
+                offset = chunk.offset
+
+            if chunk.offset != offset:
+                raise TypeError("Unexpected offset for ResourceChunk")
+            output.write(chunk.content)
+            offset += len(chunk.content)
+            if offset >= chunk.size:
+                break
+    finally:
+        if output is not None:
+            output.close()
+
+    if file_sha256(partial) != chunk.sha256:
+        os.remove(partial)
+        return None
+
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(partial, path)
+    record_sha256(path, chunk.sha256)
+    return True
+
+
+def fetch_resource(connection, path, attempts=RESOURCE_FETCH_ATTEMPTS):
+    # type: (ConnectionABC, str, int) -> bool
+    # Brings `path` up to date with the server's resource of the same name, resuming a previous partial download
+    # if there is one. Returns whether it was (re-)downloaded.
+    name = os.path.basename(path)
+    for _ in range(attempts):
+        sha256, offset = _find_partial(path)
+        if sha256 is None and os.path.exists(path):
+            sha256 = recorded_sha256(path) or file_sha256(path)
+
+        downloaded = _download(connection, name, path, sha256, offset)
+        if downloaded is not None:
+            return downloaded
+
+        print("[JSync] Download of %s is corrupt, retrying" % name)
+
+    raise EnvironmentError("Couldn't download resource %s" % name)
@@ -45,7 +45,7 @@ class ScanUpdatedSymbols(object):
             self._rename_engine.flush_all_symbols()
 
             command = UpstreamSymbols(project, symbols, loggable=False)
-            self._connection.send_packet(command.encode())
+            self._connection.send_command(command)
 
     def handle_reverted_symbols(self):
         for project in self._projects:
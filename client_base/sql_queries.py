@@ -7,6 +7,19 @@ CREATE TABLE IF NOT EXISTS symbols (
     timestamp INTEGER,
     PRIMARY KEY (author, canonical_signature)
 );"""
+CLIENT_CREATE_LATEST_SYMBOLS_VIEW_QUERY = """
+CREATE VIEW IF NOT EXISTS latest_symbols AS
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM symbols;
+"""
+CLIENT_CREATE_SYMBOLS_TIMESTAMP_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS symbols_timestamp
+ON symbols(timestamp, author, symbol_type, canonical_signature, name);
+"""
+CLIENT_CREATE_SYMBOLS_CANONICAL_SIGNATURE_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS symbols_canonical_signature
+ON symbols(canonical_signature, timestamp, author, symbol_type, name);
+"""
 CLIENT_DELETE_SYMBOLS_QUERY = """
 DELETE FROM symbols WHERE author = ? AND canonical_signature = ?;
 """
@@ -29,20 +42,21 @@ SELECT name, symbol_type
 FROM rename_records
 WHERE canonical_signature = ?;
 """
+# Searches the records once per candidate, see GET_CANDIDATE_SYMBOLS_QUERY
+GET_CANDIDATE_RENAMES_QUERY = """
+SELECT rename_records.canonical_signature, symbol_type, name
+FROM candidate_signatures
+CROSS JOIN rename_records ON rename_records.canonical_signature = candidate_signatures.canonical_signature;
+"""
 GET_RENAMES_QUERY = """
 SELECT canonical_signature, symbol_type, name
 FROM rename_records;
 """
 
-CREATE_METADATA_TABLE_QUERY = """
-CREATE TABLE IF NOT EXISTS metadata (
-    property TEXT,
-    value TEXT,
-    PRIMARY KEY (property)
-);"""
-WRITE_METADATA_PROPERTY_QUERY = """
-REPLACE INTO metadata(property, value) VALUES (?, ?);
-"""
-READ_METADATA_PROPERTY_QUERY = """
-SELECT value FROM metadata WHERE property = ?;
-"""
+# See `SCHEMA_MIGRATIONS` in common/sql_queries.py
+CLIENT_SCHEMA_MIGRATIONS = [
+    # Latest symbols view (shared queries read from `latest_symbols`)
+    [CLIENT_CREATE_LATEST_SYMBOLS_VIEW_QUERY],
+    # Covering indexes for GET_SYMBOLS_QUERY & GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY
+    [CLIENT_CREATE_SYMBOLS_TIMESTAMP_INDEX_QUERY, CLIENT_CREATE_SYMBOLS_CANONICAL_SIGNATURE_INDEX_QUERY],
+]
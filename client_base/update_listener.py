@@ -1,8 +1,19 @@
-from common.commands import Command, DownstreamSymbols, FullSyncComplete
+from common.commands import DownstreamSymbols, FullSyncComplete, FullSyncRequest, ResyncRequired
+from common.consts import SEQUENCE_PROTOCOL_VERSION
 from .connection import ConnectionABC
 from .rename_engine import RenameEngineABC
 
 
+def full_sync_request(connection, rename_engine, project):
+    # type: (ConnectionABC, RenameEngineABC, str) -> FullSyncRequest
+    # Requests whatever changed since the last completed sync of the project
+    last_sync = int(rename_engine.get_metadata_property(project, 'last_sync') or 0)
+    last_sync_seq = rename_engine.get_metadata_property(project, 'last_sync_seq')
+    if connection.server_version < SEQUENCE_PROTOCOL_VERSION or last_sync_seq is None:
+        return FullSyncRequest(project, last_sync)
+    return FullSyncRequest(project, last_sync, int(last_sync_seq))
+
+
 class UpdateListener(object):
     def __init__(self, connection, projects, rename_engine):
         # type: (ConnectionABC, list[str], RenameEngineABC) -> None
@@ -12,7 +23,7 @@ class UpdateListener(object):
 
     def handle_packet(self, packet):
         # type: (bytes) -> None
-        command = Command.decode(packet)
+        command = self._connection.codec.decode(packet)
         if isinstance(command, DownstreamSymbols):
             if command.project in self._projects:
                 self._rename_engine.record_symbols(command.project, command.symbols)
@@ -20,6 +31,12 @@ class UpdateListener(object):
         elif isinstance(command, FullSyncComplete):
             if command.project in self._projects:
                 self._rename_engine.set_metadata_property(command.project, 'last_sync', command.timestamp)
+                if command.seq is not None:
+                    self._rename_engine.set_metadata_property(command.project, 'last_sync_seq', command.seq)
+        elif isinstance(command, ResyncRequired):
+            if command.project in self._projects:
+                self._connection.send_command(full_sync_request(self._connection, self._rename_engine,
+                                                                command.project))
 
     def receive_packet(self):
         # type: () -> bytes
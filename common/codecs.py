@@ -0,0 +1,371 @@
+import json
+import re
+import struct
+
+from .consts import CODEC_JSON, CODEC_BINARY
+from .symbol import Symbol
+from .symbol_batch import SymbolBatch
+from .commands import (Command, Subscribe, Unsubscribe, UpstreamSymbols, DownstreamSymbols, FullSyncRequest,
+                       FullSyncComplete, ResourceRequest, ResourceResponse, Handshake, HandshakeResponse,
+                       ResyncRequired, ResourceChunkRequest, ResourceChunk, ReplicationRequest, ReplicatedSymbols,
+                       ImportMapping, ImportComplete)
+
+
+class JsonCodec(object):
+    name = CODEC_JSON
+    # Keys are matched along with their quotes and colon, which text within a string (where quotes are escaped) never
+    # has. Symbols are the only objects nested within commands, and have no project.
+    _COMMAND_TYPE = re.compile(br'"__type__"\s*:\s*"(?!Symbol")(\w+)"')
+    _PROJECT = re.compile(br'"project"\s*:\s*("(?:[^"\\]|\\.)*"|null)')
+
+    def encode(self, command):
+        # type: (Command) -> bytes
+        return command.encode()
+
+    def decode(self, data):
+        # type: (bytes) -> Command
+        return Command.decode(data)
+
+    def peek_project(self, data):
+        # type: (bytes) -> tuple[type, str | None]
+        # Finds a command's type and project (None if it isn't project scoped) without decoding its symbols, keys may
+        # be in any order
+        match = self._COMMAND_TYPE.search(data)
+        typ = JSON_TYPES.get(match.group(1).decode('ascii')) if match is not None else None
+        if typ is None:
+            command = self.decode(data)
+            return type(command), getattr(command, 'project', None)
+        match = self._PROJECT.search(data)
+        return typ, json.loads(match.group(1).decode('utf-8')) if match is not None else None
+
+
+# Field kinds of the binary codec
+FIELD_STRING = 0  # Nullable UTF-8 string
+FIELD_INTEGER = 1  # Nullable (signed) integer
+FIELD_BOOLEAN = 2
+FIELD_SYMBOLS = 3  # List of symbols (decoded as a SymbolBatch)
+FIELD_STRINGS = 4  # Nullable list of (nullable) strings
+FIELD_BYTES = 5  # Nullable raw bytes
+FIELD_INTEGERS = 6  # Nullable list of (nullable) integers
+
+# Encodes a symbol without a timestamp
+NULL_TIMESTAMP = -(1 << 63)
+
+# Type tag -> (command type, fields); tags and field order are part of the wire format and must never change.
+# Fields may only be appended (as optional arguments of the command): older peers ignore trailing fields, and fields
+# missing from an older peer's command keep their default.
+BINARY_SCHEMAS = {
+    1: (Subscribe, [('project', FIELD_STRING)]),
+    2: (Unsubscribe, [('project', FIELD_STRING)]),
+    3: (UpstreamSymbols, [('project', FIELD_STRING), ('symbols', FIELD_SYMBOLS), ('loggable', FIELD_BOOLEAN)]),
+    4: (DownstreamSymbols, [('project', FIELD_STRING), ('symbols', FIELD_SYMBOLS)]),
+    5: (FullSyncRequest, [('project', FIELD_STRING), ('since', FIELD_INTEGER), ('seq', FIELD_INTEGER)]),
+    6: (FullSyncComplete, [('project', FIELD_STRING), ('timestamp', FIELD_INTEGER), ('seq', FIELD_INTEGER)]),
+    7: (ResourceRequest, [('name', FIELD_STRING)]),
+    8: (ResourceResponse, [('name', FIELD_STRING), ('content', FIELD_STRING)]),
+    9: (Handshake, [('version', FIELD_INTEGER), ('codecs', FIELD_STRINGS), ('compressions', FIELD_STRINGS)]),
+    10: (HandshakeResponse, [('version', FIELD_INTEGER), ('codec', FIELD_STRING), ('compression', FIELD_STRING)]),
+    11: (ResyncRequired, [('project', FIELD_STRING)]),
+    12: (ResourceChunkRequest, [('name', FIELD_STRING), ('sha256', FIELD_STRING), ('offset', FIELD_INTEGER)]),
+    13: (ResourceChunk, [('name', FIELD_STRING), ('sha256', FIELD_STRING), ('size', FIELD_INTEGER),
+                         ('offset', FIELD_INTEGER), ('content', FIELD_BYTES)]),
+    14: (ReplicationRequest, [('projects', FIELD_STRINGS), ('sequences', FIELD_INTEGERS)]),
+    15: (ReplicatedSymbols, [('project', FIELD_STRING), ('symbols', FIELD_SYMBOLS), ('sequences', FIELD_INTEGERS),
+                             ('reset', FIELD_BOOLEAN), ('sequence', FIELD_INTEGER), ('committed', FIELD_INTEGER)]),
+    16: (ImportMapping, [('project', FIELD_STRING), ('mapping_format', FIELD_STRING), ('author', FIELD_STRING),
+                         ('content', FIELD_BYTES)]),
+    17: (ImportComplete, [('project', FIELD_STRING), ('changed', FIELD_INTEGER), ('error', FIELD_STRING)]),
+}
+
+# Command type name -> command type, of the JSON codec
+JSON_TYPES = {typ.__name__: typ for typ, _ in BINARY_SCHEMAS.values()}
+
+
+class BinaryCodec(object):
+    # A compact encoding of commands: a type tag followed by the command's fields, where integers are encoded as
+    # varints and strings are length-prefixed. Written to run both on CPython 3 and on Jython 2.7.
+    name = CODEC_BINARY
+    # Peeking at a command's project only copies this much of it, unless the project's name is longer
+    PEEK_BYTES = 256
+
+    def __init__(self):
+        # type: () -> None
+        self._schemas = BINARY_SCHEMAS
+        self._tags = {typ: (tag, fields) for tag, (typ, fields) in BINARY_SCHEMAS.items()}
+
+    @staticmethod
+    def _write_varint(buf, value):
+        # type: (bytearray, int) -> None
+        while value > 0x7f:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+
+    @staticmethod
+    def _read_varint(data, offset):
+        # type: (bytearray, int) -> tuple[int, int]
+        value = 0
+        shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, offset
+            shift += 7
+
+    def _write_integer(self, buf, value):
+        # type: (bytearray, int | None) -> None
+        # 0 encodes None, otherwise the zigzag encoding of the value plus one
+        if value is None:
+            self._write_varint(buf, 0)
+        else:
+            value = int(value)
+            self._write_varint(buf, ((value << 1) if value >= 0 else ((-value << 1) - 1)) + 1)
+
+    def _read_integer(self, data, offset):
+        # type: (bytearray, int) -> tuple[int | None, int]
+        value, offset = self._read_varint(data, offset)
+        if value == 0:
+            return None, offset
+        value -= 1
+        return (value >> 1) if not (value & 1) else -((value + 1) >> 1), offset
+
+    def _write_string(self, buf, value):
+        # type: (bytearray, str | None) -> None
+        # 0 encodes None, otherwise the length of the UTF-8 encoding plus one
+        if value is None:
+            self._write_varint(buf, 0)
+        else:
+            if not isinstance(value, bytes):
+                value = value.encode('utf-8')
+            self._write_varint(buf, len(value) + 1)
+            buf.extend(value)
+
+    def _read_string(self, data, offset):
+        # type: (bytearray, int) -> tuple[str | None, int]
+        length, offset = self._read_varint(data, offset)
+        if length == 0:
+            return None, offset
+        end = offset + length - 1
+        return data[offset:end].decode('utf-8'), end
+
+    def _write_bytes(self, buf, value):
+        # type: (bytearray, bytes | None) -> None
+        # 0 encodes None, otherwise the length plus one
+        if value is None:
+            self._write_varint(buf, 0)
+        else:
+            self._write_varint(buf, len(value) + 1)
+            buf.extend(value)
+
+    def _read_bytes(self, data, offset):
+        # type: (bytearray, int) -> tuple[bytes | None, int]
+        length, offset = self._read_varint(data, offset)
+        if length == 0:
+            return None, offset
+        end = offset + length - 1
+        return bytes(data[offset:end]), end
+
+    @staticmethod
+    def _write_array(buf, fmt, values):
+        # type: (bytearray, str, list[int]) -> None
+        buf.extend(struct.pack('!%d%s' % (len(values), fmt), *values))
+
+    @staticmethod
+    def _read_array(data, offset, fmt, count):
+        # type: (bytearray, int, str, int) -> tuple[tuple[int], int]
+        fmt = '!%d%s' % (count, fmt)
+        end = offset + struct.calcsize(fmt)
+        return struct.unpack(fmt, bytes(data[offset:end])), end
+
+    def _write_string_column(self, buf, strings):
+        # type: (bytearray, list[str | None]) -> None
+        # The strings' lengths (in characters, 0 encoding None, otherwise the length plus one) followed by all of
+        # them concatenated, so both sides (de)serialize them with a handful of native calls
+        lengths = []
+        values = []
+        for string in strings:
+            if string is None:
+                lengths.append(0)
+            else:
+                if isinstance(string, bytes):
+                    string = string.decode('utf-8')
+                lengths.append(len(string) + 1)
+                values.append(string)
+
+        blob = u''.join(values).encode('utf-8')
+        self._write_varint(buf, len(strings))
+        self._write_array(buf, 'L', lengths)
+        self._write_varint(buf, len(blob))
+        buf.extend(blob)
+
+    def _read_string_column(self, data, offset):
+        # type: (bytearray, int) -> tuple[list[str | None], int]
+        count, offset = self._read_varint(data, offset)
+        lengths, offset = self._read_array(data, offset, 'L', count)
+        blob_length, offset = self._read_varint(data, offset)
+        blob = data[offset:offset + blob_length].decode('utf-8')
+        offset += blob_length
+
+        strings = []
+        append = strings.append
+        position = 0
+        for length in lengths:
+            if length:
+                end = position + length - 1
+                append(blob[position:end])
+                position = end
+            else:
+                append(None)
+        return strings, offset
+
+    def _write_symbols(self, buf, symbols):
+        # type: (bytearray, list[Symbol] | SymbolBatch) -> None
+        # Symbols are always sent as a (columnar) batch
+        batch = SymbolBatch.from_symbols(symbols)
+        self._write_varint(buf, len(batch))
+        self._write_string_column(buf, batch.classes)
+        self._write_string_column(buf, batch.authors)
+        self._write_array(buf, 'B', batch.symbol_types)
+        self._write_array(buf, 'L', batch.class_indexes)
+        self._write_string_column(buf, batch.members)
+        self._write_string_column(buf, batch.names)
+        self._write_array(buf, 'q', [NULL_TIMESTAMP if timestamp is None else timestamp
+                                     for timestamp in batch.timestamps])
+        self._write_array(buf, 'L', batch.author_indexes)
+
+    def _read_symbols(self, data, offset):
+        # type: (bytearray, int) -> tuple[SymbolBatch, int]
+        count, offset = self._read_varint(data, offset)
+        classes, offset = self._read_string_column(data, offset)
+        authors, offset = self._read_string_column(data, offset)
+        symbol_types, offset = self._read_array(data, offset, 'B', count)
+        class_indexes, offset = self._read_array(data, offset, 'L', count)
+        members, offset = self._read_string_column(data, offset)
+        names, offset = self._read_string_column(data, offset)
+        timestamps, offset = self._read_array(data, offset, 'q', count)
+        author_indexes, offset = self._read_array(data, offset, 'L', count)
+
+        timestamps = [None if timestamp == NULL_TIMESTAMP else timestamp for timestamp in timestamps]
+        return SymbolBatch(classes, authors, list(symbol_types), list(class_indexes), members, names, timestamps,
+                           list(author_indexes)), offset
+
+    def _write_field(self, buf, kind, value):
+        # type: (bytearray, int, object) -> None
+        if kind == FIELD_STRING:
+            self._write_string(buf, value)
+        elif kind == FIELD_INTEGER:
+            self._write_integer(buf, value)
+        elif kind == FIELD_BOOLEAN:
+            buf.append(1 if value else 0)
+        elif kind == FIELD_SYMBOLS:
+            self._write_symbols(buf, value)
+        elif kind == FIELD_STRINGS:
+            # 0 encodes None, otherwise the amount of strings plus one
+            if value is None:
+                self._write_varint(buf, 0)
+                return
+            self._write_varint(buf, len(value) + 1)
+            for item in value:
+                self._write_string(buf, item)
+        elif kind == FIELD_BYTES:
+            self._write_bytes(buf, value)
+        elif kind == FIELD_INTEGERS:
+            # 0 encodes None, otherwise the amount of integers plus one
+            if value is None:
+                self._write_varint(buf, 0)
+                return
+            self._write_varint(buf, len(value) + 1)
+            for item in value:
+                self._write_integer(buf, item)
+        else:
+            raise ValueError("Unhandled field kind %d" % kind)
+
+    def _read_field(self, data, offset, kind):
+        # type: (bytearray, int, int) -> tuple[object, int]
+        if kind == FIELD_STRING:
+            return self._read_string(data, offset)
+        elif kind == FIELD_INTEGER:
+            return self._read_integer(data, offset)
+        elif kind == FIELD_BOOLEAN:
+            return data[offset] != 0, offset + 1
+        elif kind == FIELD_SYMBOLS:
+            return self._read_symbols(data, offset)
+        elif kind == FIELD_STRINGS:
+            count, offset = self._read_varint(data, offset)
+            if count == 0:
+                return None, offset
+            items = []
+            for _ in range(count - 1):
+                item, offset = self._read_string(data, offset)
+                items.append(item)
+            return items, offset
+        elif kind == FIELD_BYTES:
+            return self._read_bytes(data, offset)
+        elif kind == FIELD_INTEGERS:
+            count, offset = self._read_varint(data, offset)
+            if count == 0:
+                return None, offset
+            items = []
+            for _ in range(count - 1):
+                item, offset = self._read_integer(data, offset)
+                items.append(item)
+            return items, offset
+        else:
+            raise ValueError("Unhandled field kind %d" % kind)
+
+    def encode(self, command):
+        # type: (Command) -> bytes
+        if type(command) not in self._tags:
+            raise ValueError("Unhandled command type %s" % type(command).__name__)
+
+        tag, fields = self._tags[type(command)]
+        buf = bytearray()
+        self._write_varint(buf, tag)
+        for name, kind in fields:
+            self._write_field(buf, kind, getattr(command, name))
+        return bytes(buf)
+
+    def decode(self, data):
+        # type: (bytes) -> Command
+        data = bytearray(data)
+        tag, offset = self._read_varint(data, 0)
+        if tag not in self._schemas:
+            raise ValueError("Unhandled command tag %d" % tag)
+
+        typ, fields = self._schemas[tag]
+        values = {}
+        for name, kind in fields:
+            if offset >= len(data):
+                break
+            values[name], offset = self._read_field(data, offset, kind)
+        return typ(**values)
+
+    def _peek_project(self, data):
+        # type: (bytearray) -> tuple[type, str | None]
+        tag, offset = self._read_varint(data, 0)
+        if tag not in self._schemas:
+            raise ValueError("Unhandled command tag %d" % tag)
+
+        typ, fields = self._schemas[tag]
+        if not fields or fields[0][0] != 'project' or offset >= len(data):
+            return typ, None
+        length, start = self._read_varint(data, offset)
+        if start + length - 1 > len(data):
+            raise IndexError("Project exceeds peeked data")
+        return typ, self._read_string(data, offset)[0]
+
+    def peek_project(self, data):
+        # type: (bytes) -> tuple[type, str | None]
+        # Decodes only a command's type and project (None if it isn't project scoped), without the (possibly large)
+        # fields following it
+        try:
+            return self._peek_project(bytearray(data[:self.PEEK_BYTES]))
+        except IndexError:
+            return self._peek_project(bytearray(data))
+
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+CODECS = {codec.name: codec for codec in (BINARY_CODEC, JSON_CODEC)}
@@ -1,7 +1,9 @@
+import base64
 import json
 
 from .dataclass import Dataclass
 from .symbol import Symbol
+from .symbol_batch import SymbolBatch
 
 
 COMMAND_ENCODER = None  # type: json.JSONEncoder
@@ -26,6 +28,12 @@ class _CommandEncoder(json.JSONEncoder):
         if isinstance(obj, Dataclass):
             d = {'__type__': type(obj).__name__}
             d.update(vars(obj))
+            for name in getattr(obj, 'BASE64_FIELDS', ()):
+                if d[name] is not None:
+                    d[name] = base64.b64encode(d[name]).decode('ascii')
+            for name in getattr(obj, 'OPTIONAL_FIELDS', ()):
+                if d[name] is None:
+                    del d[name]
             return d
         return super(_CommandEncoder, self).default(obj)
 
@@ -41,7 +49,11 @@ class _CommandDecoder(json.JSONDecoder):
             typ = dct.pop('__type__')
             if typ not in self._types:
                 raise ValueError("Unhandled dynamic type")
-            return self._types[typ](**dct)
+            typ = self._types[typ]
+            for name in getattr(typ, 'BASE64_FIELDS', ()):
+                if dct.get(name) is not None:
+                    dct[name] = base64.b64decode(dct[name])
+            return typ(**dct)
         else:
             return dct
 
@@ -60,7 +72,7 @@ class Unsubscribe(Command):
 
 class UpstreamSymbols(Command):
     def __init__(self, project, symbols, loggable):
-        # type: (str, list[Symbol], bool) -> None
+        # type: (str, list[Symbol] | SymbolBatch, bool) -> None
         self.project = project
         self.symbols = symbols
         self.loggable = loggable
@@ -68,23 +80,39 @@ class UpstreamSymbols(Command):
 
 class DownstreamSymbols(Command):
     def __init__(self, project, symbols):
-        # type: (str, list[Symbol]) -> None
+        # type: (str, list[Symbol] | SymbolBatch) -> None
         self.project = project
         self.symbols = symbols
 
 
 class FullSyncRequest(Command):
-    def __init__(self, project, since):
-        # type: (str, int) -> None
+    # Symbols changed after sequence number `seq`, or (for older clients, which don't send it) since `since`
+    # Fields added to a released command are omitted when None, so older peers can still decode it
+    OPTIONAL_FIELDS = ('seq',)
+
+    def __init__(self, project, since, seq=None):
+        # type: (str, int, int | None) -> None
         self.project = project
         self.since = since
+        self.seq = seq
 
 
 class FullSyncComplete(Command):
-    def __init__(self, project, timestamp):
-        # type: (str, int) -> None
+    # `seq` is the sequence number the next sync of the project should start after
+    OPTIONAL_FIELDS = ('seq',)
+
+    def __init__(self, project, timestamp, seq=None):
+        # type: (str, int, int | None) -> None
         self.project = project
         self.timestamp = timestamp
+        self.seq = seq
+
+
+class ResyncRequired(Command):
+    # Updates of the project were dropped before reaching the client, which should fully sync it again
+    def __init__(self, project):
+        # type: (str) -> None
+        self.project = project
 
 
 class ResourceRequest(Command):
@@ -98,5 +126,91 @@ class ResourceResponse(Command):
         self.content = content
 
 
+class ResourceChunkRequest(Command):
+    # `sha256` is the hash of the client's copy of the resource (if any), or when resuming a download (from `offset`),
+    # of the resource it is downloading
+    def __init__(self, name, sha256=None, offset=0):
+        # type: (str, str | None, int) -> None
+        self.name = name
+        self.sha256 = sha256
+        self.offset = offset
+
+
+class ResourceChunk(Command):
+    # The resource's content in [offset, offset + len(content)); `sha256` is None for a non-existent resource, and
+    # an empty chunk at the resource's end is sent if the client's copy is up to date
+    BASE64_FIELDS = ('content',)
+
+    def __init__(self, name, sha256, size, offset, content):
+        # type: (str, str | None, int, int, bytes) -> None
+        self.name = name
+        self.sha256 = sha256
+        self.size = size
+        self.offset = offset
+        self.content = content
+
+
+class ReplicationRequest(Command):
+    # Sent by a following server, with the sequence number its store of each project is at (projects it lacks are
+    # replicated from the start)
+    def __init__(self, projects, sequences):
+        # type: (list[str], list[int]) -> None
+        self.projects = projects
+        self.sequences = sequences
+
+
+class ReplicatedSymbols(Command):
+    # Changes of the project's latest symbols in order, each with the sequence number the primary assigned it. With
+    # `reset`, the follower's store is cleared first (e.g. as the primary's store was replaced). `sequence` is the
+    # primary's sequence number when sending, and `committed` the (epoch, in milliseconds) time the primary committed
+    # the earliest of the changes, or read them if it's catching up.
+    def __init__(self, project, symbols, sequences, reset, sequence, committed):
+        # type: (str, list[Symbol] | SymbolBatch, list[int], bool, int, int) -> None
+        self.project = project
+        self.symbols = symbols
+        self.sequences = sequences
+        self.reset = reset
+        self.sequence = sequence
+        self.committed = committed
+
+
+class ImportMapping(Command):
+    # Imports a mapping (in one of the server's mapping formats, e.g. "proguard") into the project's store as renames
+    # by `author`, answered by ImportComplete. Only accepted from local connections.
+    BASE64_FIELDS = ('content',)
+
+    def __init__(self, project, mapping_format, author, content):
+        # type: (str, str, str, bytes) -> None
+        self.project = project
+        self.mapping_format = mapping_format
+        self.author = author
+        self.content = content
+
+
+class ImportComplete(Command):
+    # `changed` symbols were imported, or the import failed with `error`
+    def __init__(self, project, changed, error=None):
+        # type: (str, int, str | None) -> None
+        self.project = project
+        self.changed = changed
+        self.error = error
+
+
+class Handshake(Command):
+    def __init__(self, version, codecs, compressions=None):
+        # type: (int, list[str], list[str] | None) -> None
+        self.version = version
+        self.codecs = codecs
+        self.compressions = compressions
+
+
+class HandshakeResponse(Command):
+    def __init__(self, version, codec, compression=None):
+        # type: (int, str, str | None) -> None
+        self.version = version
+        self.codec = codec
+        self.compression = compression
+
+
 COMMAND_ENCODER = _CommandEncoder()
 COMMAND_DECODER = _CommandDecoder()
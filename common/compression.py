@@ -0,0 +1,30 @@
+import zlib
+
+from .consts import COMPRESSION_ZLIB, COMPRESSION_THRESHOLD, COMPRESSION_LEVEL, PACKET_COMPRESSED_FLAG
+
+
+COMPRESSIONS = [COMPRESSION_ZLIB]
+
+
+def compress_packet(data, compression):
+    # type: (bytes, str | None) -> tuple[int, bytes]
+    # Returns the size field of the packet's header, along with its (possibly compressed) payload.
+    # Small packets (like interactive renames) are never compressed, as it wouldn't be worth the CPU time.
+    if compression == COMPRESSION_ZLIB and len(data) >= COMPRESSION_THRESHOLD:
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        # Already compressed content (e.g. JARs) is sent as is
+        if len(compressed) < len(data):
+            return len(compressed) | PACKET_COMPRESSED_FLAG, compressed
+
+    return len(data), data
+
+
+def packet_size(size_field):
+    # type: (int) -> tuple[int, bool]
+    # Returns the size of the packet's payload, and whether it is compressed
+    return size_field & ~PACKET_COMPRESSED_FLAG, bool(size_field & PACKET_COMPRESSED_FLAG)
+
+
+def decompress_packet(data, compressed):
+    # type: (bytes, bool) -> bytes
+    return zlib.decompress(data) if compressed else data
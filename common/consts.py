@@ -1 +1,24 @@
 PACKET_SIZE_FORMAT = "!L"
+
+# Version of the protocol negotiated in the handshake following the name packet
+PROTOCOL_VERSION = 7
+# Symbol lists may be sent as a (columnar) SymbolBatch to peers of this version onwards
+SYMBOL_BATCH_PROTOCOL_VERSION = 2
+# Peers of this version onwards handle ResyncRequired
+RESYNC_PROTOCOL_VERSION = 3
+# Servers of this version onwards stream resources as ResourceChunks
+RESOURCE_CHUNK_PROTOCOL_VERSION = 4
+# Peers of this version onwards sync by sequence numbers rather than timestamps
+SEQUENCE_PROTOCOL_VERSION = 5
+# Servers of this version onwards replicate their stores to following servers
+REPLICATION_PROTOCOL_VERSION = 6
+# Servers of this version onwards import mappings sent to them by ImportMapping
+IMPORT_PROTOCOL_VERSION = 7
+CODEC_JSON = "json"
+CODEC_BINARY = "binary"
+
+# Compression of large packets, negotiated in the handshake (and flagged in the packet's size field)
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_THRESHOLD = 4096
+COMPRESSION_LEVEL = 6
+PACKET_COMPRESSED_FLAG = 1 << 31
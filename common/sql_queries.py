@@ -8,16 +8,52 @@ CREATE TABLE IF NOT EXISTS symbols (
     PRIMARY KEY (author, canonical_signature, timestamp)
 );
 """
+CREATE_LATEST_SYMBOLS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS latest_symbols (
+    author TEXT,
+    symbol_type INTEGER,
+    canonical_signature TEXT,
+    name TEXT,
+    timestamp INTEGER,
+    PRIMARY KEY (author, canonical_signature)
+) WITHOUT ROWID;
+"""
+POPULATE_LATEST_SYMBOLS_QUERY = """
+REPLACE INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp)
+SELECT author, symbol_type, canonical_signature, name, MAX(timestamp)
+FROM symbols
+GROUP BY author, canonical_signature;
+"""
+CREATE_LATEST_SYMBOLS_INSERT_TRIGGER_QUERY = """
+CREATE TRIGGER IF NOT EXISTS latest_symbols_insert AFTER INSERT ON symbols
+BEGIN
+    REPLACE INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp)
+    SELECT NEW.author, NEW.symbol_type, NEW.canonical_signature, NEW.name, NEW.timestamp
+    WHERE NOT EXISTS (
+        SELECT 1 FROM latest_symbols
+        WHERE author = NEW.author AND canonical_signature = NEW.canonical_signature AND timestamp > NEW.timestamp
+    );
+END;
+"""
+CREATE_LATEST_SYMBOLS_DELETE_TRIGGER_QUERY = """
+CREATE TRIGGER IF NOT EXISTS latest_symbols_delete AFTER DELETE ON symbols
+BEGIN
+    DELETE FROM latest_symbols
+    WHERE author = OLD.author AND canonical_signature = OLD.canonical_signature AND timestamp = OLD.timestamp;
+    INSERT OR IGNORE INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp)
+    SELECT author, symbol_type, canonical_signature, name, MAX(timestamp)
+    FROM symbols
+    WHERE author = OLD.author AND canonical_signature = OLD.canonical_signature
+    GROUP BY author, canonical_signature;
+END;
+"""
+# Must start with REPLACE (rather than WITH), as pysqlite only opens its implicit transaction before DML statements,
+# otherwise `executemany` commits every row on its own
 PUSH_SYMBOLS_QUERY = """
+REPLACE INTO symbols(author, symbol_type, canonical_signature, name, timestamp)
 WITH input(author, symbol_type, canonical_signature, name, timestamp) AS (
     VALUES (?, ?, ?, ?, ?)
-),
-latest_symbols(author, symbol_type, canonical_signature, name, timestamp) AS (
-    SELECT author, symbol_type, canonical_signature, name, MAX(timestamp)
-    FROM symbols
-    GROUP BY author, canonical_signature
 )
-REPLACE INTO symbols(author, symbol_type, canonical_signature, name, timestamp)
 SELECT input.author, input.symbol_type, input.canonical_signature, input.name, input.timestamp
 FROM input
 LEFT JOIN latest_symbols ON
@@ -26,29 +62,313 @@ AND input.canonical_signature = latest_symbols.canonical_signature
 WHERE input.name != latest_symbols.name
    OR latest_symbols.name IS NULL;
 """
+# Only superseded history is deleted, never a key's latest version: its row in `latest_symbols` would go without a
+# sequence number, so clients syncing by sequence numbers would never learn of the deletion
 DELETE_SYMBOLS_QUERY = """
-DELETE FROM symbols WHERE author = ? AND canonical_signature = ? AND timestamp = ?;
+DELETE FROM symbols
+WHERE author = ?1 AND canonical_signature = ?2 AND timestamp = ?3 AND timestamp < (
+    SELECT timestamp FROM latest_symbols WHERE author = ?1 AND canonical_signature = ?2
+);
 """
 GET_SYMBOLS_QUERY = """
-SELECT *, max(timestamp)
-FROM symbols
-WHERE timestamp > ?
-GROUP BY canonical_signature, author;
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM latest_symbols
+WHERE timestamp > ?;
+"""
+GET_SYMBOLS_PAGE_QUERY = """
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM latest_symbols
+WHERE timestamp > ? AND (author, canonical_signature) > (?, ?)
+ORDER BY author, canonical_signature
+LIMIT ?;
 """
 GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY = """
-SELECT *, max(timestamp)
-FROM symbols
-WHERE canonical_signature = ? AND timestamp > ? 
-GROUP BY author;
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM latest_symbols
+WHERE canonical_signature = ? AND timestamp > ?;
 """
 GET_SYMBOLS_AUTHOR_QUERY = """
-SELECT *, max(timestamp)
-FROM symbols
-WHERE author = ? AND timestamp > ? 
-GROUP BY canonical_signature;
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM latest_symbols
+WHERE author = ? AND timestamp > ?;
 """
 GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY = """
-SELECT *, max(timestamp)
-FROM symbols
+SELECT author, symbol_type, canonical_signature, name, timestamp
+FROM latest_symbols
 WHERE canonical_signature = ? AND author = ? AND timestamp > ?;
 """
+CREATE_LATEST_SYMBOLS_TIMESTAMP_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS latest_symbols_timestamp
+ON latest_symbols(timestamp, symbol_type, name);
+"""
+CREATE_LATEST_SYMBOLS_CANONICAL_SIGNATURE_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS latest_symbols_canonical_signature
+ON latest_symbols(canonical_signature, timestamp, symbol_type, name);
+"""
+
+# Every change of `latest_symbols` is assigned the next value of a per-store sequence (kept in `metadata`),
+# so incremental syncs are exact regardless of the server's clock
+ADD_LATEST_SYMBOLS_SEQ_COLUMN_QUERY = """
+ALTER TABLE latest_symbols ADD COLUMN seq INTEGER NOT NULL DEFAULT 0;
+"""
+POPULATE_LATEST_SYMBOLS_SEQ_QUERY = """
+UPDATE latest_symbols SET seq = ordered.seq
+FROM (
+    SELECT author, canonical_signature, ROW_NUMBER() OVER (ORDER BY timestamp, author, canonical_signature) AS seq
+    FROM latest_symbols
+) AS ordered
+WHERE latest_symbols.author = ordered.author AND latest_symbols.canonical_signature = ordered.canonical_signature;
+"""
+INITIALIZE_SEQUENCE_QUERY = """
+REPLACE INTO metadata(property, value)
+SELECT 'sequence', COUNT(*) FROM latest_symbols;
+"""
+DROP_LATEST_SYMBOLS_INSERT_TRIGGER_QUERY = """
+DROP TRIGGER IF EXISTS latest_symbols_insert;
+"""
+DROP_LATEST_SYMBOLS_DELETE_TRIGGER_QUERY = """
+DROP TRIGGER IF EXISTS latest_symbols_delete;
+"""
+CREATE_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY = """
+CREATE TRIGGER IF NOT EXISTS latest_symbols_seq_insert AFTER INSERT ON symbols
+WHEN NOT EXISTS (
+    SELECT 1 FROM latest_symbols
+    WHERE author = NEW.author AND canonical_signature = NEW.canonical_signature AND timestamp > NEW.timestamp
+)
+BEGIN
+    UPDATE metadata SET value = CAST(value AS INTEGER) + 1 WHERE property = 'sequence';
+    REPLACE INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp, seq)
+    SELECT NEW.author, NEW.symbol_type, NEW.canonical_signature, NEW.name, NEW.timestamp, CAST(value AS INTEGER)
+    FROM metadata WHERE property = 'sequence';
+END;
+"""
+CREATE_LATEST_SYMBOLS_SEQ_DELETE_TRIGGER_QUERY = """
+CREATE TRIGGER IF NOT EXISTS latest_symbols_seq_delete AFTER DELETE ON symbols
+WHEN EXISTS (
+    SELECT 1 FROM latest_symbols
+    WHERE author = OLD.author AND canonical_signature = OLD.canonical_signature AND timestamp = OLD.timestamp
+)
+BEGIN
+    UPDATE metadata SET value = CAST(value AS INTEGER) + 1 WHERE property = 'sequence';
+    DELETE FROM latest_symbols
+    WHERE author = OLD.author AND canonical_signature = OLD.canonical_signature;
+    INSERT INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp, seq)
+    SELECT author, symbol_type, canonical_signature, name, MAX(timestamp),
+           (SELECT CAST(value AS INTEGER) FROM metadata WHERE property = 'sequence')
+    FROM symbols
+    WHERE author = OLD.author AND canonical_signature = OLD.canonical_signature
+    GROUP BY author, canonical_signature;
+END;
+"""
+# Covering index for GET_SYMBOLS_SEQ_PAGE_QUERY (along with the primary key's columns, which every index of a WITHOUT
+# ROWID table includes). Sequence numbers are unique by construction (each change takes the next one), which the
+# index doesn't enforce.
+CREATE_LATEST_SYMBOLS_SEQ_PAGE_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS latest_symbols_seq_page
+ON latest_symbols(seq, symbol_type, name, timestamp);
+"""
+GET_SEQUENCE_QUERY = """
+SELECT CAST(value AS INTEGER) FROM metadata WHERE property = 'sequence';
+"""
+GET_SYMBOLS_SEQ_PAGE_QUERY = """
+SELECT author, symbol_type, canonical_signature, name, timestamp, seq
+FROM latest_symbols
+WHERE seq > ?
+ORDER BY seq
+LIMIT ?;
+"""
+
+# Changes replicated from a primary store are inserted into this (per-connection) view, applying each one as it was
+# on the primary: history newer than the change is dropped (e.g. if the primary's was compacted away), and the
+# sequence is set so that the insert trigger assigns the change the primary's sequence number
+CREATE_REPLICATED_CHANGES_VIEW_QUERY = """
+CREATE TEMP VIEW IF NOT EXISTS replicated_changes(author, symbol_type, canonical_signature, name, timestamp, seq) AS
+SELECT author, symbol_type, canonical_signature, name, timestamp, seq FROM latest_symbols WHERE 0;
+"""
+CREATE_REPLICATED_CHANGES_TRIGGER_QUERY = """
+CREATE TEMP TRIGGER IF NOT EXISTS replicated_changes_insert INSTEAD OF INSERT ON replicated_changes
+BEGIN
+    DELETE FROM symbols
+    WHERE author = NEW.author AND canonical_signature = NEW.canonical_signature AND timestamp > NEW.timestamp;
+    UPDATE metadata SET value = NEW.seq - 1 WHERE property = 'sequence';
+    REPLACE INTO symbols(author, symbol_type, canonical_signature, name, timestamp)
+    VALUES (NEW.author, NEW.symbol_type, NEW.canonical_signature, NEW.name, NEW.timestamp);
+    UPDATE metadata SET value = NEW.seq WHERE property = 'sequence';
+END;
+"""
+APPLY_REPLICATED_CHANGES_QUERY = """
+INSERT INTO replicated_changes(author, symbol_type, canonical_signature, name, timestamp, seq)
+VALUES (?, ?, ?, ?, ?, ?);
+"""
+CLEAR_LATEST_SYMBOLS_QUERY = """
+DELETE FROM latest_symbols;
+"""
+CLEAR_SYMBOLS_QUERY = """
+DELETE FROM symbols;
+"""
+RESET_SEQUENCE_QUERY = """
+UPDATE metadata SET value = 0 WHERE property = 'sequence';
+"""
+
+# Bulk imports (of a single author & timestamp) are staged in a temporary table, deduplicated by signature, and
+# applied set-wise in a single transaction, which drops the insert trigger (rather than running it for every row)
+# and assigns the sequence numbers itself
+CREATE_IMPORTED_SYMBOLS_TABLE_QUERY = """
+CREATE TEMP TABLE IF NOT EXISTS imported_symbols (
+    symbol_type INTEGER,
+    canonical_signature TEXT PRIMARY KEY ON CONFLICT REPLACE,
+    name TEXT
+);
+"""
+INSERT_IMPORTED_SYMBOL_QUERY = """
+INSERT INTO imported_symbols(symbol_type, canonical_signature, name) VALUES (?, ?, ?);
+"""
+# Symbols already named so, or renamed after the import (by its timestamp), are left as they are
+DELETE_UNCHANGED_IMPORTED_SYMBOLS_QUERY = """
+DELETE FROM imported_symbols
+WHERE EXISTS (
+    SELECT 1 FROM latest_symbols
+    WHERE author = ?1 AND canonical_signature = imported_symbols.canonical_signature
+      AND (name = imported_symbols.name OR timestamp > ?2)
+);
+"""
+DROP_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY = """
+DROP TRIGGER IF EXISTS latest_symbols_seq_insert;
+"""
+IMPORT_SYMBOLS_QUERY = """
+REPLACE INTO symbols(author, symbol_type, canonical_signature, name, timestamp)
+SELECT ?1, symbol_type, canonical_signature, name, ?2
+FROM imported_symbols
+ORDER BY canonical_signature;
+"""
+IMPORT_LATEST_SYMBOLS_QUERY = """
+REPLACE INTO latest_symbols(author, symbol_type, canonical_signature, name, timestamp, seq)
+SELECT ?1, symbol_type, canonical_signature, name, ?2,
+       (SELECT CAST(value AS INTEGER) FROM metadata WHERE property = 'sequence') +
+       ROW_NUMBER() OVER (ORDER BY canonical_signature)
+FROM imported_symbols
+ORDER BY canonical_signature;
+"""
+ADVANCE_SEQUENCE_QUERY = """
+UPDATE metadata SET value = CAST(value AS INTEGER) + (SELECT COUNT(*) FROM imported_symbols)
+WHERE property = 'sequence';
+"""
+COUNT_IMPORTED_SYMBOLS_QUERY = """
+SELECT COUNT(*) FROM imported_symbols;
+"""
+CLEAR_IMPORTED_SYMBOLS_QUERY = """
+DELETE FROM imported_symbols;
+"""
+
+# Signatures looked up at once are staged in a temporary table and joined against, rather than queried one by one
+CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY = """
+CREATE TEMP TABLE IF NOT EXISTS candidate_signatures (
+    canonical_signature TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+INSERT_CANDIDATE_SIGNATURE_QUERY = """
+INSERT OR IGNORE INTO candidate_signatures(canonical_signature) VALUES (?);
+"""
+# Ordered like GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY (by its index), for each signature. The CROSS JOIN keeps the
+# candidates the outer loop, so that the index is searched once per candidate rather than scanned in full.
+GET_CANDIDATE_SYMBOLS_QUERY = """
+SELECT author, symbol_type, latest_symbols.canonical_signature, name, timestamp
+FROM candidate_signatures
+CROSS JOIN latest_symbols ON latest_symbols.canonical_signature = candidate_signatures.canonical_signature
+WHERE timestamp > 0
+ORDER BY candidate_signatures.canonical_signature, timestamp, author;
+"""
+CLEAR_CANDIDATE_SIGNATURES_QUERY = """
+DELETE FROM candidate_signatures;
+"""
+# Symbols to diff against the latest ones are staged (in order) in a temporary table, and the positions of those which
+# are new, or named differently than the latest symbol of their author, are selected by a single join
+CREATE_CANDIDATE_SYMBOLS_TABLE_QUERY = """
+CREATE TEMP TABLE IF NOT EXISTS candidate_symbols (
+    position INTEGER PRIMARY KEY,
+    author TEXT,
+    canonical_signature TEXT,
+    name TEXT
+);
+"""
+INSERT_CANDIDATE_SYMBOL_QUERY = """
+INSERT INTO candidate_symbols(position, author, canonical_signature, name) VALUES (?, ?, ?, ?);
+"""
+GET_CHANGED_CANDIDATE_SYMBOLS_QUERY = """
+SELECT position
+FROM candidate_symbols
+WHERE NOT EXISTS (
+    SELECT 1 FROM latest_symbols
+    WHERE author = candidate_symbols.author AND canonical_signature = candidate_symbols.canonical_signature
+      AND timestamp > 0 AND name IS candidate_symbols.name
+)
+ORDER BY position;
+"""
+CLEAR_CANDIDATE_SYMBOLS_QUERY = """
+DELETE FROM candidate_symbols;
+"""
+
+# History rows superseded by a later version of their (author, canonical_signature), which are either beyond its newest
+# ?4 versions (when positive), or older than ?5. Paged by key, after (?1, ?2, ?3), each row is tested against the index
+# so that a page is found without numbering the versions of the whole table.
+GET_SUPERSEDED_SYMBOLS_PAGE_QUERY = """
+SELECT author, canonical_signature, timestamp
+FROM symbols AS history
+WHERE (author, canonical_signature, timestamp) > (?1, ?2, ?3)
+  AND EXISTS (SELECT 1 FROM symbols
+              WHERE author = history.author AND canonical_signature = history.canonical_signature
+                AND timestamp > history.timestamp)
+  AND ((?4 > 0 AND EXISTS (SELECT 1 FROM symbols
+                           WHERE author = history.author AND canonical_signature = history.canonical_signature
+                             AND timestamp > history.timestamp
+                           ORDER BY timestamp
+                           LIMIT 1 OFFSET ?4 - 1))
+       OR timestamp < ?5)
+ORDER BY author, canonical_signature, timestamp
+LIMIT ?6;
+"""
+PAGE_COUNT_QUERY = """
+PRAGMA page_count;
+"""
+FREELIST_COUNT_QUERY = """
+PRAGMA freelist_count;
+"""
+PAGE_SIZE_QUERY = """
+PRAGMA page_size;
+"""
+# Pragma arguments can't be bound
+INCREMENTAL_VACUUM_QUERY = """
+PRAGMA incremental_vacuum(%d);
+"""
+WAL_CHECKPOINT_QUERY = """
+PRAGMA wal_checkpoint(PASSIVE);
+"""
+
+CREATE_METADATA_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS metadata (
+    property TEXT,
+    value TEXT,
+    PRIMARY KEY (property)
+);"""
+WRITE_METADATA_PROPERTY_QUERY = """
+REPLACE INTO metadata(property, value) VALUES (?, ?);
+"""
+READ_METADATA_PROPERTY_QUERY = """
+SELECT value FROM metadata WHERE property = ?;
+"""
+
+SCHEMA_VERSION_PROPERTY = 'schema_version'
+# Each migration is a list of statements, migration i upgrades the schema from version i to version i + 1.
+# Migrations are append-only: never modify a migration that was already released.
+SCHEMA_MIGRATIONS = [
+    # Materialized latest symbols
+    [CREATE_LATEST_SYMBOLS_TABLE_QUERY, CREATE_LATEST_SYMBOLS_INSERT_TRIGGER_QUERY,
+     CREATE_LATEST_SYMBOLS_DELETE_TRIGGER_QUERY, POPULATE_LATEST_SYMBOLS_QUERY],
+    # Covering indexes for GET_SYMBOLS_QUERY & GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY
+    [CREATE_LATEST_SYMBOLS_TIMESTAMP_INDEX_QUERY, CREATE_LATEST_SYMBOLS_CANONICAL_SIGNATURE_INDEX_QUERY],
+    # Sequence numbers of latest symbols
+    [ADD_LATEST_SYMBOLS_SEQ_COLUMN_QUERY, POPULATE_LATEST_SYMBOLS_SEQ_QUERY, INITIALIZE_SEQUENCE_QUERY,
+     DROP_LATEST_SYMBOLS_INSERT_TRIGGER_QUERY, DROP_LATEST_SYMBOLS_DELETE_TRIGGER_QUERY,
+     CREATE_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY, CREATE_LATEST_SYMBOLS_SEQ_DELETE_TRIGGER_QUERY,
+     CREATE_LATEST_SYMBOLS_SEQ_PAGE_INDEX_QUERY],
+]
@@ -1,8 +1,58 @@
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 
 
 class SqliteAdapterABC(object):
     __metaclass__ = ABCMeta
+    # Prepared statements are cached by their SQL text, up to this many per connection
+    MAX_CACHED_STATEMENTS = 128
+
+    _transaction_depth = 0
+
+    @property
+    def in_transaction(self):
+        # type: () -> bool
+        return self._transaction_depth > 0
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        # Statements executed within are committed (or rolled back, on an exception) together, rather than each on
+        # its own. Transactions within a transaction are part of it. Immediate transactions take the database's write
+        # lock upfront, deferred ones (e.g. only reading the database, and writing temporary tables) take it once
+        # they write the database.
+        if self._transaction_depth > 0:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._begin(immediate)
+        self._transaction_depth = 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_depth = 0
+            self._rollback()
+            raise
+        self._transaction_depth = 0
+        self._commit()
+
+    @abstractmethod
+    def _begin(self, immediate):
+        # type: (bool) -> None
+        raise NotImplementedError
+
+    @abstractmethod
+    def _commit(self):
+        # type: () -> None
+        raise NotImplementedError
+
+    @abstractmethod
+    def _rollback(self):
+        # type: () -> None
+        raise NotImplementedError
 
     @abstractmethod
     def execute(self, statement, *arguments):
@@ -0,0 +1,35 @@
+from collections import OrderedDict
+
+
+class StatementCache(object):
+    # Prepared statements by their SQL text, up to `max_size` of them. The least recently used statement is closed to
+    # make room for a new one.
+    def __init__(self, max_size, prepare, close):
+        # type: (int, callable, callable) -> None
+        self._max_size = max_size
+        self._prepare = prepare
+        self._close = close
+        self._statements = OrderedDict()  # type: OrderedDict[str, object]
+
+    def get(self, statement):
+        # type: (str) -> object
+        stmt = self._statements.pop(statement, None)
+        if stmt is None:
+            stmt = self._prepare(statement)
+            if len(self._statements) >= self._max_size:
+                _, evicted = self._statements.popitem(last=False)
+                self._close(evicted)
+        self._statements[statement] = stmt
+        return stmt
+
+    def __len__(self):
+        return len(self._statements)
+
+    def __contains__(self, statement):
+        return statement in self._statements
+
+    def clear(self):
+        # type: () -> None
+        for stmt in self._statements.values():
+            self._close(stmt)
+        self._statements.clear()
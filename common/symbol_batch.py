@@ -0,0 +1,126 @@
+from .dataclass import Dataclass
+from .symbol import Symbol, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_CLASS
+
+
+MEMBER_SEPARATOR = '->'
+
+
+def signature_symbol_type(canonical_signature):
+    # type: (str) -> int
+    # The type of symbol a canonical signature is of (Lcls;, Lcls;->method(Args)Ret or Lcls;->field:Type)
+    separator = canonical_signature.find(MEMBER_SEPARATOR)
+    if separator < 0:
+        return SYMBOL_TYPE_CLASS
+    return SYMBOL_TYPE_METHOD if canonical_signature.find('(', separator) >= 0 else SYMBOL_TYPE_FIELD
+
+
+class SymbolBatch(Dataclass):
+    # A columnar list of symbols, sharing a string table for the class descriptors of their canonical signatures
+    # (methods and fields are encoded as L<class>;->shortId) and for their authors.
+    # Symbol objects are only built when accessed.
+    def __init__(self, classes, authors, symbol_types, class_indexes, members, names, timestamps, author_indexes):
+        # type: (list[str], list[str], list[int], list[int], list[str], list[str], list[int], list[int]) -> None
+        self.classes = classes
+        self.authors = authors
+        self.symbol_types = symbol_types
+        self.class_indexes = class_indexes
+        self.members = members  # type: list[str | None]
+        self.names = names
+        self.timestamps = timestamps
+        self.author_indexes = author_indexes
+
+    @staticmethod
+    def from_symbols(symbols):
+        # type: (iter[Symbol]) -> SymbolBatch
+        if isinstance(symbols, SymbolBatch):
+            return symbols
+
+        classes, class_table = [], {}
+        authors, author_table = [], {}
+        symbol_types, class_indexes, members, names, timestamps, author_indexes = [], [], [], [], [], []
+        for symbol in symbols:
+            cls, separator, member = symbol.canonical_signature.partition(MEMBER_SEPARATOR)
+            if cls not in class_table:
+                class_table[cls] = len(classes)
+                classes.append(cls)
+            if symbol.author not in author_table:
+                author_table[symbol.author] = len(authors)
+                authors.append(symbol.author)
+
+            symbol_types.append(symbol.symbol_type)
+            class_indexes.append(class_table[cls])
+            members.append(member if separator else None)
+            names.append(symbol.name)
+            timestamps.append(symbol.timestamp)
+            author_indexes.append(author_table[symbol.author])
+
+        return SymbolBatch(classes, authors, symbol_types, class_indexes, members, names, timestamps, author_indexes)
+
+    @staticmethod
+    def concatenate(batches):
+        # type: (list[SymbolBatch]) -> SymbolBatch
+        batches = [SymbolBatch.from_symbols(batch) for batch in batches]
+        if len(batches) == 1:
+            return batches[0]
+
+        classes, class_table = [], {}
+        authors, author_table = [], {}
+        class_indexes, author_indexes = [], []
+        for batch in batches:
+            class_mapping = []
+            for cls in batch.classes:
+                if cls not in class_table:
+                    class_table[cls] = len(classes)
+                    classes.append(cls)
+                class_mapping.append(class_table[cls])
+
+            author_mapping = []
+            for author in batch.authors:
+                if author not in author_table:
+                    author_table[author] = len(authors)
+                    authors.append(author)
+                author_mapping.append(author_table[author])
+
+            class_indexes.extend(class_mapping[i] for i in batch.class_indexes)
+            author_indexes.extend(author_mapping[i] for i in batch.author_indexes)
+
+        return SymbolBatch(classes, authors,
+                           [symbol_type for batch in batches for symbol_type in batch.symbol_types],
+                           class_indexes,
+                           [member for batch in batches for member in batch.members],
+                           [name for batch in batches for name in batch.names],
+                           [timestamp for batch in batches for timestamp in batch.timestamps],
+                           author_indexes)
+
+    def canonical_signature(self, i):
+        # type: (int) -> str
+        cls = self.classes[self.class_indexes[i]]
+        member = self.members[i]
+        return cls if member is None else cls + MEMBER_SEPARATOR + member
+
+    def stamped(self, timestamp, author):
+        # type: (int, str) -> SymbolBatch
+        # Equivalent to `symbol.timestamped.authored(author)` for all symbols, without building them
+        return self.clone(timestamps=[timestamp] * len(self), authors=[author], author_indexes=[0] * len(self))
+
+    @property
+    def rows(self):
+        # type: () -> list[tuple[str, int, str, str, int]]
+        # (author, symbol_type, canonical_signature, name, timestamp) of all symbols
+        return [(self.authors[self.author_indexes[i]], self.symbol_types[i], self.canonical_signature(i),
+                 self.names[i], self.timestamps[i]) for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.symbol_types)
+
+    def __getitem__(self, i):
+        # type: (int) -> Symbol
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        return Symbol(self.symbol_types[i], self.canonical_signature(i), self.names[i],
+                      timestamp=self.timestamps[i], author=self.authors[self.author_indexes[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
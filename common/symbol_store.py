@@ -2,9 +2,21 @@ from abc import ABCMeta, abstractmethod
 
 from common.sqlite_adapter import SqliteAdapterABC
 from common.symbol import Symbol
+from common.symbol_batch import SymbolBatch
 from common.sql_queries import (CREATE_SYMBOLS_TABLE_QUERY, PUSH_SYMBOLS_QUERY, GET_SYMBOLS_QUERY,
-                                GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY, GET_SYMBOLS_AUTHOR_QUERY,
-                                GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY, DELETE_SYMBOLS_QUERY)
+                                GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY, GET_SYMBOLS_AUTHOR_QUERY, GET_SYMBOLS_PAGE_QUERY,
+                                GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY, DELETE_SYMBOLS_QUERY,
+                                CREATE_METADATA_TABLE_QUERY, WRITE_METADATA_PROPERTY_QUERY,
+                                READ_METADATA_PROPERTY_QUERY, SCHEMA_VERSION_PROPERTY, SCHEMA_MIGRATIONS,
+                                GET_SEQUENCE_QUERY, GET_SYMBOLS_SEQ_PAGE_QUERY, GET_SUPERSEDED_SYMBOLS_PAGE_QUERY,
+                                PAGE_COUNT_QUERY, FREELIST_COUNT_QUERY, PAGE_SIZE_QUERY, INCREMENTAL_VACUUM_QUERY,
+                                WAL_CHECKPOINT_QUERY, CREATE_REPLICATED_CHANGES_VIEW_QUERY,
+                                CREATE_REPLICATED_CHANGES_TRIGGER_QUERY, APPLY_REPLICATED_CHANGES_QUERY,
+                                CLEAR_LATEST_SYMBOLS_QUERY, CLEAR_SYMBOLS_QUERY, RESET_SEQUENCE_QUERY,
+                                CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY, INSERT_CANDIDATE_SIGNATURE_QUERY,
+                                GET_CANDIDATE_SYMBOLS_QUERY, CLEAR_CANDIDATE_SIGNATURES_QUERY,
+                                CREATE_CANDIDATE_SYMBOLS_TABLE_QUERY, INSERT_CANDIDATE_SYMBOL_QUERY,
+                                GET_CHANGED_CANDIDATE_SYMBOLS_QUERY, CLEAR_CANDIDATE_SYMBOLS_QUERY)
 
 
 class SymbolStoreABC(object):
@@ -18,24 +30,61 @@ class SymbolStoreABC(object):
 
     def initialize_database(self):
         self._conn.execute(CREATE_SYMBOLS_TABLE_QUERY)
+        self._conn.execute(CREATE_METADATA_TABLE_QUERY)
+
+        # `latest_symbols` materializes the latest row of every (author, canonical_signature) in `symbols`,
+        # and is kept up to date by triggers (within the same transaction as the history table)
+        self.migrate(SCHEMA_MIGRATIONS)
+
+    @property
+    def schema_version(self):
+        # type: () -> int
+        return int(self.get_metadata_property(SCHEMA_VERSION_PROPERTY) or 0)
+
+    def migrate(self, migrations):
+        # type: (list[list[str]]) -> None
+        version = self.schema_version
+        if version > len(migrations):
+            raise EnvironmentError("Database schema version %d is newer than supported version %d" %
+                                   (version, len(migrations)))
+
+        # Each migration is applied along with its version, or not at all
+        for version, statements in enumerate(migrations[version:], version + 1):
+            with self._conn.transaction():
+                for statement in statements:
+                    self._conn.execute(statement)
+                self.set_metadata_property(SCHEMA_VERSION_PROPERTY, str(version))
 
     @abstractmethod
     def connect(self, path):
         # type: (str) -> SqliteAdapterABC
         raise NotImplementedError
 
+    def transaction(self):
+        # Groups the store's operations within into a single transaction
+        return self._conn.transaction()
+
     def changed_symbols(self, symbols):
         # type: (iter[Symbol]) -> iter[Symbol]
-        for symbol in symbols:
-            existing_symbols = list(self.get_symbols(canonical_signature=symbol.canonical_signature,
-                                                     author=symbol.author))
+        # The symbols which are new, or named differently than the latest symbol of their author & signature (in
+        # order), diffed by a single query
+        symbols = list(symbols)
+        if not symbols:
+            return
+
+        # Only the temporary table is written, so the transaction needn't take the database's write lock
+        self._conn.execute(CREATE_CANDIDATE_SYMBOLS_TABLE_QUERY)
+        with self._conn.transaction(immediate=False):
+            try:
+                self._conn.executemany(INSERT_CANDIDATE_SYMBOL_QUERY,
+                                       [(position, symbol.author, symbol.canonical_signature, symbol.name)
+                                        for position, symbol in enumerate(symbols)])
+                positions = list(self._conn.execute_query(GET_CHANGED_CANDIDATE_SYMBOLS_QUERY))
+            finally:
+                self._conn.execute(CLEAR_CANDIDATE_SYMBOLS_QUERY)
 
-            if len(existing_symbols) == 0:
-                yield symbol
-            else:
-                existing_symbol, = existing_symbols
-                if symbol.name != existing_symbol.name:
-                    yield symbol
+        for position, in positions:
+            yield symbols[position]
 
     def push_symbol(self, symbol):
         # type: (Symbol) -> None
@@ -43,10 +92,18 @@ class SymbolStoreABC(object):
         return self._conn.execute_update(PUSH_SYMBOLS_QUERY, *row)
 
     def push_symbols(self, symbols):
-        # type: (iter[Symbol]) -> None
-        batch = [(symbol.author, symbol.symbol_type, symbol.canonical_signature, symbol.name, symbol.timestamp)
-                 for symbol in symbols]
-        return self._conn.executemany(PUSH_SYMBOLS_QUERY, batch)
+        # type: (iter[Symbol] | SymbolBatch) -> None
+        if isinstance(symbols, SymbolBatch):
+            batch = symbols.rows
+        else:
+            batch = [(symbol.author, symbol.symbol_type, symbol.canonical_signature, symbol.name, symbol.timestamp)
+                     for symbol in symbols]
+        return self.push_rows(batch)
+
+    def push_rows(self, rows):
+        # type: (list[tuple[str, int, str, str, int]]) -> None
+        # (author, symbol_type, canonical_signature, name, timestamp) rows, as of `SymbolBatch.rows`
+        return self._conn.executemany(PUSH_SYMBOLS_QUERY, rows)
 
     def get_symbols(self, canonical_signature=None, author=None, since=0):
         # type: (str | None, str | None, int) -> iter[Symbol]
@@ -61,11 +118,149 @@ class SymbolStoreABC(object):
                                                canonical_signature, author, since)
 
         for row in results:  # noqa
-            if all(x is None for x in row):
-                continue
+            yield self._row_to_symbol(row)
+
+    def get_symbols_of(self, canonical_signatures):
+        # type: (iter[str]) -> dict[str, list[Symbol]]
+        # The symbols `get_symbols(canonical_signature=...)` returns for each of the signatures (that has any), at once
+        symbols = {}
+        for row in self.query_candidate_signatures(GET_CANDIDATE_SYMBOLS_QUERY, canonical_signatures):
+            symbol = self._row_to_symbol(row)
+            symbols.setdefault(symbol.canonical_signature, []).append(symbol)
+        return symbols
+
+    def query_candidate_signatures(self, query, canonical_signatures):
+        # type: (str, iter[str]) -> list
+        # Runs a query joining against the `candidate_signatures` temporary table, holding the given signatures
+        self._conn.execute(CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY)
+        with self._conn.transaction():
+            try:
+                self._conn.executemany(INSERT_CANDIDATE_SIGNATURE_QUERY,
+                                       [(canonical_signature, ) for canonical_signature in canonical_signatures])
+                return list(self._conn.execute_query(query))
+            finally:
+                self._conn.execute(CLEAR_CANDIDATE_SIGNATURES_QUERY)
+
+    def get_symbols_page(self, since=0, after=None, limit=1000):
+        # type: (int, tuple[str, str] | None, int) -> list[Symbol]
+        # Pages are ordered by (author, canonical_signature), `after` is the key of the last symbol of the previous page
+        after_author, after_canonical_signature = after if after is not None else ('', '')
+        results = self._conn.execute_query(GET_SYMBOLS_PAGE_QUERY, since, after_author, after_canonical_signature,
+                                           limit)
+        return [self._row_to_symbol(row) for row in results]
+
+    @property
+    def sequence(self):
+        # type: () -> int
+        # Sequence number of the latest change
+        results = list(self._conn.execute_query(GET_SEQUENCE_QUERY))
+        return int(results[0][0]) if results else 0
+
+    def get_symbols_seq_page(self, after=0, limit=1000):
+        # type: (int, int) -> tuple[list[Symbol], int]
+        # Symbols changed after sequence number `after` (in order of change), and the sequence number of the last one
+        results = list(self._conn.execute_query(GET_SYMBOLS_SEQ_PAGE_QUERY, after, limit))
+        if results:
+            after = results[-1][-1]
+        return [self._row_to_symbol(row[:-1]) for row in results], after
+
+    def get_changes_page(self, after=0, limit=1000):
+        # type: (int, int) -> tuple[list[Symbol], list[int]]
+        # Like `get_symbols_seq_page`, but with the sequence number of each change
+        results = list(self._conn.execute_query(GET_SYMBOLS_SEQ_PAGE_QUERY, after, limit))
+        return [self._row_to_symbol(row[:-1]) for row in results], [row[-1] for row in results]
+
+    def apply_changes(self, symbols, sequences, reset=False):
+        # type: (iter[Symbol] | SymbolBatch, list[int], bool) -> None
+        # Applies changes replicated from another store (in the order it made them), so that they get the same
+        # sequence numbers here. With `reset`, the store is cleared first (within the same transaction).
+        self._conn.execute(CREATE_REPLICATED_CHANGES_VIEW_QUERY)
+        self._conn.execute(CREATE_REPLICATED_CHANGES_TRIGGER_QUERY)
+
+        if isinstance(symbols, SymbolBatch):
+            rows = symbols.rows
+        else:
+            rows = [(symbol.author, symbol.symbol_type, symbol.canonical_signature, symbol.name, symbol.timestamp)
+                    for symbol in symbols]
+        with self._conn.transaction():
+            if reset:
+                self.clear()
+            self._conn.executemany(APPLY_REPLICATED_CHANGES_QUERY,
+                                   [tuple(row) + (sequence,) for row, sequence in zip(rows, sequences)])
+
+    def clear(self):
+        # type: () -> None
+        # Deletes every symbol, restarting the sequence (without assigning the deletions sequence numbers)
+        with self._conn.transaction():
+            self._conn.execute(CLEAR_LATEST_SYMBOLS_QUERY)
+            self._conn.execute(CLEAR_SYMBOLS_QUERY)
+            self._conn.execute(RESET_SEQUENCE_QUERY)
+
+    @staticmethod
+    def _row_to_symbol(row):
+        # type: (tuple) -> Symbol
+        author, symbol_type, canonical_signature, name, timestamp = row
+        return Symbol(symbol_type, canonical_signature, name, timestamp=timestamp, author=author)
+
+    def get_superseded_symbols(self, keep_versions=0, before=0, after=None, limit=1000):
+        # type: (int, int, tuple[str, str, int] | None, int) -> list[tuple[str, str, int]]
+        # Keys of history rows which aren't among the latest `keep_versions` (if given) of their symbol, or are older
+        # than `before`; the latest version of a symbol is never included. Pages are ordered by key, `after` is the
+        # last key of the previous page.
+        after_author, after_canonical_signature, after_timestamp = after if after is not None else ('', '', -1)
+        results = self._conn.execute_query(GET_SUPERSEDED_SYMBOLS_PAGE_QUERY, after_author, after_canonical_signature,
+                                           after_timestamp, keep_versions, before, limit)
+        return [tuple(row) for row in results]
+
+    def delete_history(self, keys):
+        # type: (list[tuple[str, str, int]]) -> None
+        # Deletes superseded versions of symbols by their (author, canonical_signature, timestamp), keys of latest
+        # versions are ignored
+        self._conn.executemany(DELETE_SYMBOLS_QUERY, keys)
+
+    def _pragma(self, query):
+        # type: (str) -> int
+        results = list(self._conn.execute_query(query))
+        return results[0][0] if results else 0
+
+    @property
+    def used_bytes(self):
+        # type: () -> int
+        # Size of the database's pages which are in use
+        return (self._pragma(PAGE_COUNT_QUERY) - self._pragma(FREELIST_COUNT_QUERY)) * self._pragma(PAGE_SIZE_QUERY)
+
+    @property
+    def free_bytes(self):
+        # type: () -> int
+        # Size of the database's free pages, which a vacuum would return to the filesystem
+        return self._pragma(FREELIST_COUNT_QUERY) * self._pragma(PAGE_SIZE_QUERY)
+
+    @property
+    def file_bytes(self):
+        # type: () -> int
+        return self._pragma(PAGE_COUNT_QUERY) * self._pragma(PAGE_SIZE_QUERY)
+
+    def incremental_vacuum(self, pages):
+        # type: (int) -> None
+        # Returns up to `pages` free pages to the filesystem (only for databases created with incremental auto vacuum)
+        list(self._conn.execute_query(INCREMENTAL_VACUUM_QUERY % pages))
+
+    def checkpoint(self):
+        # type: () -> None
+        # Copies the write-ahead log into the database, without waiting for readers
+        list(self._conn.execute_query(WAL_CHECKPOINT_QUERY))
+
+    def set_metadata_property(self, prop, value):
+        # type: (str, str) -> None
+        self._conn.execute(WRITE_METADATA_PROPERTY_QUERY, prop, value)
 
-            author, symbol_type, canonical_signature, name, timestamp, _ = row
-            yield Symbol(symbol_type, canonical_signature, name, timestamp=timestamp, author=author)
+    def get_metadata_property(self, prop):
+        # type: (str) -> str | None
+        results = list(self._conn.execute_query(READ_METADATA_PROPERTY_QUERY, prop))
+        if len(results) == 0:
+            return None
+        else:
+            return results[0][0]
 
     def close(self):
         self._conn.close()
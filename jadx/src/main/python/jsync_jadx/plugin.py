@@ -18,7 +18,8 @@ from .config import JSYNC_JADX_ROOT
 from java_common.update_listener import JavaUpdateListener
 from java_common.sqlite_adapter import SqliteAdapter
 from java_common.wrappers import ThreadWrapper
-from common.commands import FullSyncRequest, Subscribe
+from common.commands import Subscribe
+from client_base.update_listener import full_sync_request
 from client_base.server_query import query_server
 from jsync_cache import INSTANCES
 
@@ -55,6 +56,7 @@ class JSync(object):
 
         if self._rename_listener is not None:
             self._rename_listener.stop()
+            self._rename_listener.close()
             self._rename_listener = None
         if self._update_thread is not None:
             self._update_thread.interrupt()
@@ -119,10 +121,9 @@ class JSync(object):
                 project = project_id(dex_reader)
                 projects.append(project)
 
-                self._connection.send_packet(Subscribe(project).encode())
+                self._connection.send_command(Subscribe(project))
 
-                last_sync = int(self._rename_engine.get_metadata_property(project, 'last_sync') or 0)
-                self._connection.send_packet(FullSyncRequest(project, last_sync).encode())
+                self._connection.send_command(full_sync_request(self._connection, self._rename_engine, project))
 
         self._update_thread = Thread(JavaUpdateListener(self._connection, projects, self._rename_engine))
         self._update_thread.start()
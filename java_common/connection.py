@@ -1,21 +1,33 @@
 import struct
+from threading import Lock
 
 import jarray
-from java.io import DataInputStream, BufferedOutputStream
+from java.io import DataInputStream, BufferedOutputStream, EOFException
 from org.python.core.util import StringUtil
-from java.net import Socket, SocketException
+from java.net import Socket, SocketException, SocketTimeoutException
 
 from client_base.connection import ConnectionABC, ConnectionError
-from common.consts import PACKET_SIZE_FORMAT
+from common.codecs import CODECS, BINARY_CODEC, JSON_CODEC
+from common.commands import Handshake, HandshakeResponse
+from common.compression import COMPRESSIONS, compress_packet, packet_size, decompress_packet
+from common.consts import PACKET_SIZE_FORMAT, PROTOCOL_VERSION
 
 
 class JavaConnection(ConnectionABC):
+    # Servers predating the handshake never answer it (failing on the unknown command), so a connection whose
+    # handshake isn't answered within this many milliseconds is reopened without one
+    HANDSHAKE_TIMEOUT_MILLIS = 5000
+
     def __init__(self, host, port, name):
         # type: (str, int, str) -> None
         ConnectionABC.__init__(self, host, port)
         self.name = name
         self._socket = Socket(host, port)
         self._active = True
+        # Packets are sent by several threads (e.g. the rename outbox's and the update listener's)
+        self._send_lock = Lock()
+        # Negotiated with the server during the handshake
+        self.compression = None
 
         self.initialize()
 
@@ -23,6 +35,35 @@ class JavaConnection(ConnectionABC):
         # type: () -> None
         self.send_packet(self.name)
 
+        # The handshake itself is always JSON encoded
+        self.send_command(Handshake(PROTOCOL_VERSION, [BINARY_CODEC.name, JSON_CODEC.name], COMPRESSIONS))
+        self._socket.setSoTimeout(self.HANDSHAKE_TIMEOUT_MILLIS)
+        try:
+            response = self.recv_command()
+        except (SocketTimeoutException, EOFException, ConnectionError):
+            self._initialize_legacy()
+            return
+        self._socket.setSoTimeout(0)
+        if not isinstance(response, HandshakeResponse) or response.codec not in CODECS:
+            self.close()
+            raise ConnectionError("Unexpected handshake response")
+
+        self.codec = CODECS[response.codec]
+        self.server_version = response.version
+        self.compression = response.compression if response.compression in COMPRESSIONS else None
+
+    def _initialize_legacy(self):
+        # type: () -> None
+        # Servers predating the handshake are sent nothing but the name, speaking JSON from then on
+        self._socket.close()
+        self._socket = Socket(self.host, self.port)
+        self._active = True
+        self.send_packet(self.name)
+
+        self.codec = JSON_CODEC
+        self.server_version = 0
+        self.compression = None
+
     @property
     def active(self):
         # type: () -> bool
@@ -42,8 +83,8 @@ class JavaConnection(ConnectionABC):
     def recv_packet(self):
         # type: () -> bytes
         x = self._recv_fully(struct.calcsize(PACKET_SIZE_FORMAT))
-        size = struct.unpack(PACKET_SIZE_FORMAT, x)[0]
-        return self._recv_fully(size)
+        size, compressed = packet_size(struct.unpack(PACKET_SIZE_FORMAT, x)[0])
+        return decompress_packet(self._recv_fully(size), compressed)
 
     def _send_fully(self, data):
         # type: (Socket, bytes) -> None
@@ -57,8 +98,10 @@ class JavaConnection(ConnectionABC):
 
     def send_packet(self, data):
         # type: (Socket, bytes) -> None
-        self._send_fully(struct.pack(PACKET_SIZE_FORMAT, len(data)))
-        self._send_fully(data)
+        size_field, data = compress_packet(data, self.compression)
+        # The size and data are written (and flushed) at once
+        with self._send_lock:
+            self._send_fully(struct.pack(PACKET_SIZE_FORMAT, size_field) + data)
 
     def close(self, on_exception=False):
         # type: (bool) -> None
@@ -2,18 +2,21 @@ import base64
 
 from java.net import URL, URLClassLoader
 from java.lang import Class, ClassLoader
-from java.sql import DriverManager, PreparedStatement
+from java.sql import DriverManager, PreparedStatement, ResultSet
 from java.util import Properties
 from java.sql import Types as SqlTypes
 
 import os
 import contextlib
-from functools import partial
+from threading import RLock
 
 from client_base.config import JSYNC_ROOT
+from client_base.resources import fetch_resource, resource_is_fresh, record_sha256, recorded_sha256, file_sha256
 from java_common.connection import JavaConnection
 from common.sqlite_adapter import SqliteAdapterABC
-from common.commands import Command, ResourceRequest, ResourceResponse
+from common.statement_cache import StatementCache
+from common.commands import ResourceRequest, ResourceResponse
+from common.consts import RESOURCE_CHUNK_PROTOCOL_VERSION
 
 
 SQLITE_JDBC_PATH = os.path.join(JSYNC_ROOT, 'resources', 'sqlite-jdbc.jar')
@@ -22,13 +25,21 @@ SLF4J_PATH = os.path.join(JSYNC_ROOT, 'resources', 'slf4j.jar')
 SQLITE_JDBC_JAR = URL("file:%s" % SQLITE_JDBC_PATH)
 SLF4J_JAR = URL("file:%s" % SLF4J_PATH)
 
-
-@contextlib.contextmanager
-def auto_commit(connection, value):
-    ac = connection.autoCommit
-    connection.setAutoCommit(value)
-    yield
-    connection.setAutoCommit(ac)
+# Setters of statement parameters (by the argument's type) and getters of result columns (by the column's type, as
+# reported for each result set - the driver reports expression columns' by their values, e.g. NULL, which are read as
+# objects)
+PARAMETER_SETTERS = {
+    str: PreparedStatement.setString,
+    unicode: PreparedStatement.setString,
+    int: PreparedStatement.setInt,
+    float: PreparedStatement.setFloat,
+}
+COLUMN_GETTERS = {
+    SqlTypes.VARCHAR: ResultSet.getString,
+    SqlTypes.INTEGER: ResultSet.getInt,
+    SqlTypes.FLOAT: ResultSet.getFloat,
+    SqlTypes.NUMERIC: ResultSet.getFloat,
+}
 
 
 class SqliteAdapter(SqliteAdapterABC):
@@ -41,12 +52,25 @@ class SqliteAdapter(SqliteAdapterABC):
         driver = sqlite_driver()
 
         self._conn = driver.connect('jdbc:sqlite:%s' % path, Properties())
+        # Prepared statements by their SQL text, and column getters by the column types of result sets
+        self._statements = StatementCache(self.MAX_CACHED_STATEMENTS, self._conn.prepareStatement,
+                                          PreparedStatement.close)
+        self._columns = {}  # type: dict[tuple, list]
+        # The connection is shared by the plugin's threads, and each statement may only be used by one at a time.
+        # Transactions hold the lock throughout, so other threads' statements aren't made part of them.
+        self._lock = RLock()
 
     @staticmethod
     def ensure_jars(connection):
         # type: (JavaConnection) -> None
         targets = [SQLITE_JDBC_PATH, SLF4J_PATH]
-        if all(os.path.exists(path) for path in targets):
+        if connection is None:
+            if all(os.path.exists(path) for path in targets):
+                return
+            raise EnvironmentError("Couldn't find JARs required for SQLite Driver")
+
+        # The server is only asked about JARs which are missing, changed locally or weren't checked in a while
+        if all(resource_is_fresh(path) for path in targets):
             return
 
         resource_dir = os.path.join(JSYNC_ROOT, 'resources')
@@ -54,85 +78,132 @@ class SqliteAdapter(SqliteAdapterABC):
             os.makedirs(resource_dir)
 
         connection = JavaConnection(connection.host, connection.port, connection.name)
-
-        for path in targets:
-            if not os.path.exists(path):
-                if connection is None:
-                    raise EnvironmentError("Couldn't find JARs required for SQLite Driver")
-
+        try:
+            for path in targets:
                 base_name = os.path.basename(path)
-                print("[JSync] Downloading %s" % base_name)
+                if connection.server_version >= RESOURCE_CHUNK_PROTOCOL_VERSION:
+                    # Sends the hash of the existing JAR, so it's only downloaded if it changed
+                    if fetch_resource(connection, path):
+                        print("[JSync] Download of %s is complete!" % base_name)
+                elif not os.path.exists(path):
+                    SqliteAdapter.download_jar(connection, path)
+                    record_sha256(path, file_sha256(path))
+                else:
+                    # Servers predating chunked resources can't tell whether the JAR changed
+                    record_sha256(path, recorded_sha256(path) or file_sha256(path))
+        finally:
+            connection.close()
 
-                connection.send_packet(ResourceRequest(base_name).encode())
-                command = Command.decode(connection.recv_packet())
-                if not isinstance(command, ResourceResponse) or command.name != base_name:
-                    raise TypeError("Unexpected response for ResourceRequest")
+    @staticmethod
+    def download_jar(connection, path):
+        # type: (JavaConnection, str) -> None
+        # For servers predating chunked resources
+        base_name = os.path.basename(path)
+        print("[JSync] Downloading %s" % base_name)
+
+        connection.send_command(ResourceRequest(base_name))
+        command = connection.recv_command()
+        if not isinstance(command, ResourceResponse) or command.name != base_name:
+            raise TypeError("Unexpected response for ResourceRequest")
 
-                if command.content is None:
-                    raise EnvironmentError("Couldn't find JARs required for SQLite Driver")
+        if command.content is None:
+            raise EnvironmentError("Couldn't find JARs required for SQLite Driver")
 
-                content = base64.b64decode(command.content)
-                with open(path, 'wb') as f:
-                    f.write(content)
+        content = base64.b64decode(command.content)
+        with open(path, 'wb') as f:
+            f.write(content)
 
-                print("[JSync] Download of %s is complete!" % base_name)
+        print("[JSync] Download of %s is complete!" % base_name)
 
     @staticmethod
     def push_arguments(prepared_statement, *arguments):
         # type: (PreparedStatement, *object) -> None
-        funcs = {
-            str: prepared_statement.setString,
-            unicode: prepared_statement.setString,
-            int: prepared_statement.setInt,
-            float: prepared_statement.setFloat,
-        }
-
         for i, arg in enumerate(arguments):
-            if type(arg) not in funcs:
+            if arg is None:
+                prepared_statement.setNull(i + 1, SqlTypes.NULL)
+                continue
+
+            setter = PARAMETER_SETTERS.get(type(arg))
+            if setter is None:
                 raise TypeError('Unhandled type %s for Java SQLite parameter' % type(arg))
 
-            funcs[type(arg)](i + 1, arg)
+            setter(prepared_statement, i + 1, arg)
+
+    def _column_getters(self, results):
+        # type: (ResultSet) -> list
+        metadata = results.metaData
+        column_types = tuple(metadata.getColumnType(i + 1) for i in range(metadata.columnCount))
+        columns = self._columns.get(column_types)
+        if columns is None:
+            columns = self._columns[column_types] = [(COLUMN_GETTERS.get(column_type, ResultSet.getObject), i + 1)
+                                                     for i, column_type in enumerate(column_types)]
+        return columns
+
+    @contextlib.contextmanager
+    def transaction(self, immediate=True):
+        with self._lock:
+            with SqliteAdapterABC.transaction(self, immediate):
+                yield
+
+    def _begin(self, immediate):
+        # type: (bool) -> None
+        # Begun explicitly (the connection staying in auto-commit mode), as the driver's transactions are all of the
+        # same mode
+        self.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN DEFERRED')
+
+    def _commit(self):
+        # type: () -> None
+        self.execute('COMMIT')
+
+    def _rollback(self):
+        # type: () -> None
+        self.execute('ROLLBACK')
 
     def execute(self, statement, *arguments):
         # type: (str, *object) -> None
-        stmt = self._conn.prepareStatement(statement)
-        self.push_arguments(stmt, *arguments)
-        stmt.execute()
+        with self._lock:
+            stmt = self._statements.get(statement)
+            self.push_arguments(stmt, *arguments)
+            stmt.execute()
 
     def execute_update(self, statement, *arguments):
         # type: (str, *object) -> int
-        stmt = self._conn.prepareStatement(statement)
-        self.push_arguments(stmt, *arguments)
-        return stmt.executeUpdate()
+        with self._lock:
+            stmt = self._statements.get(statement)
+            self.push_arguments(stmt, *arguments)
+            return stmt.executeUpdate()
 
     def execute_query(self, statement, *arguments):
         # type: (str, *object) -> list
-        stmt = self._conn.prepareStatement(statement)
-        self.push_arguments(stmt, *arguments)
-        results = stmt.executeQuery()
-
-        metadata = results.metaData
-        funcs = {
-            SqlTypes.VARCHAR: results.getString,
-            SqlTypes.INTEGER: results.getInt,
-            SqlTypes.FLOAT: results.getFloat,
-            SqlTypes.NUMERIC: results.getFloat,
-        }
-        columns = [partial(funcs[metadata.getColumnType(i + 1)], i + 1) for i in range(metadata.columnCount)]
-
-        while results.next():
-            yield [column() for column in columns]
+        # Rows are read in full, so that the result set is closed (and the statement free for reuse) on return
+        with self._lock:
+            stmt = self._statements.get(statement)
+            self.push_arguments(stmt, *arguments)
+            results = stmt.executeQuery()
+            try:
+                columns = self._column_getters(results)
+                rows = []
+                while results.next():
+                    rows.append([getter(results, index) for getter, index in columns])
+                return rows
+            finally:
+                results.close()
 
     def executemany(self, statement, rows):
         # type: (str, list) -> None
-        with auto_commit(self._conn, False):
-            stmt = self._conn.prepareStatement(statement)
-            for row in rows:
-                self.push_arguments(stmt, *row)
-                stmt.addBatch()
-            stmt.executeBatch()
-            self._conn.commit()
+        with self.transaction():
+            stmt = self._statements.get(statement)
+            try:
+                for row in rows:
+                    self.push_arguments(stmt, *row)
+                    stmt.addBatch()
+                stmt.executeBatch()
+            finally:
+                stmt.clearBatch()
 
     def close(self):
         # type: () -> None
-        self._conn.close()
+        with self._lock:
+            self._statements.clear()
+            self._columns.clear()
+            self._conn.close()
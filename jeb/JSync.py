@@ -20,7 +20,8 @@ from .utils import project_id
 from java_common.update_listener import JavaUpdateListener
 from java_common.sqlite_adapter import SqliteAdapter
 from java_common.wrappers import ThreadWrapper
-from common.commands import Subscribe, FullSyncRequest
+from common.commands import Subscribe
+from client_base.update_listener import full_sync_request
 from client_base.server_query import query_server
 
 
@@ -31,6 +32,7 @@ class JSync(IScript):
         self.update_listener_thread = None  # type: Thread
         self.scan_updated_symbols_thread = None  # type: Thread
         self._rename_engine = None  # type: JEBRenameEngine
+        self._rename_listener = None  # type: JEBRenameListener
         self._context = None  # type: IClientContext
         self._initialization_thread = None  # type: Thread
 
@@ -53,6 +55,9 @@ class JSync(IScript):
         if self._initialization_thread is not None:
             self._initialization_thread.interrupt()
             self._initialization_thread = None
+        if self._rename_listener is not None:
+            self._rename_listener.close()
+            self._rename_listener = None
         if self.connection is not None:
             self.connection.close()
             self.connection = None
@@ -98,8 +103,8 @@ class JSync(IScript):
 
         self._rename_engine = JEBRenameEngine(ctx, self.connection.name)
 
-        rename_listener = JEBRenameListener(self, ctx, self.connection, self._rename_engine)
-        rename_listener.start()
+        self._rename_listener = JEBRenameListener(self, ctx, self.connection, self._rename_engine)
+        self._rename_listener.start()
 
         self.scan_updated_symbols_thread = Thread(
             JEBScanUpdatedSymbols(ctx, self.connection, self._rename_engine, list(self._rename_engine.projects.keys()),
@@ -121,10 +126,9 @@ class JSync(IScript):
                     pid = project_id(dex_file)
                     projects.append(pid)
 
-                    self.connection.send_packet(Subscribe(pid).encode())
+                    self.connection.send_command(Subscribe(pid))
 
-                    last_sync = int(self._rename_engine.get_metadata_property(pid, 'last_sync') or 0)
-                    self.connection.send_packet(FullSyncRequest(pid, last_sync).encode())
+                    self.connection.send_command(full_sync_request(self.connection, self._rename_engine, pid))
 
             self.update_listener_thread = Thread(JavaUpdateListener(self.connection, projects, self._rename_engine))
             self.update_listener_thread.start()
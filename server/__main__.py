@@ -2,18 +2,85 @@ import argparse
 import asyncio
 from pathlib import Path
 
+from server.config import ServerConfig, OVERFLOW_POLICIES
 from server.default_symbol_server import DefaultSymbolServer
+from server.logs import setup_logging
+from server.router import SymbolRouter
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog="jsync-server", description="JSync Server")
     parser.add_argument("-d", "--directory", type=Path, required=True, help="Directory for symbol stores")
     parser.add_argument("-p", "--port", type=int, default=9501, help="Port to listen on")
     parser.add_argument("-r", "--resources", type=Path, default=None, help="Path to resources directory or ZIP")
+    parser.add_argument("--coalesce-window", type=float, default=ServerConfig.write_coalesce_window,
+                        help="Window (in seconds) in which upstream symbols are committed together")
+    parser.add_argument("--coalesce-max-symbols", type=int, default=ServerConfig.write_coalesce_max_symbols,
+                        help="Maximal amount of symbols committed together")
+    parser.add_argument("--outbound-queue-bytes", type=int, default=ServerConfig.outbound_queue_bytes,
+                        help="Maximal size of updates queued to a single client, beyond which its queue overflows")
+    parser.add_argument("--outbound-response-bytes", type=int, default=ServerConfig.outbound_response_bytes,
+                        help="Size of responses queued to a single client, beyond which responding waits")
+    parser.add_argument("--outbound-overflow", choices=OVERFLOW_POLICIES, default=ServerConfig.outbound_overflow_policy,
+                        help="Whether a client whose outbound queue overflows is disconnected or forced to resync")
+    parser.add_argument("--max-open-stores", type=int, default=ServerConfig.store_cache_max_stores,
+                        help="Maximal amount of project stores kept open (stores with subscribers stay open)")
+    parser.add_argument("--store-idle-timeout", type=float, default=ServerConfig.store_idle_timeout,
+                        help="Seconds after which an unused project store is closed (0 to disable)")
+    parser.add_argument("--compaction-interval", type=float, default=ServerConfig.compaction_interval,
+                        help="Seconds between compactions of project stores (0 to disable)")
+    parser.add_argument("--history-keep-versions", type=int, default=ServerConfig.history_keep_versions,
+                        help="Amount of versions of each symbol kept in history (0 to keep all)")
+    parser.add_argument("--history-max-age-days", type=float, default=ServerConfig.history_max_age / (24 * 60 * 60),
+                        help="Days after which superseded versions of symbols are deleted (0 to keep all)")
+    parser.add_argument("--metrics-port", type=int, default=ServerConfig.metrics_port,
+                        help="Port to serve metrics on over HTTP (0 to disable), workers use the following ports")
+    parser.add_argument("--metrics-host", default=ServerConfig.metrics_host, help="Address to serve metrics on")
+    parser.add_argument("--log-level", default=ServerConfig.log_level, help="Level of messages logged to the console")
+    parser.add_argument("--log-rate-limit", type=float, default=ServerConfig.log_rate_limit,
+                        help="Messages of each kind logged to the console per second (0 to disable the limit)")
+    parser.add_argument("--audit-log", default=ServerConfig.audit_log_directory,
+                        help="Directory of per-project audit logs of loggable symbols (by default within the directory"
+                             " for symbol stores)")
+    parser.add_argument("--no-audit-log", dest="audit_log_enabled", action="store_false",
+                        default=ServerConfig.audit_log_enabled,
+                        help="Don't keep audit logs of loggable symbols")
+    parser.add_argument("--audit-log-max-bytes", type=int, default=ServerConfig.audit_log_max_bytes,
+                        help="Size at which an audit log is rotated")
+    parser.add_argument("--audit-log-backups", type=int, default=ServerConfig.audit_log_backups,
+                        help="Amount of rotated audit logs kept per project")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes serving the projects (each owns the projects hashed to it), 0 serves all"
+                             " projects in the server's process")
+    parser.add_argument("--snapshot-rebuild-changes", type=int, default=ServerConfig.snapshot_rebuild_changes,
+                        help="Changes after which a project's full sync snapshot is (re)built (0 to disable)")
+    parser.add_argument("--replicate-from", default=ServerConfig.replicate_from,
+                        help="Address (host:port) of a primary server to follow, replicating its stores (promoted to"
+                             " accept symbols by SIGUSR1)")
 
     args = parser.parse_args()
     port = args.port
     directory = args.directory
     resources = args.resources
+    config = ServerConfig(write_coalesce_window=args.coalesce_window,
+                          write_coalesce_max_symbols=args.coalesce_max_symbols,
+                          outbound_queue_bytes=args.outbound_queue_bytes,
+                          outbound_response_bytes=args.outbound_response_bytes,
+                          outbound_overflow_policy=args.outbound_overflow,
+                          store_cache_max_stores=args.max_open_stores,
+                          store_idle_timeout=args.store_idle_timeout,
+                          compaction_interval=args.compaction_interval,
+                          history_keep_versions=args.history_keep_versions,
+                          history_max_age=args.history_max_age_days * 24 * 60 * 60,
+                          metrics_port=args.metrics_port,
+                          metrics_host=args.metrics_host,
+                          log_level=args.log_level.upper(),
+                          log_rate_limit=args.log_rate_limit,
+                          audit_log_enabled=args.audit_log_enabled,
+                          audit_log_directory=args.audit_log,
+                          audit_log_max_bytes=args.audit_log_max_bytes,
+                          audit_log_backups=args.audit_log_backups,
+                          snapshot_rebuild_changes=args.snapshot_rebuild_changes,
+                          replicate_from=args.replicate_from)
 
     if resources is None:
         this_file = Path(__file__).absolute()
@@ -23,5 +90,15 @@ if __name__ == "__main__":
         else:
             raise ValueError('Must specify resources directory / zip')
 
-    server = DefaultSymbolServer("0.0.0.0", port, directory, resources)
-    asyncio.run(server.serve_forever())
+    if args.workers > 0 and args.replicate_from is not None:
+        parser.error("Replication isn't supported with worker processes")
+
+    listener = setup_logging(config, directory)
+    if args.workers > 0:
+        server = SymbolRouter("0.0.0.0", port, directory, resources, args.workers, config)
+    else:
+        server = DefaultSymbolServer("0.0.0.0", port, directory, resources, config)
+    try:
+        asyncio.run(server.serve_forever())
+    finally:
+        listener.stop()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from common.symbol import Symbol
+from common.symbol_store import SymbolStoreABC
+from .metrics import MetricsRegistry
+
+
+T = TypeVar('T')
+
+
+class StoreMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.operations = registry.histogram('jsync_store_operation_seconds',
+                                             'Duration of store operations on their thread, by operation',
+                                             labels=('operation',))
+
+
+class AsyncSymbolStore:
+    # Runs a project's symbol store off the event loop; writes are serialized on a dedicated writer thread,
+    # while reads run on a separate reader thread (with its own connection), so they don't wait for writes.
+    def __init__(self, project: str, store_factory: Callable[[], SymbolStoreABC],
+                 metrics: Optional[StoreMetrics] = None):
+        self._project = project
+        self._store_factory = store_factory
+        self._metrics = metrics
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'jsync-writer-{project}')
+        self._reader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'jsync-reader-{project}')
+
+        # Each store (and its connection) is created and used only from within its own thread
+        self._writer: Future = self._writer_executor.submit(store_factory)
+        self._reader: Future = self._reader_executor.submit(self._open_reader)
+
+    @property
+    def project(self) -> str:
+        return self._project
+
+    def _open_reader(self) -> SymbolStoreABC:
+        # The writer creates (and migrates) the database, the reader must not race it
+        self._writer.result()
+        return self._store_factory()
+
+    @staticmethod
+    def _timed(store: Future, operation: Callable[[SymbolStoreABC], T]) -> Tuple[T, float]:
+        start = time.perf_counter()
+        result = operation(store.result())
+        return result, time.perf_counter() - start
+
+    async def _run(self, executor: ThreadPoolExecutor, store: Future, operation: Callable[[SymbolStoreABC], T],
+                   name: str) -> T:
+        # Timings are recorded back on the event loop, metrics aren't thread-safe
+        result, duration = await asyncio.get_running_loop().run_in_executor(executor, self._timed, store, operation)
+        if self._metrics is not None:
+            self._metrics.operations.labels(name).observe(duration)
+        return result
+
+    async def write(self, operation: Callable[[SymbolStoreABC], T], name: str = 'write') -> T:
+        return await self._run(self._writer_executor, self._writer, operation, name)
+
+    async def read(self, operation: Callable[[SymbolStoreABC], T], name: str = 'read') -> T:
+        return await self._run(self._reader_executor, self._reader, operation, name)
+
+    async def push_symbols(self, symbols: List[Symbol]):
+        return await self.write(lambda store: store.push_symbols(symbols), 'push_symbols')
+
+    async def get_symbols(self, canonical_signature: Optional[str] = None, author: Optional[str] = None,
+                          since: int = 0) -> List[Symbol]:
+        return await self.read(lambda store: list(store.get_symbols(canonical_signature=canonical_signature,
+                                                                    author=author, since=since)),
+                               'get_symbols')
+
+    async def get_symbols_page(self, since: int = 0, after: Optional[Tuple[str, str]] = None,
+                               limit: int = 1000) -> List[Symbol]:
+        return await self.read(lambda store: store.get_symbols_page(since=since, after=after, limit=limit),
+                               'get_symbols_page')
+
+    async def get_sequence(self) -> int:
+        return await self.read(lambda store: store.sequence, 'get_sequence')
+
+    async def get_symbols_seq_page(self, after: int = 0, limit: int = 1000) -> Tuple[List[Symbol], int]:
+        return await self.read(lambda store: store.get_symbols_seq_page(after=after, limit=limit),
+                               'get_symbols_seq_page')
+
+    async def get_changes_page(self, after: int = 0, limit: int = 1000) -> Tuple[List[Symbol], List[int]]:
+        return await self.read(lambda store: store.get_changes_page(after=after, limit=limit), 'get_changes_page')
+
+    async def apply_changes(self, symbols: List[Symbol], sequences: List[int], reset: bool = False):
+        return await self.write(lambda store: store.apply_changes(symbols, sequences, reset), 'apply_changes')
+
+    def close(self):
+        for executor, store in ((self._reader_executor, self._reader), (self._writer_executor, self._writer)):
+            executor.submit(lambda future=store: future.result().close())
+            executor.shutdown(wait=True)
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from common.codecs import JSON_CODEC, CODECS
+from common.commands import Handshake, HandshakeResponse, ImportMapping, ImportComplete
+from common.compression import COMPRESSIONS
+from common.consts import PROTOCOL_VERSION, IMPORT_PROTOCOL_VERSION, CODEC_BINARY
+from server.mappings import MAPPING_FORMATS
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+from server.replication import ReplicationFollower
+from server.utils import recv_packet, send_packet
+
+
+async def import_online(address: str, project: str, mapping_format: str, author: str, mapping: Path) -> int:
+    # Sends the mapping to a running server (listening on the local machine), which imports it and notifies the
+    # project's subscribers
+    host, port = ReplicationFollower.parse_address(address)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await send_packet(writer, b'bulk-import')
+        await send_packet(writer, JSON_CODEC.encode(Handshake(PROTOCOL_VERSION, [CODEC_BINARY], COMPRESSIONS)))
+        response = JSON_CODEC.decode(await recv_packet(reader))
+        if not isinstance(response, HandshakeResponse) or response.version < IMPORT_PROTOCOL_VERSION:
+            raise RuntimeError(f"Server {address} doesn't support importing mappings")
+        codec = CODECS[response.codec]
+
+        command = ImportMapping(project, mapping_format, author, mapping.read_bytes())
+        await send_packet(writer, codec.encode(command), response.compression)
+        while True:
+            result = codec.decode(await recv_packet(reader))
+            if isinstance(result, ImportComplete) and result.project == project:
+                break
+        if result.error is not None:
+            raise RuntimeError(f"Server {address} failed importing the mapping: {result.error}")
+        return result.changed
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="jsync-import",
+                                     description="Imports a rename mapping into a project's symbol store, either"
+                                                 " directly (while no server serves it), or through a running server"
+                                                 " (which also notifies the project's subscribers).")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-d", "--directory", type=Path, help="Directory of symbol stores")
+    target.add_argument("-s", "--server", help="Address (host:port) of a running server on this machine to import"
+                                               " through")
+    parser.add_argument("-p", "--project", required=True, help="Project to import into")
+    parser.add_argument("-f", "--format", choices=sorted(MAPPING_FORMATS), required=True,
+                        help="Format of the mapping: ProGuard / R8 mapping.txt, JADX .jobf or JEB renames"
+                             " (<signature> = <name> lines)")
+    parser.add_argument("-a", "--author", required=True, help="Author the renames are attributed to")
+    parser.add_argument("mapping", type=Path, help="Mapping file")
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.server is not None:
+        changed = asyncio.run(import_online(args.server, args.project, args.format, args.author, args.mapping))
+    else:
+        store = PySqliteSymbolStore(str((args.directory / args.project).with_suffix('.db')))
+        try:
+            changed = store.import_symbols(MAPPING_FORMATS[args.format](str(args.mapping)), args.author,
+                                           int(time.time()))
+        finally:
+            store.close()
+    print(f"Imported {changed} symbols into <{args.project}> in {time.perf_counter() - start:.2f}s")
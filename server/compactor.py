@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable, AsyncContextManager, Set
+
+from .async_symbol_store import AsyncSymbolStore
+from .metrics import MetricsRegistry, LATENCY_BUCKETS
+
+
+class CompactorMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.runs = registry.counter('jsync_compaction_runs_total', 'Project stores compacted')
+        self.rows = registry.counter('jsync_compaction_rows_deleted_total', 'History rows deleted by compaction')
+        self.bytes = registry.counter('jsync_compaction_bytes_reclaimed_total',
+                                      'Bytes of database pages freed by compaction')
+        self.duration = registry.histogram('jsync_compaction_duration_seconds', 'Duration of compacting a store',
+                                           LATENCY_BUCKETS + (30, 60, 300))
+
+
+class Compactor:
+    # Periodically prunes superseded history of every project according to a retention policy, and returns the freed
+    # space to the filesystem. Work is split into small steps on the store's reader/writer threads, so live writes
+    # are interleaved with it.
+    # Only stores written since the previous run can have anything new to prune or reclaim, unless history expires by
+    # age, so other stores aren't opened (and hot stores evicted from the cache) for nothing.
+    DELETE_BATCH_ROWS = 1000
+    VACUUM_BATCH_PAGES = 1024
+
+    def __init__(self, projects: Callable[[], Iterable[str]],
+                 use_store: Callable[[str], AsyncContextManager[AsyncSymbolStore]], interval: float,
+                 keep_versions: int, max_age: float, metrics: CompactorMetrics):
+        self._projects = projects
+        self._use_store = use_store
+        self._interval = interval
+        self._keep_versions = keep_versions
+        self._max_age = max_age
+        self._metrics = metrics
+        self._task = None
+        self._written: Set[str] = set()
+        # Whether every store was visited once, pruning history written before the server started
+        self._swept = False
+
+    @property
+    def prunes_history(self) -> bool:
+        return self._keep_versions > 0 or self._max_age > 0
+
+    def mark_written(self, project: str):
+        self._written.add(project)
+
+    def _due_projects(self) -> Iterable[str]:
+        written, self._written = self._written, set()
+        if self._max_age > 0 or (self.prunes_history and not self._swept):
+            self._swept = True
+            return list(self._projects())
+        return sorted(written)
+
+    async def compact(self, project: str):
+        start = time.monotonic()
+        before = int(time.time() - self._max_age) if self._max_age > 0 else 0
+
+        async with self._use_store(project) as store:
+            used_bytes = await store.read(lambda s: s.used_bytes)
+
+            deleted = 0
+            if self.prunes_history:
+                # Rows superseded in the reader's snapshot stay superseded, so each page is deleted in a small
+                # transaction before the next one is read
+                after = None
+                while True:
+                    keys = await store.read(lambda s: s.get_superseded_symbols(self._keep_versions, before, after,
+                                                                               self.DELETE_BATCH_ROWS),
+                                            'get_superseded_symbols')
+                    if not keys:
+                        break
+                    await store.write(lambda s: s.delete_history(keys), 'delete_history')
+                    deleted += len(keys)
+                    after = keys[-1]
+
+            await store.write(lambda s: s.checkpoint(), 'checkpoint')
+            if await store.write(lambda s: s.free_bytes):
+                while True:
+                    file_bytes = await store.write(lambda s: s.file_bytes)
+                    await store.write(lambda s: s.incremental_vacuum(self.VACUUM_BATCH_PAGES), 'incremental_vacuum')
+                    if await store.write(lambda s: s.file_bytes) >= file_bytes:
+                        break
+                await store.write(lambda s: s.checkpoint(), 'checkpoint')
+
+            reclaimed = max(used_bytes - await store.read(lambda s: s.used_bytes), 0)
+
+        self._metrics.runs.inc()
+        self._metrics.rows.inc(deleted)
+        self._metrics.bytes.inc(reclaimed)
+        self._metrics.duration.observe(time.monotonic() - start)
+        if deleted or reclaimed:
+            logging.info(f"[Compaction] Deleted {deleted} history rows of <{project}>, reclaiming {reclaimed} bytes")
+
+    async def compact_all(self):
+        for project in self._due_projects():
+            try:
+                await self.compact(project)
+            except Exception:  # noqa
+                logging.exception(f"[Compaction] Failed compacting <{project}>")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.compact_all()
+
+    def start(self):
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.ensure_future(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
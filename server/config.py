@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+# Policies for a client whose outbound queue overflows
+OVERFLOW_DISCONNECT = 'disconnect'
+OVERFLOW_RESYNC = 'resync'  # Falls back to disconnecting clients which can't resync
+OVERFLOW_POLICIES = (OVERFLOW_DISCONNECT, OVERFLOW_RESYNC)
+
+
+@dataclass
+class ServerConfig:
+    # Upstream symbols of a project arriving within this window (in seconds) are committed in a single transaction
+    write_coalesce_window: float = 0.005
+    # A pending batch is committed immediately once it reaches this many symbols
+    write_coalesce_max_symbols: int = 10000
+    # Maximal size (in bytes) of updates queued to a single client, beyond which it overflows
+    outbound_queue_bytes: int = 16 << 20
+    # Responses to a client's own requests (e.g. full sync pages) wait while this many bytes of them are queued
+    outbound_response_bytes: int = 4 << 20
+    # What to do with a client whose outbound queue overflows
+    outbound_overflow_policy: str = OVERFLOW_DISCONNECT
+    # Maximal amount of project stores kept open, stores of projects with subscribers are never closed
+    store_cache_max_stores: int = 256
+    # Stores left unused for this long (in seconds) are closed, 0 disables
+    store_idle_timeout: float = 600
+    # Stores are compacted this often (in seconds), 0 disables
+    compaction_interval: float = 3600
+    # Superseded history beyond the newest versions of each (author, canonical_signature) is deleted, 0 keeps all
+    history_keep_versions: int = 0
+    # Superseded history older than this (in seconds) is deleted, 0 keeps all
+    history_max_age: float = 0
+    # Metrics are served (in Prometheus' text format) over HTTP on this port, 0 disables. Worker processes serve
+    # their own metrics on the following ports.
+    metrics_port: int = 0
+    metrics_host: str = '127.0.0.1'
+    log_level: str = 'DEBUG'
+    # Console messages of each kind (i.e. "[Tag]") beyond this rate (per second) are suppressed, 0 disables
+    log_rate_limit: float = 50
+    # Loggable symbols are appended to per-project audit logs, rotated by size, in this directory (by default the
+    # store directory's "audit" directory)
+    audit_log_enabled: bool = True
+    audit_log_directory: Optional[str] = None
+    audit_log_max_bytes: int = 64 << 20
+    audit_log_backups: int = 5
+    # Projects are snapshotted for full syncs from scratch once they made this many changes, and resnapshotted once
+    # their snapshot is as many changes behind, 0 disables
+    snapshot_rebuild_changes: int = 20000
+    # Address (host:port) of a primary server whose stores are replicated into this one, which doesn't accept
+    # symbols from clients until promoted
+    replicate_from: Optional[str] = None
@@ -1,30 +1,155 @@
+import asyncio
+import ipaddress
+import itertools
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
 from pathlib import Path
-from typing import Optional
-from zipfile import ZipFile
+from typing import Dict, Iterable, Iterator, List, Optional
 
+from common.commands import Command, ResyncRequired, ImportMapping, ImportComplete
+from common.consts import RESYNC_PROTOCOL_VERSION
 from common.symbol_store import SymbolStoreABC
+from .config import ServerConfig
+from .mappings import MappedSymbol, MAPPING_FORMATS
 from .pysqlite_symbol_store import PySqliteSymbolStore
-from .symbol_server import SymbolServer
+from .resources import Resource, load_resources
+from .symbol_server import SymbolServer, Client
 
 
 class DefaultSymbolServer(SymbolServer):
-    def __init__(self, host: str, port: int, store_directory: Path, resources: Path):
-        super().__init__(host, port)
+    # Imported symbols are parsed and staged in batches of this many
+    IMPORT_BATCH_SYMBOLS = 50000
+
+    def __init__(self, host: str, port: int, store_directory: Path, resources: Optional[Path],
+                 config: Optional[ServerConfig] = None):
+        super().__init__(host, port, config)
         self._store_directory = store_directory
-        self._resources = resources
-
-    def _get_resource(self, name: str) -> Optional[bytes]:
-        if self._resources.is_dir():
-            if not (self._resources / name).exists():
-                return None
-            return (self._resources / name).read_bytes()
-        elif self._resources.is_file() and self._resources.suffix == '.zip':
-            name = 'resources/' + name
-            with ZipFile(self._resources, 'r') as zipfile:
-                if name in zipfile.namelist():
-                    return zipfile.read(name)
-                else:
-                    return None
+        # Imports into a project are staged in its store's (single) staging table, one at a time
+        self._imports: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._resources = {}
+        if resources is not None:
+            self._resources = load_resources(resources)
+            logging.info(f"[Resource] Loaded {len(self._resources)} resources from {resources}")
+
+    def _get_resource(self, name: str) -> Optional[Resource]:
+        return self._resources.get(name)
+
+    def _get_projects(self) -> List[str]:
+        return [path.stem for path in self._store_directory.glob('*.db')]
+
+    def _get_snapshot_directory(self, project: str) -> Optional[Path]:
+        return self._store_directory / 'snapshots' / project
 
     def _get_store(self, project: str) -> SymbolStoreABC:
         return PySqliteSymbolStore(str((self._store_directory / project).with_suffix('.db')))
+
+    @staticmethod
+    def next_batch(symbols: Iterator[MappedSymbol], size: int) -> List[MappedSymbol]:
+        return list(itertools.islice(symbols, size))
+
+    async def import_symbols(self, project: str, symbols: Iterable[MappedSymbol], author: str) -> int:
+        # Imports renames (e.g. parsed from a mapping) into the project's store in a single transaction, then notifies
+        # its subscribers once. Returns the amount of symbols changed. Symbols are parsed on another thread, a batch
+        # ahead of the store's writer, which stages each batch between other writes, so it's only held up by the
+        # transaction importing them.
+        if self.following:
+            raise RuntimeError(f"Can't import into <{project}> while following a primary")
+
+        loop = asyncio.get_running_loop()
+        symbols = iter(symbols)
+        timestamp = int(time.time())
+        start = time.perf_counter()
+        async with self._imports[project], self._stores.use(project) as store:
+            await store.write(lambda sqlite_store: sqlite_store.clear_import(), 'clear_import')
+            parsed = loop.run_in_executor(None, self.next_batch, symbols, self.IMPORT_BATCH_SYMBOLS)
+            try:
+                while True:
+                    batch = await parsed
+                    if not batch:
+                        break
+                    parsed = loop.run_in_executor(None, self.next_batch, symbols, self.IMPORT_BATCH_SYMBOLS)
+                    await store.write(lambda sqlite_store: sqlite_store.stage_import(batch), 'stage_import')
+
+                previous, changed = await store.write(
+                    lambda sqlite_store: (sqlite_store.sequence, sqlite_store.import_staged(author, timestamp)),
+                    'import_symbols')
+            except BaseException:
+                # The batch parsed meanwhile isn't staged
+                await asyncio.wait([parsed])
+                await store.write(lambda sqlite_store: sqlite_store.clear_import(), 'clear_import')
+                raise
+        logging.info(f"[Import] Imported {changed} symbols by {author} into <{project}> in"
+                     f" {time.perf_counter() - start:.2f}s")
+
+        if changed:
+            self.mark_written(project)
+            await asyncio.gather(*(self.push_import(client, project, previous)
+                                   for client in list(self._project_associations[project])))
+        return changed
+
+    async def import_mapping(self, project: str, mapping_format: str, content: bytes, author: str) -> int:
+        # Imports a mapping's content, which its format's parser reads from a temporary file
+        parse = MAPPING_FORMATS.get(mapping_format)
+        if parse is None:
+            raise ValueError(f"Unknown mapping format {mapping_format}, expected one of"
+                             f" {', '.join(sorted(MAPPING_FORMATS))}")
+
+        def write_mapping() -> str:
+            with tempfile.NamedTemporaryFile('wb', prefix='jsync-import-', delete=False) as mapping:
+                mapping.write(content)
+            return mapping.name
+
+        path = await asyncio.get_running_loop().run_in_executor(None, write_mapping)
+        try:
+            return await self.import_symbols(project, parse(path), author)
+        finally:
+            os.unlink(path)
+
+    @staticmethod
+    def is_local(client: Client) -> bool:
+        try:
+            return ipaddress.ip_address(client.address[0]).is_loopback
+        except (TypeError, IndexError, ValueError):
+            return False
+
+    async def handle_command(self, client: Client, command: Command):
+        if not isinstance(command, ImportMapping):
+            await super().handle_command(client, command)
+            return
+
+        if not self.is_local(client):
+            logging.warning(f"[Import] Refusing an import into <{command.project}> from {client.name} @"
+                            f" {client.address}, imports are only accepted from local connections")
+            client.outbox.abort()
+            return
+
+        logging.info(f"[Import] Request from {client.name} to import a {command.mapping_format} mapping by"
+                     f" {command.author} into <{command.project}>")
+        try:
+            changed = await self.import_mapping(command.project, command.mapping_format, command.content,
+                                                command.author)
+        except (ValueError, RuntimeError, OSError, UnicodeDecodeError, sqlite3.Error) as e:
+            logging.warning(f"[Import] Importing into <{command.project}> failed: {e}")
+            await self.push_command(client, ImportComplete(command.project, 0, str(e)))
+        else:
+            await self.push_command(client, ImportComplete(command.project, changed))
+
+    async def push_import(self, client: Client, project: str, previous: int):
+        # Clients able to resync are told to (once), older ones are sent the changes following `previous`
+        if client.version >= RESYNC_PROTOCOL_VERSION:
+            self.enqueue_frame(client, self.encode_frame(client, ResyncRequired(project)))
+            return
+
+        async with self._stores.use(project) as store:
+            sequence = previous
+            while True:
+                symbols, sequence = await store.get_symbols_seq_page(after=sequence,
+                                                                     limit=self.FULL_SYNC_PAGE_SYMBOLS)
+                for page in self.split_page(symbols):
+                    await self.push_symbols(client, project, page)
+                if len(symbols) < self.FULL_SYNC_PAGE_SYMBOLS:
+                    break
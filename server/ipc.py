@@ -0,0 +1,38 @@
+import asyncio
+import struct
+import zlib
+from typing import Tuple
+
+
+# Messages between the router and its worker processes, all of which concern a single client. A client has at most a
+# single command in flight (its connection is read only once the previous command is done), and at most a single
+# reply awaiting acknowledgement.
+MESSAGE_CONNECT = 1  # Router -> worker: the client's description (JSON), sent before its first command to the worker
+MESSAGE_COMMAND = 2  # Router -> worker: an (encoded) command of the client
+MESSAGE_DISCONNECT = 3  # Router -> worker: the client disconnected
+MESSAGE_ACK = 4  # Router -> worker: the reply was queued to the client
+MESSAGE_REPLY = 5  # Worker -> router: a frame replying to the client's command, acknowledged once queued
+MESSAGE_UPDATE = 6  # Worker -> router: a frame of fanned out updates, which is never waited for
+MESSAGE_DONE = 7  # Worker -> router: the client's command was handled
+MESSAGE_FAILED = 8  # Worker -> router: handling the client's command failed (described), the client staying connected
+MESSAGE_RESET = 9  # Worker -> router: the client was disconnected while its command was handled
+
+# Message kind, client ID, payload size
+MESSAGE_HEADER = struct.Struct('!BII')
+
+
+def project_worker(project: str, workers: int) -> int:
+    # Stable across processes and restarts, unlike hash()
+    return zlib.crc32(project.encode('utf-8')) % workers
+
+
+def send_message(writer: asyncio.StreamWriter, kind: int, client_id: int, payload: bytes = b''):
+    # Messages are written whole without yielding, so concurrent senders never interleave
+    writer.write(MESSAGE_HEADER.pack(kind, client_id, len(payload)))
+    if payload:
+        writer.write(payload)
+
+
+async def recv_message(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    kind, client_id, size = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    return kind, client_id, await reader.readexactly(size) if size else b''
@@ -0,0 +1,138 @@
+import json
+import logging
+import queue
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Tuple
+
+from .config import ServerConfig
+
+
+AUDIT_LOGGER = 'jsync.audit'
+AUDIT_LOG_DIRECTORY = 'audit'
+audit_logger = logging.getLogger(AUDIT_LOGGER)
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated', 'suppressed')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.suppressed = 0
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through (bursts of) up to `rate` messages per second of each kind, where a message's kind is its level and
+    # leading "[Tag]" (or whole text, if untagged). The next message let through counts the suppressed ones.
+    MAX_KINDS = 1024
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self._rate = rate
+        self._buckets: Dict[Tuple[int, str], _Bucket] = {}
+
+    @staticmethod
+    def kind(record: logging.LogRecord) -> Tuple[int, str]:
+        message = str(record.msg)
+        end = message.find(']') if message.startswith('[') else -1
+        return record.levelno, message[:end + 1] if end >= 0 else message
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self._rate <= 0:
+            return True
+
+        now = time.monotonic()
+        kind = self.kind(record)
+        bucket = self._buckets.get(kind)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_KINDS:
+                self._buckets.clear()
+            bucket = self._buckets[kind] = _Bucket(self._rate, now)
+        else:
+            bucket.tokens = min(bucket.tokens + (now - bucket.updated) * self._rate, self._rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            bucket.suppressed += 1
+            return False
+
+        bucket.tokens -= 1
+        if bucket.suppressed:
+            record.msg = f"{record.msg} ({bucket.suppressed} similar messages suppressed)"
+            bucket.suppressed = 0
+        return True
+
+
+class AuditLogHandler(logging.Handler):
+    # Appends audited symbols as JSON lines to their project's append-only, rotated audit log. Records carry whole
+    # batches of symbols, which are only formatted here, on the logging thread.
+    MAX_OPEN_FILES = 64
+
+    def __init__(self, directory: Path, max_bytes: int, backups: int):
+        super().__init__()
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._files: 'OrderedDict[str, RotatingFileHandler]' = OrderedDict()
+        self.addFilter(logging.Filter(AUDIT_LOGGER))
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, project: str) -> RotatingFileHandler:
+        handler = self._files.get(project)
+        if handler is None:
+            if len(self._files) >= self.MAX_OPEN_FILES:
+                self._files.popitem(last=False)[1].close()
+            handler = self._files[project] = RotatingFileHandler(self._directory / f'{project}.audit.log',
+                                                                 maxBytes=self._max_bytes, backupCount=self._backups,
+                                                                 encoding='utf-8')
+        else:
+            self._files.move_to_end(project)
+        return handler
+
+    def emit(self, record: logging.LogRecord):
+        project = getattr(record, 'audit_project', None)
+        symbols = getattr(record, 'audit_symbols', None)
+        if project is None or not symbols:
+            return
+
+        lines = '\n'.join(json.dumps({'timestamp': symbol.timestamp, 'project': project, 'author': symbol.author,
+                                      'symbol_type': symbol.symbol_type,
+                                      'canonical_signature': symbol.canonical_signature, 'name': symbol.name})
+                          for symbol in symbols)
+        self._file(project).handle(logging.makeLogRecord({'msg': lines}))
+
+    def close(self):
+        for handler in self._files.values():
+            handler.close()
+        self._files.clear()
+        super().close()
+
+
+def audit_log_directory(config: ServerConfig, store_directory: Path) -> Path:
+    if config.audit_log_directory is not None:
+        return Path(config.audit_log_directory)
+    return store_directory / AUDIT_LOG_DIRECTORY
+
+
+def setup_logging(config: ServerConfig, store_directory: Path) -> QueueListener:
+    # The event loop's thread only queues log records, which a background thread writes (rate limiting those written
+    # to the console, but not audited symbols). The caller stops the returned listener, flushing the queue, on exit.
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(message)s'))
+    console.addFilter(RateLimitFilter(config.log_rate_limit))
+    handlers = [console]
+    if config.audit_log_enabled:
+        handlers.append(AuditLogHandler(audit_log_directory(config, store_directory), config.audit_log_max_bytes,
+                                        config.audit_log_backups))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(records)]
+    root.setLevel(config.log_level)
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,146 @@
+from typing import Callable, Dict, Iterable, Iterator, Tuple, TextIO
+
+from common.symbol import SYMBOL_TYPE_CLASS, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD
+from common.symbol_batch import MEMBER_SEPARATOR, signature_symbol_type
+
+
+# (symbol type, canonical signature, name) of an imported rename. Canonical signatures are the ones the plugins encode
+# (Lpkg/Class;, Lpkg/Class;->method(Args)Ret and Lpkg/Class;->field:Type), in terms of the obfuscated names.
+MappedSymbol = Tuple[int, str, str]
+
+PRIMITIVE_DESCRIPTORS = {'void': 'V', 'boolean': 'Z', 'byte': 'B', 'char': 'C', 'short': 'S', 'int': 'I', 'long': 'J',
+                         'float': 'F', 'double': 'D'}
+# Leading characters of mapping.txt lines other than class mappings (i.e. members, comments and blank lines)
+PROGUARD_NON_CLASS = (' ', '\t', '#', '\n', '')
+
+
+def class_descriptor(name: str) -> str:
+    # a.b.C -> La/b/C;
+    return 'L' + name.replace('.', '/') + ';'
+
+
+def simple_name(name: str) -> str:
+    # The name the plugins give classes, i.e. without their package or outer classes
+    return name.rpartition('.')[2].rpartition('$')[2]
+
+
+def type_descriptor(java_type: str, classes: Dict[str, str]) -> str:
+    # A Java type (e.g. java.lang.String[]) as a descriptor of the obfuscated type (e.g. [Ljava/lang/String;)
+    dimensions = java_type.count('[]')
+    element = java_type.replace('[]', '')
+    descriptor = PRIMITIVE_DESCRIPTORS.get(element) or class_descriptor(classes.get(element, element))
+    return '[' * dimensions + descriptor
+
+
+def parse_proguard(path: str) -> Iterator[MappedSymbol]:
+    # ProGuard / R8 mapping.txt, mapping original names to obfuscated ones. Member types are in terms of the original
+    # class names, so a first pass collects the class mapping. Lines are split by hand, as regular expressions take
+    # most of the time of parsing large mappings.
+    classes = {}
+    with open(path, encoding='utf-8') as mapping:
+        for line in mapping.read().splitlines():
+            line = line.rstrip()
+            if line[:1] not in PROGUARD_NON_CLASS and line.endswith(':'):
+                original, _, obfuscated = line[:-1].partition(' -> ')
+                classes[original] = obfuscated
+
+    with open(path, encoding='utf-8') as mapping:
+        yield from _parse_proguard(mapping, classes)
+
+
+def _parse_proguard(mapping: TextIO, classes: Dict[str, str]) -> Iterator[MappedSymbol]:
+    descriptors = {}
+
+    def descriptor(java_type: str) -> str:
+        if java_type not in descriptors:
+            descriptors[java_type] = type_descriptor(java_type, classes)
+        return descriptors[java_type]
+
+    cls = None
+    members = set()
+    for line in mapping:
+        if line[:1] not in PROGUARD_NON_CLASS:
+            original, _, obfuscated = line.rstrip('\n').rstrip(':').partition(' -> ')
+            cls = class_descriptor(obfuscated)
+            members.clear()
+            if simple_name(original) != simple_name(obfuscated):
+                yield SYMBOL_TYPE_CLASS, cls, simple_name(original)
+            continue
+
+        # e.g. "    1:5:void method(java.lang.String,int):3:7 -> a" or "    int field -> b"
+        line = line.strip()
+        if cls is None or not line or line.startswith('#'):
+            continue
+        declaration, separator, obfuscated = line.rpartition(' -> ')
+        java_type, _, original = declaration.partition(' ')
+        if not separator or not original:
+            continue
+        # Members may be prefixed by the line range they span
+        if java_type[0].isdigit():
+            java_type = java_type.rpartition(':')[2]
+
+        arguments = None
+        parenthesis = original.find('(')
+        if parenthesis >= 0:
+            arguments = original[parenthesis + 1:original.find(')', parenthesis)]
+            original = original[:parenthesis]
+        # Qualified names are of methods inlined from other classes, constructors can't be renamed
+        if original == obfuscated or '.' in original or original.startswith('<'):
+            continue
+
+        if arguments is None:
+            symbol_type = SYMBOL_TYPE_FIELD
+            member = f'{obfuscated}:{descriptor(java_type)}'
+        else:
+            symbol_type = SYMBOL_TYPE_METHOD
+            member = f"{obfuscated}({''.join(descriptor(argument) for argument in arguments.split(',') if argument)})" \
+                     f"{descriptor(java_type)}"
+
+        # Methods are listed once per line range
+        if member not in members:
+            members.add(member)
+            yield symbol_type, cls + MEMBER_SEPARATOR + member, original
+
+
+def parse_jobf(path: str) -> Iterator[MappedSymbol]:
+    # JADX deobfuscation map (.jobf) lines, e.g.
+    #   c a.b = Name
+    #   f a.b.c:I = field
+    #   m a.b.d(Ljava/lang/String;)V = method
+    # Packages (p) can't be renamed by JSync, fields without a type (older JADX versions) lack their signature.
+    with open(path, encoding='utf-8') as mapping:
+        for line in mapping:
+            kind, _, rest = line.strip().partition(' ')
+            target, separator, alias = rest.partition(' = ')
+            if not separator or not alias:
+                continue
+
+            if kind == 'c':
+                yield SYMBOL_TYPE_CLASS, class_descriptor(target), alias
+            elif kind in ('f', 'm'):
+                end = target.find(':' if kind == 'f' else '(')
+                if end < 0:
+                    continue
+                split = target.rfind('.', 0, end)
+                yield (SYMBOL_TYPE_FIELD if kind == 'f' else SYMBOL_TYPE_METHOD,
+                       class_descriptor(target[:split]) + MEMBER_SEPARATOR + target[split + 1:], alias)
+
+
+def parse_jeb(path: str) -> Iterator[MappedSymbol]:
+    # Renames exported from JEB, one "<signature> = <name>" per line, as given by an item's getSignature(False) and
+    # getName(True) (e.g. Lcom/a;->b(I)V = parse)
+    with open(path, encoding='utf-8') as mapping:
+        for line in mapping:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            canonical_signature, separator, name = line.partition(' = ')
+            if separator and name:
+                yield signature_symbol_type(canonical_signature), canonical_signature, name
+
+
+MAPPING_FORMATS: Dict[str, Callable[[str], Iterable[MappedSymbol]]] = {
+    'proguard': parse_proguard,
+    'jobf': parse_jobf,
+    'jeb': parse_jeb,
+}
@@ -0,0 +1,217 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Dict, Iterable, Iterator, Sequence, Tuple
+
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, label_names: Sequence[str] = (), labels: Labels = ()) -> Iterator[str]:
+        yield f'{self.name}{_format_labels(label_names, labels)} {_format_value(self.value)}'
+
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def samples(self, label_names: Sequence[str] = (), labels: Labels = ()) -> Iterator[str]:
+        yield f'{self.name}{_format_labels(label_names, labels)} {_format_value(self.value)}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        # Non-cumulative counts, the last one counts observations above all buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, label_names: Sequence[str] = (), labels: Labels = ()) -> Iterator[str]:
+        cumulative = 0
+        for bucket, count in zip(self.buckets + [float('inf')], self.counts):
+            cumulative += count
+            bucket_label = f'le="{_format_value(bucket)}"'
+            yield f'{self.name}_bucket{_format_labels(label_names, labels, bucket_label)} {cumulative}'
+        yield f'{self.name}_sum{_format_labels(label_names, labels)} {_format_value(self.sum)}'
+        yield f'{self.name}_count{_format_labels(label_names, labels)} {self.count}'
+
+
+class Family:
+    # A metric per combination of label values, children are created on first use (and then looked up by a dict)
+    def __init__(self, metric: Callable[[], object], name: str, description: str, label_names: Sequence[str]):
+        self._metric = metric
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.type = metric().type
+        self._children: Dict[Labels, object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._metric()
+        return child
+
+    def samples(self) -> Iterator[str]:
+        for labels, child in list(self._children.items()):
+            yield from child.samples(self.label_names, labels)
+
+
+class CallbackGauge:
+    # Gauges computed on collection, so that keeping them up to date costs nothing
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._callback = callback
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._callback():
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 4, 16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()):
+        if labels:
+            return self._register(Family(lambda: Counter(name, description), name, description, labels))
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()):
+        if labels:
+            return self._register(Family(lambda: Gauge(name, description), name, description, labels))
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Sequence[str] = ()):
+        if labels:
+            return self._register(Family(lambda: Histogram(name, description, buckets), name, description, labels))
+        return self._register(Histogram(name, description, buckets))
+
+    def callback_gauge(self, name: str, description: str, callback: Callable[[], Iterable[Tuple[Labels, float]]],
+                       labels: Sequence[str] = ()) -> CallbackGauge:
+        return self._register(CallbackGauge(name, description, labels, callback))
+
+    def __getitem__(self, name: str):
+        return self._metrics[name]
+
+    def __iter__(self):
+        return iter(self._metrics.values())
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+async def monitor_event_loop_lag(histogram: Histogram, interval: float):
+    # How late the event loop wakes a sleeping task is how long ready callbacks wait for it
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        histogram.observe(max(time.monotonic() - start - interval, 0))
+
+
+class MetricsListener:
+    # Serves the registry over HTTP (GET /metrics), reading requests just far enough to answer them
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            method, path = (request.split(b'\r\n', 1)[0].split(b' ') + [b'', b''])[:2]
+            if method == b'GET' and path.split(b'?', 1)[0] == b'/metrics':
+                status, body = b'200 OK', self._registry.render().encode('utf-8')
+            else:
+                status, body = b'404 Not Found', b'Not Found\n'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logging.info(f"[Metrics] Listening on {self._host}:{self._port}")
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import socket
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from .metrics import MetricsRegistry, SIZE_BUCKETS
+from .utils import send_frame
+
+
+class OutboxMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.queued = registry.gauge('jsync_outbound_queued_bytes',
+                                     'Bytes of frames queued to be sent, over all clients')
+        self.depth = registry.histogram('jsync_outbound_queue_bytes',
+                                        'Bytes of updates queued to a client when enqueuing one', SIZE_BUCKETS)
+        self.sent = registry.counter('jsync_outbound_frames_total', 'Frames sent to clients')
+        self.overflows = registry.counter('jsync_outbound_overflows_total', 'Client outbound queue overflows')
+        self.frame_bytes = registry.histogram('jsync_outbound_frame_bytes', 'Sizes of frames sent to clients',
+                                              SIZE_BUCKETS)
+
+
+class ClientOutbox:
+    # A queue of frames pending to a single client, drained (in order) by a dedicated writer task, so that a slow
+    # client only stalls itself. Updates fanned out to the client and responses to its own requests are bounded
+    # separately, by their bytes: updates overflow beyond `max_update_bytes`, while responses wait for room beyond
+    # `max_response_bytes` (a frame larger than its bound is let through once nothing else of its kind is queued).
+    def __init__(self, writer: asyncio.StreamWriter, max_update_bytes: int, max_response_bytes: int,
+                 metrics: OutboxMetrics):
+        self._writer = writer
+        self._max_update_bytes = max_update_bytes
+        self._max_response_bytes = max_response_bytes
+        self._metrics = metrics
+        # (frame, whether it's an update)
+        self._frames: Deque[Tuple[bytes, bool]] = deque()
+        self._update_bytes = 0
+        self._response_bytes = 0
+        self._pending = asyncio.Event()
+        self._response_sent = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def update_bytes(self) -> int:
+        return self._update_bytes
+
+    @property
+    def response_bytes(self) -> int:
+        return self._response_bytes
+
+    async def put(self, frame: bytes):
+        # Waits for room among the queued responses, used for responses to the client's own requests
+        while self._response_bytes and self._response_bytes + len(frame) > self._max_response_bytes:
+            if self._closed:
+                break
+            self._response_sent.clear()
+            await self._response_sent.wait()
+        if self._closed:
+            raise ConnectionResetError()
+
+        self._response_bytes += len(frame)
+        self._enqueue(frame, False)
+
+    def offer(self, frame: bytes) -> bool:
+        # Enqueues an update without waiting, returns whether the queued updates had room for the frame
+        if self._closed:
+            return True
+        if self._update_bytes and self._update_bytes + len(frame) > self._max_update_bytes:
+            self._metrics.overflows.inc()
+            return False
+
+        self._update_bytes += len(frame)
+        self._metrics.depth.observe(self._update_bytes)
+        self._enqueue(frame, True)
+        return True
+
+    def _enqueue(self, frame: bytes, update: bool):
+        self._frames.append((frame, update))
+        self._metrics.queued.inc(len(frame))
+        self._pending.set()
+
+    def _dequeued(self, frame: bytes, update: bool):
+        self._metrics.queued.dec(len(frame))
+        if update:
+            self._update_bytes -= len(frame)
+        else:
+            self._response_bytes -= len(frame)
+            self._response_sent.set()
+
+    def clear_updates(self):
+        # Drops the queued updates, keeping the responses
+        frames = self._frames
+        self._frames = deque(item for item in frames if not item[1])
+        for frame, update in frames:
+            if update:
+                self._dequeued(frame, update)
+
+    def clear(self):
+        while self._frames:
+            self._dequeued(*self._frames.popleft())
+
+    async def _run(self):
+        while True:
+            while not self._frames:
+                self._pending.clear()
+                await self._pending.wait()
+
+            frame, update = self._frames.popleft()
+            self._dequeued(frame, update)
+            try:
+                await send_frame(self._writer, frame)
+            except socket.error:
+                logging.debug(f"Connection from {self._writer.get_extra_info('peername')} is closed but not yet "
+                              f"cleared")
+                self.abort()
+                return
+            self._metrics.sent.inc()
+            self._metrics.frame_bytes.observe(len(frame))
+
+    def _close(self):
+        # Responses waiting for room fail, the connection is gone
+        self._closed = True
+        self.clear()
+        self._response_sent.set()
+
+    def abort(self):
+        # Drops the connection (and whatever is pending to it), the connection handler then clears the client
+        self._close()
+        self._writer.transport.abort()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._close()
@@ -1,25 +1,49 @@
 import sqlite3
 from contextlib import closing
-from typing import Iterable
+from typing import Iterable, Tuple
 
 from common.symbol_store import SymbolStoreABC
 from common.sqlite_adapter import SqliteAdapterABC
+from common.sql_queries import (CREATE_IMPORTED_SYMBOLS_TABLE_QUERY, INSERT_IMPORTED_SYMBOL_QUERY,
+                                DELETE_UNCHANGED_IMPORTED_SYMBOLS_QUERY, DROP_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY,
+                                IMPORT_SYMBOLS_QUERY, IMPORT_LATEST_SYMBOLS_QUERY, ADVANCE_SEQUENCE_QUERY,
+                                COUNT_IMPORTED_SYMBOLS_QUERY, CLEAR_IMPORTED_SYMBOLS_QUERY,
+                                CREATE_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY)
 
 
 class SqliteAdapter(SqliteAdapterABC):
     def __init__(self, path: str):
-        self._conn = sqlite3.connect(path)
+        # The module caches prepared statements by their SQL text itself
+        self._conn = sqlite3.connect(path, cached_statements=self.MAX_CACHED_STATEMENTS)
+        # Lets compaction return free pages to the filesystem (only takes effect for new databases)
+        self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # Allows reading concurrently with (a single) writer
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+    def _begin(self, immediate: bool):
+        # Takes the write lock upfront, so the transaction can't fail midway on another writer
+        self._conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN DEFERRED')
+
+    def _commit(self):
+        self._conn.commit()
+
+    def _rollback(self):
+        self._conn.rollback()
+
+    def _statement_done(self):
+        if not self.in_transaction:
+            self._conn.commit()
 
     def execute(self, statement: str, *arguments) -> None:
         with closing(self._conn.cursor()) as cur:
             cur.execute(statement, arguments)
-        self._conn.commit()
+        self._statement_done()
 
     def execute_update(self, statement: str, *arguments) -> int:
         with closing(self._conn.cursor()) as cur:
             cur.execute(statement, arguments)
             row_count = cur.rowcount
-        self._conn.commit()
+        self._statement_done()
         return row_count
 
     def execute_query(self, statement, *arguments) -> Iterable:
@@ -27,10 +51,10 @@ class SqliteAdapter(SqliteAdapterABC):
             cur.execute(statement, arguments)
             yield from cur
 
-    def executemany(self, statement: str, rows: list):
+    def executemany(self, statement: str, rows: Iterable):
         with closing(self._conn.cursor()) as cur:
             cur.executemany(statement, rows)
-        self._conn.commit()
+        self._statement_done()
 
     def close(self):
         # type: () -> None
@@ -40,3 +64,35 @@ class SqliteAdapter(SqliteAdapterABC):
 class PySqliteSymbolStore(SymbolStoreABC):
     def connect(self, path: str) -> SqliteAdapter:
         return SqliteAdapter(path)
+
+    def import_symbols(self, symbols: Iterable[Tuple[int, str, str]], author: str, timestamp: int) -> int:
+        # Imports (symbol type, canonical signature, name) rows, streamed into a single transaction, as renames by
+        # `author` at `timestamp`. Returns the amount of symbols changed, which get consecutive sequence numbers.
+        with self._conn.transaction():
+            self.stage_import(symbols)
+            return self.import_staged(author, timestamp)
+
+    def stage_import(self, symbols: Iterable[Tuple[int, str, str]]):
+        # Adds rows to the next import, in a temporary table, so they may be staged in batches (between other writes)
+        # ahead of importing them in a transaction of its own
+        self._conn.execute(CREATE_IMPORTED_SYMBOLS_TABLE_QUERY)
+        self._conn.executemany(INSERT_IMPORTED_SYMBOL_QUERY, symbols)
+
+    def clear_import(self):
+        self._conn.execute(CREATE_IMPORTED_SYMBOLS_TABLE_QUERY)
+        self._conn.execute(CLEAR_IMPORTED_SYMBOLS_QUERY)
+
+    def import_staged(self, author: str, timestamp: int) -> int:
+        # Imports the staged rows, like `import_symbols`
+        self._conn.execute(CREATE_IMPORTED_SYMBOLS_TABLE_QUERY)
+        with self._conn.transaction():
+            self._conn.execute(DELETE_UNCHANGED_IMPORTED_SYMBOLS_QUERY, author, timestamp)
+            changed = list(self._conn.execute_query(COUNT_IMPORTED_SYMBOLS_QUERY))[0][0]
+
+            self._conn.execute(DROP_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY)
+            self._conn.execute(IMPORT_SYMBOLS_QUERY, author, timestamp)
+            self._conn.execute(IMPORT_LATEST_SYMBOLS_QUERY, author, timestamp)
+            self._conn.execute(ADVANCE_SEQUENCE_QUERY)
+            self._conn.execute(CREATE_LATEST_SYMBOLS_SEQ_INSERT_TRIGGER_QUERY)
+            self._conn.execute(CLEAR_IMPORTED_SYMBOLS_QUERY)
+        return changed
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncContextManager, Callable, Dict, List, Optional, Tuple
+
+from common.codecs import JSON_CODEC, CODECS
+from common.commands import Handshake, HandshakeResponse, ReplicationRequest, ReplicatedSymbols
+from common.consts import PROTOCOL_VERSION, REPLICATION_PROTOCOL_VERSION
+from .async_symbol_store import AsyncSymbolStore
+from .metrics import MetricsRegistry
+from .utils import recv_packet, send_packet
+from .write_coalescer import PendingWrite
+
+if TYPE_CHECKING:
+    from .symbol_server import Client, SymbolServer
+
+
+class ReplicationMetrics:
+    def __init__(self, registry: MetricsRegistry, source: 'ReplicationSource'):
+        registry.callback_gauge('jsync_replicas', 'Currently connected following servers',
+                                lambda: [((), len(source.replicas))])
+        self.lag = registry.histogram('jsync_replication_lag_seconds',
+                                      'Time from the primary committing changes until they were applied here')
+        self.lag_changes = registry.gauge('jsync_replication_lag_changes',
+                                          'Changes the primary had made but weren\'t yet applied here, by project',
+                                          labels=('project',))
+        self.applied = registry.counter('jsync_replication_applied_total', 'Replicated changes applied here')
+        self.connected = registry.gauge('jsync_replication_connected', 'Whether following a primary server (0 or 1)')
+
+
+@dataclass
+class Replica:
+    client: 'Client'
+    # Sequence number each project was replicated up to
+    positions: Dict[str, int] = field(repr=False)
+    # Projects with changes to replicate, and the (epoch, in milliseconds) time of their earliest unreplicated change
+    dirty: Dict[str, int] = field(default_factory=dict, repr=False)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class ReplicationSource:
+    # Streams the changes of every project, in the order they were committed, to the following servers which
+    # requested replication. Each follower is served by its own task, replicating projects as they're notified of
+    # changes, which waits for room in the follower's outbound queue rather than overflowing it.
+    PAGE_SYMBOLS = 2000
+
+    def __init__(self, server: 'SymbolServer', get_projects: Callable[[], List[str]],
+                 use_store: Callable[[str], AsyncContextManager[AsyncSymbolStore]]):
+        self._server = server
+        self._get_projects = get_projects
+        self._use_store = use_store
+        self.replicas: Dict['Client', Replica] = {}
+
+    def add(self, client: 'Client', request: ReplicationRequest):
+        self.remove(client)
+        positions = dict(zip(request.projects or [], request.sequences or []))
+        replica = self.replicas[client] = Replica(client, positions)
+        # Catching up on every project, which the follower may lack or be behind on
+        now = int(time.time() * 1000)
+        for project in set(self._get_projects()) | set(positions):
+            replica.dirty[project] = now
+        replica.wakeup.set()
+        replica.task = asyncio.ensure_future(self._run(replica))
+
+    def remove(self, client: 'Client'):
+        replica = self.replicas.pop(client, None)
+        if replica is not None and replica.task is not None:
+            replica.task.cancel()
+
+    def notify(self, project: str):
+        # Called once changes of the project were committed
+        now = int(time.time() * 1000)
+        for replica in self.replicas.values():
+            replica.dirty.setdefault(project, now)
+            replica.wakeup.set()
+
+    async def _run(self, replica: Replica):
+        try:
+            while True:
+                await replica.wakeup.wait()
+                replica.wakeup.clear()
+                while replica.dirty:
+                    project = next(iter(replica.dirty))
+                    committed = replica.dirty.pop(project)
+                    await self._replicate(replica, project, committed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"[Replication] Replicating to {replica.client.name} @ {replica.client.address} failed")
+            replica.client.outbox.abort()
+
+    async def _replicate(self, replica: Replica, project: str, committed: int):
+        client = replica.client
+        async with self._use_store(project) as store:
+            sequence = await store.get_sequence()
+            position = replica.positions.get(project, 0)
+            # A follower ahead of this store has a store this one didn't make, so it's replaced
+            reset = position > sequence
+            if reset:
+                position = 0
+                logging.warning(f"[Replication] {client.name} is ahead on <{project}>, replicating it from scratch")
+
+            while True:
+                symbols, sequences = await store.get_changes_page(after=position, limit=self.PAGE_SYMBOLS)
+                if symbols or reset:
+                    await self._server.push_command(client, ReplicatedSymbols(
+                        project, self._server.client_symbols(client, symbols), sequences, reset,
+                        max(sequence, sequences[-1] if sequences else 0), committed))
+                    reset = False
+                if sequences:
+                    position = replica.positions[project] = sequences[-1]
+                if len(symbols) < self.PAGE_SYMBOLS:
+                    break
+
+
+class ReplicationFollower:
+    # Follows a primary server, applying its stream of changes to the local stores (with the sequence numbers the
+    # primary assigned them, so that clients may switch servers without resyncing) and fanning them out to local
+    # subscribers. Reconnects to the primary, resuming where the local stores left off, until promoted.
+    MIN_RETRY_DELAY = 0.5
+    MAX_RETRY_DELAY = 30
+
+    def __init__(self, server: 'SymbolServer', get_projects: Callable[[], List[str]],
+                 use_store: Callable[[str], AsyncContextManager[AsyncSymbolStore]], address: str,
+                 metrics: ReplicationMetrics):
+        self._server = server
+        self._get_projects = get_projects
+        self._use_store = use_store
+        self._host, self._port = self.parse_address(address)
+        self._metrics = metrics
+        self._task: Optional[asyncio.Task] = None
+        # Retries back off, unless the primary was followed successfully
+        self._retry_delay = self.MIN_RETRY_DELAY
+
+    @staticmethod
+    def parse_address(address: str) -> Tuple[str, int]:
+        host, _, port = address.rpartition(':')
+        if not host or not port.isdigit():
+            raise ValueError(f"Expected a primary server address as host:port, got {address}")
+        return host, int(port)
+
+    @property
+    def address(self) -> str:
+        return f'{self._host}:{self._port}'
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._metrics.connected.set(0)
+
+    async def _positions(self) -> Tuple[List[str], List[int]]:
+        projects = self._get_projects()
+        sequences = []
+        for project in projects:
+            async with self._use_store(project) as store:
+                sequences.append(await store.get_sequence())
+        return projects, sequences
+
+    async def _run(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self._host, self._port)
+                await self._follow(reader, writer)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logging.warning(f"[Replication] Lost primary {self.address} ({e!r}), reconnecting in"
+                                f" {self._retry_delay} seconds")
+            except Exception:
+                logging.exception(f"[Replication] Following primary {self.address} failed, reconnecting in"
+                                  f" {self._retry_delay} seconds")
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            self._metrics.connected.set(0)
+            await asyncio.sleep(self._retry_delay)
+            self._retry_delay = min(self._retry_delay * 2, self.MAX_RETRY_DELAY)
+
+    async def _follow(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await send_packet(writer, f'replica@{socket.gethostname()}'.encode('utf-8'))
+        await send_packet(writer, JSON_CODEC.encode(Handshake(PROTOCOL_VERSION, ['binary'], None)))
+        response = JSON_CODEC.decode(await recv_packet(reader))
+        if not isinstance(response, HandshakeResponse) or response.version < REPLICATION_PROTOCOL_VERSION:
+            raise ConnectionRefusedError(f"Primary {self.address} doesn't support replication")
+        codec = CODECS[response.codec]
+
+        projects, sequences = await self._positions()
+        await send_packet(writer, codec.encode(ReplicationRequest(projects, sequences)))
+        logging.critical(f"[Replication] Following primary {self.address} ({len(projects)} local projects)")
+        self._metrics.connected.set(1)
+        self._retry_delay = self.MIN_RETRY_DELAY
+
+        while True:
+            command = codec.decode(await recv_packet(reader))
+            if isinstance(command, ReplicatedSymbols):
+                await self.apply(command)
+
+    async def apply(self, command: ReplicatedSymbols):
+        project = command.project
+        async with self._use_store(project) as store:
+            await store.apply_changes(command.symbols, command.sequences, command.reset)
+
+        if command.reset:
+            self._server.invalidate_snapshots(project)
+            self._server.mark_written(project)
+            logging.warning(f"[Replication] Replaced the store of <{project}> with the primary's")
+        self._metrics.applied.inc(len(command.sequences))
+        self._metrics.lag.observe(max(time.time() - command.committed / 1000, 0))
+        applied = command.sequences[-1] if command.sequences else 0
+        self._metrics.lag_changes.labels(project).set(max(command.sequence - applied, 0))
+
+        if command.symbols:
+            await self._server.push_update(project, [PendingWrite(command.symbols, None, None)])
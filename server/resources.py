@@ -0,0 +1,33 @@
+import hashlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict
+from zipfile import ZipFile
+
+
+@dataclass(frozen=True)
+class Resource:
+    name: str
+    content: bytes = field(repr=False)
+    sha256: str
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    @classmethod
+    def from_content(cls, name: str, content: bytes) -> 'Resource':
+        return cls(name, content, hashlib.sha256(content).hexdigest())
+
+
+def load_resources(resources: Path) -> Dict[str, Resource]:
+    # Reads (and hashes) all resources of a directory, or of the `resources/` directory of a ZIP, once
+    if resources.is_dir():
+        names = [path.relative_to(resources).as_posix() for path in resources.rglob('*') if path.is_file()]
+        return {name: Resource.from_content(name, (resources / name).read_bytes()) for name in names}
+    elif resources.is_file() and resources.suffix == '.zip':
+        prefix = 'resources/'
+        with ZipFile(resources, 'r') as zipfile:
+            return {name[len(prefix):]: Resource.from_content(name[len(prefix):], zipfile.read(name))
+                    for name in zipfile.namelist() if name.startswith(prefix) and not name.endswith('/')}
+    return {}
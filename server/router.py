@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import socket
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from common.commands import (Command, Subscribe, Unsubscribe, UpstreamSymbols, FullSyncRequest, ReplicationRequest,
+                             ImportMapping)
+from .config import ServerConfig
+from .default_symbol_server import DefaultSymbolServer
+from .ipc import (project_worker, send_message, recv_message, MESSAGE_CONNECT, MESSAGE_COMMAND, MESSAGE_DISCONNECT,
+                  MESSAGE_ACK, MESSAGE_REPLY, MESSAGE_UPDATE, MESSAGE_DONE, MESSAGE_FAILED, MESSAGE_RESET)
+from .symbol_server import Client
+from .worker import run_worker
+
+
+@dataclass
+class WorkerChannel:
+    index: int
+    process: multiprocessing.Process = field(repr=False)
+    reader: asyncio.StreamReader = field(repr=False)
+    writer: asyncio.StreamWriter = field(repr=False)
+    # Clients the worker was told about
+    clients: Set[int] = field(default_factory=set, repr=False)
+    # Commands in flight by client ID
+    commands: Dict[int, asyncio.Future] = field(default_factory=dict, repr=False)
+    relay: Optional[asyncio.Task] = field(default=None, repr=False)
+    alive: bool = True
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+
+class SymbolRouter(DefaultSymbolServer):
+    # Accepts all connections and routes the commands of each project to the worker process owning it (by a stable
+    # hash), which relays its replies and fanned out updates back over a local socket. Resources are served by the
+    # router itself. A worker which exits is restarted, backing off unless it ran for a while.
+    PROJECT_COMMANDS = (Subscribe, Unsubscribe, UpstreamSymbols, FullSyncRequest, ImportMapping)
+    MIN_RESTART_DELAY = 0.5
+    MAX_RESTART_DELAY = 30
+    # A worker which ran at least this long is restarted without delay
+    STABLE_WORKER_SECONDS = 60
+
+    def __init__(self, host: str, port: int, store_directory: Path, resources: Path, workers: int,
+                 config: Optional[ServerConfig] = None):
+        super().__init__(host, port, store_directory, resources, config)
+        self._worker_count = workers
+        self._workers: List[WorkerChannel] = []
+        self._client_ids = itertools.count(1)
+        self._ids: Dict[Client, int] = {}
+        self._clients_by_id: Dict[int, Client] = {}
+        self._replies: Dict[int, asyncio.Task] = {}
+        self._restart_delays: Dict[int, float] = {}
+        self._closing = False
+        self._worker_restarts = self.metrics.counter('jsync_worker_restarts_total',
+                                                     'Worker processes restarted after exiting')
+
+    def client_id(self, client: Client) -> int:
+        client_id = self._ids.get(client)
+        if client_id is None:
+            client_id = self._ids[client] = next(self._client_ids)
+            self._clients_by_id[client_id] = client
+        return client_id
+
+    async def route(self, client: Client, command_type: type, project: str, packet: bytes):
+        # Subscriptions are tracked by the router as well, to resync them when the client's outbound queue overflows
+        if command_type is Subscribe:
+            client.associated_projects.add(project)
+        elif command_type is Unsubscribe:
+            client.associated_projects.discard(project)
+
+        worker = self._workers[project_worker(project, len(self._workers))]
+        if not worker.alive:
+            raise ConnectionResetError(f"Worker {worker.index} owning <{project}> exited")
+
+        client_id = self.client_id(client)
+        if client_id not in worker.clients:
+            worker.clients.add(client_id)
+            description = {'name': client.name, 'address': client.address, 'codec': client.codec.name,
+                           'compression': client.compression, 'version': client.version}
+            send_message(worker.writer, MESSAGE_CONNECT, client_id, json.dumps(description).encode('utf-8'))
+
+        done = worker.commands[client_id] = asyncio.get_running_loop().create_future()
+        send_message(worker.writer, MESSAGE_COMMAND, client_id, packet)
+        await worker.writer.drain()
+        try:
+            await done
+        except ConnectionResetError:
+            client.outbox.abort()
+            raise
+
+    async def handle_packet(self, client: Client, packet: bytes) -> type:
+        command_type, project = client.codec.peek_project(packet)
+        if issubclass(command_type, self.PROJECT_COMMANDS):
+            await self.route(client, command_type, project, packet)
+            return command_type
+        return await super().handle_packet(client, packet)
+
+    async def handle_command(self, client: Client, command: Command):
+        # Only commands sent before the handshake (i.e. in JSON) reach here already decoded
+        if isinstance(command, self.PROJECT_COMMANDS):
+            await self.route(client, type(command), command.project, client.codec.encode(command))
+        elif isinstance(command, ReplicationRequest):
+            # The workers commit the changes, which the router isn't notified of
+            logging.warning(f"[Replication] Refusing to replicate to {client.name} @ {client.address}, replication"
+                            f" isn't supported with worker processes")
+            client.outbox.abort()
+        else:
+            await super().handle_command(client, command)
+
+    def disconnect(self, client: Client):
+        client_id = self._ids.pop(client, None)
+        if client_id is not None:
+            del self._clients_by_id[client_id]
+            reply = self._replies.pop(client_id, None)
+            if reply is not None:
+                reply.cancel()
+            for worker in self._workers:
+                if client_id in worker.clients:
+                    worker.clients.remove(client_id)
+                    send_message(worker.writer, MESSAGE_DISCONNECT, client_id)
+
+        client.outbox.close()
+        self._clients.remove(client)
+
+    async def queue_reply(self, worker: WorkerChannel, client_id: int, client: Client, frame: bytes):
+        try:
+            await client.outbox.put(frame)
+        except ConnectionResetError:
+            # The client disconnected meanwhile, the worker learns about it
+            return
+        finally:
+            self._replies.pop(client_id, None)
+        send_message(worker.writer, MESSAGE_ACK, client_id)
+
+    async def relay(self, worker: WorkerChannel):
+        while True:
+            try:
+                kind, client_id, payload = await recv_message(worker.reader)
+            except (ConnectionResetError, asyncio.IncompleteReadError):
+                break
+
+            client = self._clients_by_id.get(client_id)
+            if kind in (MESSAGE_DONE, MESSAGE_FAILED, MESSAGE_RESET):
+                done = worker.commands.pop(client_id, None)
+                if done is not None and not done.done():
+                    if kind == MESSAGE_DONE:
+                        done.set_result(None)
+                    elif kind == MESSAGE_FAILED:
+                        # Fails the command alone, as when handled by the router itself
+                        done.set_exception(RuntimeError(f"Worker {worker.index} failed handling the command:"
+                                                        f" {payload.decode('utf-8', 'replace')}"))
+                    else:
+                        done.set_exception(ConnectionResetError())
+            elif client is None:
+                # The client disconnected meanwhile, the worker learns about it
+                continue
+            elif kind == MESSAGE_REPLY:
+                # A client has a single reply in flight, which waits for room in its outbound queue without
+                # stalling the others
+                self._replies[client_id] = asyncio.ensure_future(self.queue_reply(worker, client_id, client, payload))
+            elif kind == MESSAGE_UPDATE:
+                self.enqueue_frame(client, payload)
+
+        # Clients of the worker's projects are dropped, as are any until it's restarted
+        worker.alive = False
+        for done in worker.commands.values():
+            if not done.done():
+                done.set_exception(ConnectionResetError())
+        for client_id in worker.clients:
+            client = self._clients_by_id.get(client_id)
+            if client is not None:
+                client.outbox.abort()
+        worker.clients.clear()
+        if self._closing:
+            return
+
+        worker.writer.close()
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join, 5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+
+        if time.monotonic() - worker.started >= self.STABLE_WORKER_SECONDS:
+            delay = 0
+            self._restart_delays.pop(worker.index, None)
+        else:
+            delay = self._restart_delays.get(worker.index, self.MIN_RESTART_DELAY)
+            self._restart_delays[worker.index] = min(delay * 2, self.MAX_RESTART_DELAY)
+        logging.critical(f"[Router] Worker {worker.index} exited ({worker.process.exitcode}), restarting in {delay}"
+                         f" seconds")
+        await asyncio.sleep(delay)
+        if not self._closing:
+            await self.start_worker(worker.index)
+            self._worker_restarts.inc()
+
+    async def start_worker(self, index: int):
+        # Workers are spawned (rather than forked from the running event loop), passing them their end of a socket pair
+        context = multiprocessing.get_context('spawn')
+        parent, child = socket.socketpair()
+        process = context.Process(target=run_worker, name=f'jsync-worker-{index}', daemon=True,
+                                  args=(index, self._worker_count, child, self._store_directory, self._config))
+        process.start()
+        child.close()
+
+        reader, writer = await asyncio.open_connection(sock=parent)
+        worker = WorkerChannel(index, process, reader, writer)
+        if index < len(self._workers):
+            self._workers[index] = worker
+        else:
+            self._workers.append(worker)
+        worker.relay = asyncio.ensure_future(self.relay(worker))
+
+    async def start_workers(self):
+        for index in range(self._worker_count):
+            await self.start_worker(index)
+        logging.info(f"[Router] Started {self._worker_count} workers")
+
+    async def serve_forever(self):
+        await self.start_workers()
+        await self.start_metrics()
+        async with await asyncio.start_server(self.handle_connection, self._host, self._port):
+            # Run forever
+            await asyncio.Future()
+
+    def close(self):
+        self._closing = True
+        self.close_metrics()
+        for client in self._clients:
+            client.outbox.close()
+        for worker in self._workers:
+            worker.writer.close()
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.terminate()
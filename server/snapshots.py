@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import mmap
+import os
+import shutil
+import struct
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import AsyncContextManager, Callable, Dict, Iterator, List, Optional, Tuple
+
+from common.codecs import CODECS
+from common.commands import DownstreamSymbols
+from common.compression import packet_size
+from common.consts import PACKET_SIZE_FORMAT
+from common.symbol import Symbol
+from common.symbol_batch import SymbolBatch
+from .async_symbol_store import AsyncSymbolStore
+from .metrics import MetricsRegistry, LATENCY_BUCKETS, SIZE_BUCKETS
+from .utils import frame_packet
+
+
+# Codec, compression and whether symbols are sent as a SymbolBatch, i.e. everything an encoded frame depends on
+SnapshotKey = Tuple[str, Optional[str], bool]
+
+SNAPSHOT_MAGIC = b'JSNP'
+SNAPSHOT_VERSION = 1
+# Magic, version, sequence number and amount of symbols, followed by the encoded frames
+SNAPSHOT_HEADER = struct.Struct('!4sBQQ')
+PACKET_SIZE = struct.Struct(PACKET_SIZE_FORMAT)
+
+
+class SnapshotMetrics:
+    def __init__(self, registry: MetricsRegistry, sizes: Callable[[], List[Tuple[Tuple[str], int]]]):
+        self.requests = registry.counter('jsync_snapshot_requests_total',
+                                         'Full syncs from scratch, by whether a snapshot served them (hit or miss)',
+                                         labels=('result',))
+        self.builds = registry.counter('jsync_snapshot_builds_total', 'Snapshots built')
+        self.build_duration = registry.histogram('jsync_snapshot_build_seconds', 'Duration of building a snapshot',
+                                                 LATENCY_BUCKETS + (30, 60, 300))
+        self.delta_symbols = registry.histogram('jsync_snapshot_delta_symbols',
+                                                'Symbols changed since the snapshot, sent after it', SIZE_BUCKETS)
+        registry.callback_gauge('jsync_snapshot_bytes', 'Size of the loaded snapshots, by project', sizes,
+                                labels=('project',))
+
+
+@dataclass
+class Snapshot:
+    # A memory-mapped snapshot file, holding the frames of a full sync of the project up to `sequence`
+    sequence: int
+    symbols: int
+    data: mmap.mmap = field(repr=False)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['Snapshot']:
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if len(data) < SNAPSHOT_HEADER.size:
+            return None
+        magic, version, sequence, symbols = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        return cls(sequence, symbols, data)
+
+    def frames(self) -> Iterator[memoryview]:
+        # Views of the mapped frames (which are never closed explicitly, so the views outlive replaced snapshots)
+        view = memoryview(self.data)
+        offset = SNAPSHOT_HEADER.size
+        while offset < len(view):
+            size, _ = packet_size(PACKET_SIZE.unpack_from(view, offset)[0])
+            end = offset + PACKET_SIZE.size + size
+            yield view[offset:end]
+            offset = end
+
+
+class SnapshotCache:
+    # Keeps a file per project (and frame encoding) with the encoded & compressed frames of a full sync, which is
+    # memory-mapped and sent as is to clients syncing from scratch, followed by the changes made since. Snapshots are
+    # rebuilt in the background once a full sync finds them `rebuild_changes` changes behind (projects are first
+    # snapshotted once they made as many changes).
+    PAGE_SYMBOLS = 5000
+    MAX_LOADED = 64
+
+    def __init__(self, directory: Callable[[str], Optional[Path]],
+                 use_store: Callable[[str], AsyncContextManager[AsyncSymbolStore]],
+                 split_page: Callable[[List[Symbol]], Iterator[List[Symbol]]], rebuild_changes: int,
+                 metrics: SnapshotMetrics):
+        self._directory = directory
+        self._use_store = use_store
+        self._split_page = split_page
+        self._rebuild_changes = rebuild_changes
+        self._loaded: 'OrderedDict[Tuple[str, SnapshotKey], Optional[Snapshot]]' = OrderedDict()
+        self._builds: Dict[Tuple[str, SnapshotKey], asyncio.Task] = {}
+        self._metrics = metrics
+
+    @property
+    def enabled(self) -> bool:
+        return self._rebuild_changes > 0
+
+    def sizes(self) -> List[Tuple[Tuple[str], int]]:
+        sizes = {}
+        for (project, _), snapshot in self._loaded.items():
+            if snapshot is not None:
+                sizes[project] = sizes.get(project, 0) + snapshot.size
+        return [((project,), size) for project, size in sizes.items()]
+
+    def _path(self, project: str, key: SnapshotKey) -> Optional[Path]:
+        directory = self._directory(project)
+        if directory is None:
+            return None
+        codec, compression, batched = key
+        return directory / f"{codec}.{compression or 'raw'}.{'batch' if batched else 'list'}.snapshot"
+
+    def get(self, project: str, key: SnapshotKey, sequence: int) -> Optional[Snapshot]:
+        # The snapshot of the project's store (now at `sequence`), rebuilding it in the background if it's missing or
+        # stale
+        path = self._path(project, key)
+        if not self.enabled or path is None:
+            return None
+
+        if (project, key) in self._loaded:
+            self._loaded.move_to_end((project, key))
+            snapshot = self._loaded[project, key]
+        else:
+            snapshot = self._loaded[project, key] = Snapshot.load(path)
+            if len(self._loaded) > self.MAX_LOADED:
+                self._loaded.popitem(last=False)
+
+        # A snapshot from the future was made of a store since replaced
+        if snapshot is not None and snapshot.sequence > sequence:
+            snapshot = self._loaded[project, key] = None
+        if sequence - (snapshot.sequence if snapshot is not None else 0) >= self._rebuild_changes:
+            self.rebuild(project, key)
+
+        self._metrics.requests.labels('hit' if snapshot is not None else 'miss').inc()
+        return snapshot
+
+    def rebuild(self, project: str, key: SnapshotKey):
+        if (project, key) not in self._builds:
+            task = self._builds[project, key] = asyncio.ensure_future(self._build(project, key))
+            task.add_done_callback(partial(self._built, project, key))
+
+    def _built(self, project: str, key: SnapshotKey, task: asyncio.Task):
+        # The build may have been cancelled, and another one started since
+        if self._builds.get((project, key)) is task:
+            del self._builds[project, key]
+
+    def invalidate(self, project: str):
+        # Drops the project's snapshots, e.g. as its store was replaced
+        for loaded in [loaded for loaded in self._loaded if loaded[0] == project]:
+            del self._loaded[loaded]
+        for build in [build for build in self._builds if build[0] == project]:
+            self._builds.pop(build).cancel()
+        directory = self._directory(project)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def close(self):
+        for build in self._builds.values():
+            build.cancel()
+        self._builds.clear()
+        self._loaded.clear()
+
+    def _encode(self, project: str, key: SnapshotKey, symbols: List[Symbol]) -> bytes:
+        codec, compression, batched = key
+        frames = []
+        for page in self._split_page(symbols):
+            command = DownstreamSymbols(project, SymbolBatch.from_symbols(page) if batched else page)
+            frames.append(frame_packet(CODECS[codec].encode(command), compression))
+        return b''.join(frames)
+
+    def _write(self, file, project: str, key: SnapshotKey, symbols: List[Symbol]):
+        file.write(self._encode(project, key, symbols))
+
+    async def _build(self, project: str, key: SnapshotKey):
+        path = self._path(project, key)
+        temporary = path.with_suffix('.tmp')
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Pages are read in order of change up to the current sequence number. Symbols changed while building
+            # move beyond it, and are sent in the delta following the snapshot.
+            async with self._use_store(project) as store:
+                sequence = await store.get_sequence()
+                symbols = 0
+                after = 0
+                with open(temporary, 'wb') as file:
+                    file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, 0))
+                    while True:
+                        page, sequences = await store.get_changes_page(after=after, limit=self.PAGE_SYMBOLS)
+                        included = bisect_right(sequences, sequence)
+                        if included:
+                            # Encoding & compressing runs off the event loop
+                            await loop.run_in_executor(None, self._write, file, project, key, page[:included])
+                            symbols += included
+                        if included < len(page) or len(page) < self.PAGE_SYMBOLS:
+                            break
+                        after = sequences[-1]
+
+                    file.seek(0)
+                    file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sequence, symbols))
+            os.replace(temporary, path)
+        except asyncio.CancelledError:
+            temporary.unlink(missing_ok=True)
+            raise
+        except Exception:
+            logging.exception(f"[Snapshot] Building the snapshot of <{project}> failed")
+            temporary.unlink(missing_ok=True)
+            return
+
+        duration = time.perf_counter() - start
+        snapshot = Snapshot.load(path)
+        self._loaded[project, key] = snapshot
+        self._loaded.move_to_end((project, key))
+        self._metrics.builds.inc()
+        self._metrics.build_duration.observe(duration)
+        logging.info(f"[Snapshot] Built the snapshot of <{project}> ({'/'.join(map(str, key))}) at sequence number"
+                     f" {sequence}: {symbols} symbols, {snapshot.size if snapshot else 0} bytes in {duration:.2f}s")
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional
+
+from .async_symbol_store import AsyncSymbolStore
+from .metrics import MetricsRegistry
+
+
+class StoreCacheMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.hits = registry.counter('jsync_store_cache_hits_total', 'Store accesses served by an open store')
+        self.misses = registry.counter('jsync_store_cache_misses_total', 'Store accesses which opened a store')
+        self.evictions = registry.counter('jsync_store_cache_evictions_total', 'Stores closed by the store cache')
+        self.open = registry.gauge('jsync_open_stores', 'Currently open stores')
+
+
+@dataclass
+class CachedStore:
+    store: AsyncSymbolStore
+    # In-flight operations, a store is never closed under them
+    users: int = 0
+    # Pinned stores (i.e. of projects with subscribers) are never evicted
+    pins: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def evictable(self) -> bool:
+        return self.users == 0 and self.pins == 0
+
+
+class StoreCache:
+    # Keeps the stores of recently used projects open, closing the least recently used ones beyond `max_stores`
+    # and ones left unused for `idle_timeout` seconds.
+    def __init__(self, factory: Callable[[str], AsyncSymbolStore], max_stores: int, idle_timeout: float,
+                 metrics: StoreCacheMetrics):
+        self._factory = factory
+        self._max_stores = max_stores
+        self._idle_timeout = idle_timeout
+        self._metrics = metrics
+        self._entries: 'OrderedDict[str, CachedStore]' = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _entry(self, project: str) -> CachedStore:
+        entry = self._entries.get(project)
+        if entry is None:
+            self._metrics.misses.inc()
+            entry = self._entries[project] = CachedStore(self._factory(project))
+            self._metrics.open.inc()
+        else:
+            self._metrics.hits.inc()
+            self._entries.move_to_end(project)
+        return entry
+
+    @asynccontextmanager
+    async def use(self, project: str) -> AsyncIterator[AsyncSymbolStore]:
+        entry = self._entry(project)
+        entry.users += 1
+        try:
+            yield entry.store
+        finally:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            await self._evict_overflow()
+
+    def pin(self, project: str):
+        self._entry(project).pins += 1
+
+    def unpin(self, project: str):
+        entry = self._entries.get(project)
+        if entry is not None and entry.pins > 0:
+            entry.pins -= 1
+            entry.last_used = time.monotonic()
+
+    def _evict(self, project: str) -> AsyncSymbolStore:
+        entry = self._entries.pop(project)
+        self._metrics.evictions.inc()
+        self._metrics.open.dec()
+        return entry.store
+
+    async def _close(self, stores):
+        # Closing waits for the store's threads, which must not block the event loop
+        if stores:
+            await asyncio.get_running_loop().run_in_executor(None, lambda: [store.close() for store in stores])
+
+    async def _evict_overflow(self):
+        # Least recently used stores come first; pinned or in-use ones are skipped (and may exceed the bound)
+        overflow = len(self._entries) - self._max_stores
+        if overflow <= 0:
+            return
+
+        stores = []
+        for project in [project for project, entry in self._entries.items() if entry.evictable][:overflow]:
+            logging.debug(f"[Store Cache] Evicting store of <{project}>")
+            stores.append(self._evict(project))
+        await self._close(stores)
+
+    async def evict_idle(self):
+        deadline = time.monotonic() - self._idle_timeout
+        stores = []
+        for project in [project for project, entry in self._entries.items()
+                        if entry.evictable and entry.last_used < deadline]:
+            logging.debug(f"[Store Cache] Closing idle store of <{project}>")
+            stores.append(self._evict(project))
+        await self._close(stores)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self._idle_timeout / 2)
+            await self.evict_idle()
+
+    def start(self):
+        if self._sweeper is None and self._idle_timeout > 0:
+            self._sweeper = asyncio.ensure_future(self._sweep())
+
+    def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        for entry in self._entries.values():
+            entry.store.close()
+        self._metrics.open.set(0)
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,22 +1,38 @@
 import time
+import signal
 import asyncio
 import base64
 import logging
-import socket
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import List, Dict, Set, Mapping
+from functools import partial
+from pathlib import Path
+from typing import List, Dict, Set, Mapping, Iterator, Optional, Tuple, Union
 
-from .utils import recv_packet, send_packet
+from .utils import recv_packet, send_packet, frame_packet
 from common.lazy_dict import LazyDict
 from common.symbol import Symbol
+from common.symbol_batch import SymbolBatch
 from common.symbol_store import SymbolStoreABC
+from .async_symbol_store import AsyncSymbolStore, StoreMetrics
+from .compactor import Compactor, CompactorMetrics
+from .config import ServerConfig, OVERFLOW_RESYNC
+from .logs import audit_logger
+from .metrics import MetricsRegistry, MetricsListener, SIZE_BUCKETS, monitor_event_loop_lag
+from .outbox import ClientOutbox, OutboxMetrics
+from .replication import ReplicationSource, ReplicationFollower, ReplicationMetrics
+from .resources import Resource
+from .snapshots import SnapshotCache, SnapshotMetrics, SnapshotKey
+from .store_cache import StoreCache, StoreCacheMetrics
+from .write_coalescer import WriteCoalescer, WriteCoalescerMetrics, PendingWrite
+from common.codecs import JSON_CODEC, CODECS, JsonCodec, BinaryCodec
+from common.compression import COMPRESSIONS
+from common.consts import (PROTOCOL_VERSION, SYMBOL_BATCH_PROTOCOL_VERSION, RESYNC_PROTOCOL_VERSION,
+                           SEQUENCE_PROTOCOL_VERSION)
 from common.commands import (Command, Subscribe, Unsubscribe, UpstreamSymbols, DownstreamSymbols, FullSyncRequest,
-                             ResourceRequest, ResourceResponse, FullSyncComplete)
-
-
-logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+                             ResourceRequest, ResourceResponse, FullSyncComplete, Handshake, HandshakeResponse,
+                             ResyncRequired, ResourceChunkRequest, ResourceChunk, ReplicationRequest)
 
 
 @dataclass(frozen=True, unsafe_hash=True)
@@ -25,43 +41,347 @@ class Client:
     address: str
     reader: asyncio.StreamReader = field(repr=False, compare=False, hash=False)
     writer: asyncio.StreamWriter = field(repr=False, compare=False, hash=False)
+    codec: Union[JsonCodec, BinaryCodec] = field(default=JSON_CODEC, repr=False, compare=False, hash=False)
+    compression: Optional[str] = field(default=None, repr=False, compare=False, hash=False)
+    # Protocol version sent in the client's handshake, 0 for clients predating it
+    version: int = field(default=0, repr=False, compare=False, hash=False)
+    outbox: ClientOutbox = field(default=None, repr=False, compare=False, hash=False)
     associated_projects: Set[str] = field(init=False, default_factory=lambda: set(), repr=False, compare=False,
                                           hash=False)
 
 
+class ServerMetrics:
+    def __init__(self, registry: MetricsRegistry, server: 'SymbolServer'):
+        self.commands = registry.histogram('jsync_command_duration_seconds', 'Duration of handling commands',
+                                           labels=('command',))
+        self.inbound_bytes = registry.histogram('jsync_inbound_packet_bytes',
+                                                'Sizes of (decompressed) packets received from clients', SIZE_BUCKETS)
+        self.event_loop_lag = registry.histogram('jsync_event_loop_lag_seconds',
+                                                 'Delay of the event loop in running a ready task')
+        registry.callback_gauge('jsync_connected_clients', 'Currently connected clients',
+                                lambda: [((), len(server.clients))])
+        registry.callback_gauge('jsync_project_subscribers', 'Currently subscribed clients, by project',
+                                server.subscriber_counts, labels=('project',))
+
+
 class SymbolServer(ABC):
-    def __init__(self, host: str, port: int):
+    # Full sync is streamed as pages bounded both by symbol count and (estimated) encoded size
+    FULL_SYNC_PAGE_SYMBOLS = 5000
+    FULL_SYNC_PAGE_BYTES = 1 << 20
+    # Estimated encoding overhead of a single symbol, excluding its strings
+    SYMBOL_ENCODING_OVERHEAD = 100
+    # Resources are streamed in chunks of this size
+    RESOURCE_CHUNK_BYTES = 1 << 18
+    # Seconds between measurements of the event loop's lag
+    EVENT_LOOP_LAG_INTERVAL = 0.5
+
+    def __init__(self, host: str, port: int, config: Optional[ServerConfig] = None):
         self._host = host
         self._port = port
-        self._stores: Mapping[str, SymbolStoreABC] = LazyDict(mapping=self._get_store)
+        self._config = config if config is not None else ServerConfig()
+        self.metrics = MetricsRegistry()
+        self._metrics = ServerMetrics(self.metrics, self)
+        self._store_metrics = StoreMetrics(self.metrics)
+        self._stores = StoreCache(lambda project: AsyncSymbolStore(project, lambda: self._get_store(project),
+                                                                   self._store_metrics),
+                                  self._config.store_cache_max_stores, self._config.store_idle_timeout,
+                                  StoreCacheMetrics(self.metrics))
+        self._compactor = Compactor(self._get_projects, self._stores.use, self._config.compaction_interval,
+                                    self._config.history_keep_versions, self._config.history_max_age,
+                                    CompactorMetrics(self.metrics))
+        self._snapshot_metrics = SnapshotMetrics(self.metrics, lambda: self._snapshots.sizes())
+        self._snapshots = SnapshotCache(self._get_snapshot_directory, self._stores.use, self.split_page,
+                                        self._config.snapshot_rebuild_changes, self._snapshot_metrics)
+        self._outbox_metrics = OutboxMetrics(self.metrics)
+        self._write_coalescer_metrics = WriteCoalescerMetrics(self.metrics)
+        self._write_coalescers: Mapping[str, WriteCoalescer] = LazyDict(
+            mapping=lambda project: WriteCoalescer(partial(self._stores.use, project),
+                                                   self._config.write_coalesce_window,
+                                                   self._config.write_coalesce_max_symbols,
+                                                   partial(self.push_update, project), self._write_coalescer_metrics)
+        )
+        self._replication = ReplicationSource(self, self._get_projects, self._stores.use)
+        self._replication_metrics = ReplicationMetrics(self.metrics, self._replication)
+        self._follower: Optional[ReplicationFollower] = None
+        if self._config.replicate_from is not None:
+            self._follower = ReplicationFollower(self, self._get_projects, self._stores.use,
+                                                 self._config.replicate_from, self._replication_metrics)
         self._clients: Set[Client] = set()
         self._project_associations: Dict[str, Set[Client]] = defaultdict(lambda: set())
+        self._metrics_listener: Optional[MetricsListener] = None
+        self._event_loop_monitor: Optional[asyncio.Task] = None
+
+    @property
+    def clients(self) -> Set[Client]:
+        return self._clients
+
+    def subscriber_counts(self) -> List[Tuple[Tuple[str], int]]:
+        counts = defaultdict(int)
+        for client in self._clients:
+            for project in client.associated_projects:
+                counts[project] += 1
+        return [((project,), count) for project, count in counts.items()]
+
+    @property
+    def following(self) -> bool:
+        return self._follower is not None
+
+    def promote(self):
+        # Stops following the primary, accepting symbols from clients from now on
+        if self._follower is None:
+            return
+        logging.critical(f"[Replication] Promoted, no longer following primary {self._follower.address}")
+        self._follower.close()
+        self._follower = None
+
+    def invalidate_snapshots(self, project: str):
+        self._snapshots.invalidate(project)
+
+    def mark_written(self, project: str):
+        # Notifies replicas and schedules the project's store for compaction
+        self._replication.notify(project)
+        self._compactor.mark_written(project)
 
     @abstractmethod
     def _get_store(self, project: str) -> SymbolStoreABC:
         raise NotImplementedError
 
     @abstractmethod
-    def _get_resource(self, name: str) -> bytes:
+    def _get_projects(self) -> List[str]:
         raise NotImplementedError
 
+    @abstractmethod
+    def _get_resource(self, name: str) -> Optional[Resource]:
+        raise NotImplementedError
+
+    def _get_snapshot_directory(self, project: str) -> Optional[Path]:
+        # Directory of the project's snapshots, None disables them
+        return None
+
     @staticmethod
-    async def push_to_client(client: Client, payload: bytes):
-        try:
-            await send_packet(client.writer, payload)
-        except socket.error:
-            logging.debug(f"Connection from {client.writer.get_extra_info('peername')} is closed but not yet cleared")
+    async def push_frame(client: Client, frame: bytes):
+        # Responses to a client's own requests wait for room in its outbound queue
+        await client.outbox.put(frame)
+
+    def enqueue_frame(self, client: Client, frame: bytes):
+        # Updates fanned out to a client never wait for it, overflowing its outbound queue instead
+        if not client.outbox.offer(frame):
+            self.handle_overflow(client)
+
+    def handle_overflow(self, client: Client):
+        if self._config.outbound_overflow_policy == OVERFLOW_RESYNC and client.version >= RESYNC_PROTOCOL_VERSION:
+            logging.warning(f"[Overflow] Outbound queue of {client.name} @ {client.address} overflowed, resyncing")
+            # Responses to the client's own requests (e.g. a full sync in progress) are kept
+            client.outbox.clear_updates()
+            for project in client.associated_projects:
+                client.outbox.offer(self.encode_frame(client, ResyncRequired(project)))
+        else:
+            logging.warning(f"[Overflow] Outbound queue of {client.name} @ {client.address} overflowed,"
+                            f" disconnecting")
+            client.outbox.abort()
+
+    @staticmethod
+    def encode_frame(client: Client, command: Command) -> bytes:
+        return frame_packet(client.codec.encode(command), client.compression)
+
+    async def push_command(self, client: Client, command: Command):
+        await self.push_frame(client, self.encode_frame(client, command))
+
+    async def push_update(self, project: str, writes: List[PendingWrite]):
+        # Every subscriber receives the symbols of all writes in the batch, except those it originated
+        self.mark_written(project)
+        originators = {write.originator for write in writes}
+        symbols = None
+        frames = {}
+        for client in list(self._project_associations[project]):
+            if client in originators:
+                others = [write.symbols for write in writes if write.originator != client]
+                if others:
+                    command = DownstreamSymbols(project, self.client_symbols(client, SymbolBatch.concatenate(others)))
+                    self.enqueue_frame(client, self.encode_frame(client, command))
+            else:
+                if symbols is None:
+                    symbols = SymbolBatch.concatenate([write.symbols for write in writes])
+                # Subscribers sharing a codec, compression & symbols layout share the same (encoded) frame
+                batched = self.supports_symbol_batch(client)
+                key = client.codec.name, client.compression, batched
+                if key not in frames:
+                    command = DownstreamSymbols(project, self.client_symbols(client, symbols))
+                    frames[key] = self.encode_frame(client, command)
+                self.enqueue_frame(client, frames[key])
+
+    @staticmethod
+    def supports_symbol_batch(client: Client) -> bool:
+        return client.version >= SYMBOL_BATCH_PROTOCOL_VERSION
+
+    @classmethod
+    def snapshot_key(cls, client: Client) -> SnapshotKey:
+        return client.codec.name, client.compression, cls.supports_symbol_batch(client)
+
+    @classmethod
+    def client_symbols(cls, client: Client,
+                       symbols: Union[List[Symbol], SymbolBatch]) -> Union[List[Symbol], SymbolBatch]:
+        if cls.supports_symbol_batch(client):
+            return SymbolBatch.from_symbols(symbols)
+        elif isinstance(symbols, SymbolBatch):
+            return list(symbols)
+        return symbols
+
+    async def push_symbols(self, client: Client, project: str, symbols: Union[List[Symbol], SymbolBatch]):
+        await self.push_command(client, DownstreamSymbols(project, self.client_symbols(client, symbols)))
+
+    @classmethod
+    def split_page(cls, symbols: List[Symbol]) -> Iterator[List[Symbol]]:
+        page = []
+        page_size = 0
+        for symbol in symbols:
+            symbol_size = (cls.SYMBOL_ENCODING_OVERHEAD + len(symbol.canonical_signature) + len(symbol.name or '') +
+                           len(symbol.author or ''))
+            if page and page_size + symbol_size > cls.FULL_SYNC_PAGE_BYTES:
+                yield page
+                page = []
+                page_size = 0
+
+            page.append(symbol)
+            page_size += symbol_size
 
-    async def push_update(self, project: str, symbols: List[Symbol], originator: Client):
-        command = DownstreamSymbols(project, symbols)
-        payload = command.encode()
-        for client in self._project_associations[project]:
-            if client != originator:
-                await self.push_to_client(client, payload)
+        if page:
+            yield page
 
-    async def push_symbols(self, client: Client, project: str, symbols: List[Symbol]):
-        payload = DownstreamSymbols(project, symbols).encode()
-        await self.push_to_client(client, payload)
+    async def full_sync(self, client: Client, project: str, since: int, seq: Optional[int] = None):
+        timestamp = int(time.time())
+        snapshot = None
+
+        async with self._stores.use(project) as store:
+            sequence = await store.get_sequence()
+            # A sequence number from the future means the store was replaced, so everything is sent again
+            if seq is not None and seq > sequence:
+                seq = 0
+
+            # Syncs from scratch start with the project's snapshot (if there's one), followed by the changes since
+            if since == 0 and not seq:
+                snapshot = self._snapshots.get(project, self.snapshot_key(client), sequence)
+                if snapshot is not None:
+                    for frame in snapshot.frames():
+                        await self.push_frame(client, frame)
+                    seq = snapshot.sequence
+
+            if seq is None:
+                # Changes made while paging have a sequence number above `sequence`, so the next sync includes them
+                after = None
+                while True:
+                    symbols = await store.get_symbols_page(since=since, after=after, limit=self.FULL_SYNC_PAGE_SYMBOLS)
+                    for page in self.split_page(symbols):
+                        await self.push_symbols(client, project, page)
+
+                    if len(symbols) < self.FULL_SYNC_PAGE_SYMBOLS:
+                        break
+                    after = symbols[-1].author, symbols[-1].canonical_signature
+            else:
+                sequence = seq
+                delta = 0
+                while True:
+                    symbols, sequence = await store.get_symbols_seq_page(after=sequence,
+                                                                         limit=self.FULL_SYNC_PAGE_SYMBOLS)
+                    for page in self.split_page(symbols):
+                        await self.push_symbols(client, project, page)
+
+                    delta += len(symbols)
+                    if len(symbols) < self.FULL_SYNC_PAGE_SYMBOLS:
+                        break
+                if snapshot is not None:
+                    self._snapshot_metrics.delta_symbols.observe(delta)
+
+        if client.version < SEQUENCE_PROTOCOL_VERSION:
+            sequence = None
+        await self.push_command(client, FullSyncComplete(project, timestamp, sequence))
+
+    async def push_resource(self, client: Client, request: ResourceChunkRequest):
+        resource = self._get_resource(request.name)
+        if resource is None:
+            logging.info(f"[Resource] Request from {client.name} for non-existent resource <{request.name}>")
+            await self.push_command(client, ResourceChunk(request.name, None, 0, 0, b''))
+            return
+
+        if request.sha256 == resource.sha256 and not request.offset:
+            logging.info(f"[Resource] {client.name} is up to date with resource <{request.name}>")
+            await self.push_command(client, ResourceChunk(request.name, resource.sha256, resource.size, resource.size,
+                                                          b''))
+            return
+
+        # Downloads are resumed only if the resource didn't change since
+        offset = 0
+        if request.sha256 == resource.sha256 and 0 < request.offset <= resource.size:
+            offset = request.offset
+        logging.info(f"[Resource] Request from {client.name} for resource <{request.name}> from offset {offset}")
+
+        content = memoryview(resource.content)
+        while True:
+            chunk = bytes(content[offset:offset + self.RESOURCE_CHUNK_BYTES])
+            await self.push_command(client, ResourceChunk(request.name, resource.sha256, resource.size, offset, chunk))
+            offset += len(chunk)
+            if offset >= resource.size:
+                break
+
+    @staticmethod
+    def negotiate_codec(handshake: Handshake) -> Union[JsonCodec, BinaryCodec]:
+        return next((CODECS[codec] for codec in handshake.codecs if codec in CODECS), JSON_CODEC)
+
+    @staticmethod
+    def negotiate_compression(handshake: Handshake) -> Optional[str]:
+        return next((compression for compression in handshake.compressions or [] if compression in COMPRESSIONS),
+                    None)
+
+    async def handle_command(self, client: Client, command: Command):
+        name = client.name
+        if isinstance(command, Subscribe):
+            logging.info(f"[Subscribe] Request from {name} for project <{command.project}>")
+            if command.project not in client.associated_projects:
+                self._stores.pin(command.project)
+            client.associated_projects.add(command.project)
+            self._project_associations[command.project].add(client)
+        elif isinstance(command, Unsubscribe):
+            logging.info(f"[Unsubscribe] Request from {name} for project <{command.project}>")
+            client.associated_projects.remove(command.project)
+            self._stores.unpin(command.project)
+            if client in self._project_associations[command.project]:
+                self._project_associations[command.project].remove(client)
+        elif isinstance(command, UpstreamSymbols):
+            if self.following:
+                # Rather than silently dropping the symbols, the client is disconnected, which every client version
+                # notices (and its user may reconnect to the primary)
+                logging.warning(f"[Replication] Rejecting {len(command.symbols)} symbols from {name} for project"
+                                f" <{command.project}>, following a primary, disconnecting it")
+                client.outbox.abort()
+                return
+            symbols = SymbolBatch.from_symbols(command.symbols).stamped(int(time.time()), name)
+
+            if command.loggable:
+                # Symbols are formatted (into the project's audit log) by the logging thread
+                audit_logger.info(f"[Symbol] {name} @ {command.project}: {len(symbols)} symbols",
+                                  extra={'audit_project': command.project, 'audit_symbols': symbols})
+
+            await self._write_coalescers[command.project].submit(symbols, client)
+        elif isinstance(command, FullSyncRequest):
+            since = int(command.since)
+            seq = int(command.seq) if command.seq is not None else None
+            logging.info(f"[Full Sync] Request from {name} for project <{command.project}> since {since}"
+                         f" (sequence number {seq})")
+            await self.full_sync(client, command.project, since, seq)
+        elif isinstance(command, ResourceRequest):
+            resource = self._get_resource(command.name)
+            if resource is None:
+                logging.info(f"[Resource] Request from {name} for non-existent resource <{command.name}>")
+                response = ResourceResponse(command.name, None)
+            else:
+                logging.info(f"[Resource] Request from {name} for resource <{command.name}>")
+                response = ResourceResponse(command.name, base64.b64encode(resource.content).decode('utf-8'))
+            await self.push_command(client, response)
+        elif isinstance(command, ResourceChunkRequest):
+            await self.push_resource(client, command)
+        elif isinstance(command, ReplicationRequest):
+            logging.critical(f"[Replication] {name} @ {client.address} follows this server")
+            self._replication.add(client, command)
 
     async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         name = (await recv_packet(reader)).decode('utf-8')
@@ -69,67 +389,109 @@ class SymbolServer(ABC):
         address = writer.get_extra_info('peername')
         logging.critical(f"[Connect] New connection from {name} @ {address}")
 
-        client = Client(name, address, reader, writer)
+        # Clients supporting the handshake send it right after their name, older clients only speak JSON
+        try:
+            command = JSON_CODEC.decode(await recv_packet(reader))
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            logging.critical(f"[Disconnect] {name} disconnected @ {address}")
+            return
+
+        codec = JSON_CODEC
+        compression = None
+        version = 0
+        if isinstance(command, Handshake):
+            version = command.version
+            codec = self.negotiate_codec(command)
+            compression = self.negotiate_compression(command)
+            logging.debug(f"[Handshake] {name} @ {address} speaks protocol version {command.version},"
+                          f" using {codec.name} codec and {compression} compression")
+            await send_packet(writer, JSON_CODEC.encode(HandshakeResponse(PROTOCOL_VERSION, codec.name, compression)))
+            command = None
+
+        client = Client(name, address, reader, writer, codec, compression, version,
+                        ClientOutbox(writer, self._config.outbound_queue_bytes, self._config.outbound_response_bytes,
+                                     self._outbox_metrics))
+        client.outbox.start()
 
         # Save the connection
         self._clients.add(client)
 
-        while True:
-            try:
-                packet = await recv_packet(reader)
-                command = Command.decode(packet)
-
-                if isinstance(command, Subscribe):
-                    logging.info(f"[Subscribe] Request from {name} for project <{command.project}>")
-                    client.associated_projects.add(command.project)
-                    self._project_associations[command.project].add(client)
-                elif isinstance(command, Unsubscribe):
-                    logging.info(f"[Unsubscribe] Request from {name} for project <{command.project}>")
-                    client.associated_projects.remove(command.project)
-                    if client in self._project_associations[command.project]:
-                        self._project_associations[command.project].remove(client)
-                elif isinstance(command, UpstreamSymbols):
-                    store = self._stores[command.project]
-                    symbols = [symbol.timestamped.authored(name) for symbol in command.symbols]
-
-                    if command.loggable:
-                        for symbol in symbols:
-                            logging.info(f"[Symbol] {name} @ {command.project}:"
-                                         f" {symbol.canonical_signature} -> {symbol.name}")
-
-                    store.push_symbols(symbols)
-                    await self.push_update(command.project, symbols, client)
-                elif isinstance(command, FullSyncRequest):
-                    since = int(command.since)
-                    logging.info(f"[Full Sync] Request from {name} for project <{command.project}> since {since}")
-                    timestamp = int(time.time())
-                    store = self._stores[command.project]
-                    symbols = list(store.get_symbols(since=since))
-                    await self.push_symbols(client, command.project, symbols)
-                    await self.push_to_client(client, FullSyncComplete(command.project, timestamp).encode())
-                elif isinstance(command, ResourceRequest):
-                    resource = command.name
-                    content = self._get_resource(resource)
-                    if content is None:
-                        logging.info(f"[Resource] Request from {name} for non-existent resource <{command.name}>")
-                        response = ResourceResponse(resource, None)
+        try:
+            while True:
+                try:
+                    if command is None:
+                        packet = await recv_packet(reader)
+                        self._metrics.inbound_bytes.observe(len(packet))
+                        start = time.perf_counter()
+                        command_type = await self.handle_packet(client, packet)
                     else:
-                        logging.info(f"[Resource] Request from {name} for resource <{command.name}>")
-                        response = ResourceResponse(resource, base64.b64encode(content).decode('utf-8'))
-                    await self.push_to_client(client, response.encode())
-            except (ConnectionResetError, asyncio.IncompleteReadError):
-                logging.critical(f"[Disconnect] {name} disconnected @ {address}")
-                self._clients.remove(client)
-                for project in client.associated_projects:
-                    self._project_associations[project].remove(client)
+                        start = time.perf_counter()
+                        await self.handle_command(client, command)
+                        command_type = type(command)
+                    self._metrics.commands.labels(command_type.__name__).observe(time.perf_counter() - start)
+                except (ConnectionResetError, asyncio.IncompleteReadError):
+                    logging.critical(f"[Disconnect] {name} disconnected @ {address}")
+                    break
+                except Exception:  # noqa
+                    # e.g. a failed commit of the batch the client's symbols were coalesced into, which fails the
+                    # command alone rather than the connection
+                    logging.exception(f"[Error] Failed handling a command of {name} @ {address}")
+                finally:
+                    command = None
+        finally:
+            self.disconnect(client)
 
-                break
+    async def handle_packet(self, client: Client, packet: bytes) -> type:
+        # Returns the type of the handled command
+        command = client.codec.decode(packet)
+        await self.handle_command(client, command)
+        return type(command)
+
+    def disconnect(self, client: Client):
+        self._replication.remove(client)
+        client.outbox.close()
+        self._clients.remove(client)
+        for project in client.associated_projects:
+            self._project_associations[project].remove(client)
+            self._stores.unpin(project)
+
+    async def start_metrics(self, port_offset: int = 0):
+        self._event_loop_monitor = asyncio.ensure_future(monitor_event_loop_lag(self._metrics.event_loop_lag,
+                                                                                self.EVENT_LOOP_LAG_INTERVAL))
+        if self._config.metrics_port:
+            self._metrics_listener = MetricsListener(self.metrics, self._config.metrics_host,
+                                                     self._config.metrics_port + port_offset)
+            await self._metrics_listener.start()
 
     async def serve_forever(self):
+        self._stores.start()
+        self._compactor.start()
+        await self.start_metrics()
+        if self._follower is not None:
+            self._follower.start()
+            # A follower is promoted (e.g. once its primary failed) by SIGUSR1
+            if hasattr(signal, 'SIGUSR1'):
+                asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.promote)
         async with await asyncio.start_server(self.handle_connection, self._host, self._port):
             # Run forever
             await asyncio.Future()
 
+    def close_metrics(self):
+        if self._event_loop_monitor is not None:
+            self._event_loop_monitor.cancel()
+            self._event_loop_monitor = None
+        if self._metrics_listener is not None:
+            self._metrics_listener.close()
+            self._metrics_listener = None
+
     def close(self):
-        for store in self._stores.values():
-            store.close()
+        self.close_metrics()
+        if self._follower is not None:
+            self._follower.close()
+        for client in list(self._replication.replicas):
+            self._replication.remove(client)
+        self._compactor.close()
+        self._snapshots.close()
+        for client in self._clients:
+            client.outbox.close()
+        self._stores.close()
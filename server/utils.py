@@ -1,14 +1,26 @@
 import struct
 import asyncio
+from typing import Optional
+
+from common.compression import compress_packet, packet_size, decompress_packet
 from common.consts import PACKET_SIZE_FORMAT
 
 
 async def recv_packet(reader: asyncio.StreamReader) -> bytes:
-    size = struct.unpack(PACKET_SIZE_FORMAT, await reader.readexactly(struct.calcsize(PACKET_SIZE_FORMAT)))[0]
-    return await reader.readexactly(size)
+    size_field = struct.unpack(PACKET_SIZE_FORMAT, await reader.readexactly(struct.calcsize(PACKET_SIZE_FORMAT)))[0]
+    size, compressed = packet_size(size_field)
+    return decompress_packet(await reader.readexactly(size), compressed)
+
+
+def frame_packet(data: bytes, compression: Optional[str] = None) -> bytes:
+    size_field, data = compress_packet(data, compression)
+    return struct.pack(PACKET_SIZE_FORMAT, size_field) + data
 
 
-async def send_packet(writer: asyncio.StreamWriter, data: bytes):
-    writer.write(struct.pack(PACKET_SIZE_FORMAT, len(data)))
-    writer.write(data)
+async def send_frame(writer: asyncio.StreamWriter, frame: bytes):
+    writer.write(frame)
     await writer.drain()
+
+
+async def send_packet(writer: asyncio.StreamWriter, data: bytes, compression: Optional[str] = None):
+    await send_frame(writer, frame_packet(data, compression))
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from common.codecs import CODECS
+from .config import ServerConfig
+from .default_symbol_server import DefaultSymbolServer
+from .ipc import (project_worker, send_message, recv_message, MESSAGE_CONNECT, MESSAGE_COMMAND, MESSAGE_DISCONNECT,
+                  MESSAGE_ACK, MESSAGE_REPLY, MESSAGE_UPDATE, MESSAGE_DONE, MESSAGE_FAILED, MESSAGE_RESET)
+from .logs import setup_logging
+from .symbol_server import Client
+
+
+class RemoteOutbox:
+    # Stands in for the outbox of a client connected to the router, relaying frames to it. The router's outbox of the
+    # client applies the outbound queue bound and overflow policy.
+    def __init__(self, worker: 'SymbolWorker', client_id: int):
+        self._worker = worker
+        self._client_id = client_id
+
+    def start(self):
+        pass
+
+    @property
+    def depth(self) -> int:
+        return 0
+
+    async def put(self, frame: bytes):
+        await self._worker.relay_reply(self._client_id, frame)
+
+    def offer(self, frame: bytes) -> bool:
+        self._worker.relay_update(self._client_id, frame)
+        return True
+
+    def clear(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def close(self):
+        self._worker.cancel_reply(self._client_id)
+
+
+class SymbolWorker(DefaultSymbolServer):
+    # Serves the projects hashed to it, for clients connected to the router
+    def __init__(self, index: int, workers: int, store_directory: Path, config: Optional[ServerConfig] = None):
+        super().__init__('', 0, store_directory, None, config)
+        self._index = index
+        self._workers = workers
+        self._router: Optional[asyncio.StreamWriter] = None
+        self._remote_clients: Dict[int, Client] = {}
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._commands: Set[asyncio.Task] = set()
+
+    def _get_projects(self) -> List[str]:
+        return [project for project in super()._get_projects()
+                if project_worker(project, self._workers) == self._index]
+
+    async def relay_reply(self, client_id: int, frame: bytes):
+        self._replies[client_id] = asyncio.get_running_loop().create_future()
+        send_message(self._router, MESSAGE_REPLY, client_id, frame)
+        await self._replies[client_id]
+
+    def relay_update(self, client_id: int, frame: bytes):
+        send_message(self._router, MESSAGE_UPDATE, client_id, frame)
+
+    def cancel_reply(self, client_id: int):
+        reply = self._replies.pop(client_id, None)
+        if reply is not None and not reply.done():
+            reply.set_exception(ConnectionResetError())
+
+    async def run_command(self, client_id: int, client: Client, packet: bytes):
+        kind, description = MESSAGE_DONE, b''
+        start = time.perf_counter()
+        try:
+            command_type = await self.handle_packet(client, packet)
+            self._metrics.commands.labels(command_type.__name__).observe(time.perf_counter() - start)
+        except ConnectionResetError:
+            logging.debug(f"[Worker {self._index}] {client.name} disconnected while handling its command")
+            kind = MESSAGE_RESET
+        except Exception as e:  # noqa
+            logging.exception(f"[Worker {self._index}] Failed handling command of {client.name}")
+            kind, description = MESSAGE_FAILED, repr(e).encode('utf-8')
+        send_message(self._router, kind, client_id, description)
+
+    def connect(self, client_id: int, description: dict):
+        client = Client(description['name'], tuple(description['address']), None, None,
+                        CODECS[description['codec']], description['compression'], description['version'],
+                        RemoteOutbox(self, client_id))
+        self._remote_clients[client_id] = client
+        self._clients.add(client)
+
+    async def serve(self, sock: socket.socket):
+        reader, self._router = await asyncio.open_connection(sock=sock)
+        self._stores.start()
+        self._compactor.start()
+        await self.start_metrics(1 + self._index)
+        logging.info(f"[Worker {self._index}] Serving {len(self._get_projects())} existing projects")
+
+        while True:
+            try:
+                kind, client_id, payload = await recv_message(reader)
+            except (ConnectionResetError, asyncio.IncompleteReadError):
+                logging.critical(f"[Worker {self._index}] Router disconnected")
+                return
+
+            if kind == MESSAGE_CONNECT:
+                self.connect(client_id, json.loads(payload))
+            elif kind == MESSAGE_COMMAND:
+                task = asyncio.ensure_future(self.run_command(client_id, self._remote_clients[client_id], payload))
+                self._commands.add(task)
+                task.add_done_callback(self._commands.discard)
+            elif kind == MESSAGE_ACK:
+                reply = self._replies.pop(client_id, None)
+                if reply is not None and not reply.done():
+                    reply.set_result(None)
+            elif kind == MESSAGE_DISCONNECT:
+                client = self._remote_clients.pop(client_id, None)
+                if client is not None:
+                    self.disconnect(client)
+
+
+def run_worker(index: int, workers: int, sock: socket.socket, store_directory: Path, config: ServerConfig):
+    # Entry point of a worker process, which exits once the router is gone
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    listener = setup_logging(config, store_directory)
+    worker = SymbolWorker(index, workers, store_directory, config)
+    try:
+        asyncio.run(worker.serve(sock))
+    finally:
+        worker.close()
+        listener.stop()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Callable, Awaitable, Set, Any, Union, AsyncContextManager
+
+from common.symbol import Symbol
+from common.symbol_batch import SymbolBatch
+from .async_symbol_store import AsyncSymbolStore
+from .metrics import MetricsRegistry, SIZE_BUCKETS
+
+
+@dataclass
+class PendingWrite:
+    symbols: Union[List[Symbol], SymbolBatch]
+    originator: Any
+    future: asyncio.Future = field(repr=False)
+    submitted: float = field(default_factory=time.monotonic)
+
+
+class WriteCoalescerMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.commits = registry.counter('jsync_write_commits_total', 'Transactions committed by write coalescers')
+        self.symbols = registry.counter('jsync_write_symbols_total', 'Symbols committed by write coalescers')
+        self.batch_symbols = registry.histogram('jsync_write_batch_symbols', 'Symbols per committed transaction',
+                                                buckets=SIZE_BUCKETS)
+        self.batch_writes = registry.histogram('jsync_write_batch_commands',
+                                               'UpstreamSymbols commands per committed transaction',
+                                               buckets=SIZE_BUCKETS)
+        self.added_latency = registry.histogram('jsync_write_coalesce_delay_seconds',
+                                                'Time an UpstreamSymbols command waited until its batch was committed')
+
+
+class WriteCoalescer:
+    # Gathers the upstream symbols of a single project, committing all writes arriving within a short window
+    # (or until enough symbols are pending) in a single transaction, before fanning them out.
+    def __init__(self, use_store: Callable[[], AsyncContextManager[AsyncSymbolStore]], window: float,
+                 max_symbols: int, fan_out: Callable[[List[PendingWrite]], Awaitable[None]],
+                 metrics: WriteCoalescerMetrics):
+        self._use_store = use_store
+        self._window = window
+        self._max_symbols = max_symbols
+        self._fan_out = fan_out
+        self._metrics = metrics
+
+        self._pending: List[PendingWrite] = []
+        self._pending_symbols = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        # Batches are committed (and fanned out) in order
+        self._flush_lock = asyncio.Lock()
+
+    async def submit(self, symbols: Union[List[Symbol], SymbolBatch], originator: Any):
+        loop = asyncio.get_running_loop()
+        write = PendingWrite(symbols, originator, loop.create_future())
+        self._pending.append(write)
+        self._pending_symbols += len(symbols)
+
+        if self._pending_symbols >= self._max_symbols or self._window <= 0:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._window, self._start_flush)
+
+        await write.future
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending, self._pending_symbols = self._pending, [], 0
+        if not pending:
+            return
+
+        task = asyncio.ensure_future(self._flush(pending))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, pending: List[PendingWrite]):
+        async with self._flush_lock:
+            symbols = SymbolBatch.concatenate([write.symbols for write in pending])
+            try:
+                async with self._use_store() as store:
+                    await store.push_symbols(symbols)
+            except Exception as e:
+                for write in pending:
+                    write.future.set_exception(e)
+                return
+
+            committed = time.monotonic()
+            self._metrics.commits.inc()
+            self._metrics.symbols.inc(len(symbols))
+            self._metrics.batch_symbols.observe(len(symbols))
+            self._metrics.batch_writes.observe(len(pending))
+            for write in pending:
+                self._metrics.added_latency.observe(committed - write.submitted)
+                write.future.set_result(None)
+
+            await self._fan_out(pending)
+
+    async def flush(self):
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from client_base.client_symbol_store import ClientSymbolStoreABC
+from client_base.rename_engine import RenameEngineABC
+from server.pysqlite_symbol_store import PySqliteSymbolStore, SqliteAdapter
+
+
+class ThreadSharedSqliteAdapter(SqliteAdapter):
+    # The plugins share their (JDBC) connections between threads, so client stores are tested likewise
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn.close()
+        self._conn = sqlite3.connect(path, cached_statements=self.MAX_CACHED_STATEMENTS, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+
+class PySqliteClientSymbolStore(ClientSymbolStoreABC):
+    def connect(self, path: str) -> SqliteAdapter:
+        return ThreadSharedSqliteAdapter(path)
+
+
+class FakeRenameEngine(RenameEngineABC):
+    # A decompiler whose symbols are all originally named ORIGINAL_NAME, recording the renames enqueued to it
+    ORIGINAL_NAME = 'original'
+
+    def __init__(self, self_author: str, directory):
+        super().__init__(self_author)
+        self._directory = directory
+        self.names = {}
+        self.enqueued = []
+
+    def get_client_symbol_store(self, project: str) -> PySqliteClientSymbolStore:
+        return PySqliteClientSymbolStore(str(self._directory / f'{project}.db'))
+
+    def get_name(self, project, symbol):
+        return self.names.get(symbol.canonical_signature, self.ORIGINAL_NAME)
+
+    def get_original_name(self, project, symbol):
+        return self.ORIGINAL_NAME
+
+    def _enqueue_rename(self, project, symbol):
+        self.enqueued.append(symbol)
+        self.names[symbol.canonical_signature] = symbol.name
+        return True
+
+    def close(self):
+        for store in self._symbol_stores.values():
+            store.close()
+
+
+@pytest.fixture
+def server_store(tmp_path):
+    store = PySqliteSymbolStore(str(tmp_path / 'server.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def client_store(tmp_path):
+    store = PySqliteClientSymbolStore(str(tmp_path / 'client.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def rename_engine(tmp_path):
+    engine = FakeRenameEngine('me', tmp_path)
+    yield engine
+    engine.close()
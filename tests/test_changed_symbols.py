@@ -0,0 +1,38 @@
+import random
+import sqlite3
+
+import pytest
+
+from benchmark.changed_symbols import per_symbol_changed_symbols
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+
+
+def random_symbols(rng: random.Random, count: int, timestamp: int) -> list:
+    return [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{rng.randrange(count)}()V', rng.choice((None, 'renamed', f'name{i}')),
+                   timestamp=timestamp, author=rng.choice(('alice', 'bob', 'carol')))
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('store_fixture', ['server_store', 'client_store'])
+def test_changed_symbols_as_per_symbol(request, store_fixture):
+    store = request.getfixturevalue(store_fixture)
+    rng = random.Random(0)
+    store.push_symbols(random_symbols(rng, 500, 1))
+    for _ in range(5):
+        symbols = random_symbols(rng, 500, 2)
+        assert list(store.changed_symbols(symbols)) == list(per_symbol_changed_symbols(store, symbols))
+    assert list(store.changed_symbols([])) == []
+
+
+def test_changed_symbols_while_written(server_store, tmp_path):
+    # Diffing only reads the store, so doesn't wait for another connection's write transaction
+    symbols = [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', f'name{i}', timestamp=1, author='alice') for i in range(10)]
+    server_store.push_symbols(symbols[:5])
+    writer = sqlite3.connect(str(tmp_path / 'server.db'), timeout=0)
+    try:
+        writer.execute('BEGIN IMMEDIATE')
+        server_store._conn._conn.execute('PRAGMA busy_timeout=0')
+        assert list(server_store.changed_symbols(symbols)) == symbols[5:]
+    finally:
+        writer.rollback()
+        writer.close()
@@ -0,0 +1,66 @@
+import random
+
+from common.symbol import Symbol, SYMBOL_TYPE_CLASS, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD
+from conftest import PySqliteClientSymbolStore
+
+SIGNATURES = [f'La{i};' for i in range(50)] + [f'La;->m{i}()V' for i in range(50)] + \
+             [f'La;->f{i}:I' for i in range(50)]
+
+
+class UncachedClientSymbolStore(PySqliteClientSymbolStore):
+    MAX_RENAME_CACHE_BYTES = 0
+
+
+def random_renames(rng: random.Random, count: int) -> list:
+    # Renames & deletions, some of symbol types differing from those their signatures imply
+    return [Symbol(rng.choice((SYMBOL_TYPE_CLASS, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD)), rng.choice(SIGNATURES),
+                   rng.choice((None, 'renamed', f'name{rng.randrange(10)}', u'名前')))
+            for _ in range(count)]
+
+
+def renames(store: PySqliteClientSymbolStore) -> dict:
+    return {canonical_signature: (symbol.symbol_type, symbol.name)
+            for canonical_signature, symbol in store.latest_known_renames.items()}
+
+
+def test_rename_cache_written_through(tmp_path):
+    # The cache answers as the database does after random writes, and as a freshly loaded cache
+    path = str(tmp_path / 'project.db')
+    store = PySqliteClientSymbolStore(path)
+    rng = random.Random(0)
+    try:
+        for _ in range(50):
+            store.record_latest_known_renames(random_renames(rng, rng.randrange(1, 20)))
+        assert store._renames is not None
+
+        uncached = UncachedClientSymbolStore(path)
+        loaded = PySqliteClientSymbolStore(path)
+        try:
+            assert uncached._renames is None
+            assert renames(store) == renames(uncached) == renames(loaded)
+            assert store.rename_cache_size == loaded.rename_cache_size
+            for canonical_signature in SIGNATURES:
+                assert store.get_latest_known_rename(canonical_signature) == \
+                    uncached.get_latest_known_rename(canonical_signature)
+            assert store.get_latest_known_renames_of(SIGNATURES) == uncached.get_latest_known_renames_of(SIGNATURES)
+        finally:
+            uncached.close()
+            loaded.close()
+    finally:
+        store.close()
+
+
+def test_rename_cache_bounded(tmp_path):
+    store = PySqliteClientSymbolStore(str(tmp_path / 'project.db'))
+    try:
+        symbols = [Symbol(SYMBOL_TYPE_METHOD, canonical_signature, 'renamed') for canonical_signature in SIGNATURES]
+        store.MAX_RENAME_CACHE_BYTES = store.rename_cache_bytes(10, 1000)
+        store.record_latest_known_renames(symbols[:5])
+        assert store.rename_cache_size[0] == 5
+        # Once the records would take more than the bound they're read from the database instead
+        store.record_latest_known_renames(symbols[5:])
+        assert store._renames is None and store.rename_cache_size == (0, 0)
+        assert store.get_latest_known_rename(SIGNATURES[-1]) == symbols[-1]
+        assert len(store.latest_known_renames) == len(SIGNATURES)
+    finally:
+        store.close()
@@ -0,0 +1,157 @@
+import json
+import random
+
+import pytest
+
+from common.codecs import (BINARY_CODEC, JSON_CODEC, BINARY_SCHEMAS, FIELD_STRING, FIELD_INTEGER, FIELD_BOOLEAN,
+                           FIELD_SYMBOLS, FIELD_STRINGS, FIELD_BYTES, FIELD_INTEGERS)
+from common.commands import UpstreamSymbols
+from common.symbol import Symbol, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_CLASS
+from common.symbol_batch import SymbolBatch
+
+
+# Every schema is round tripped this many times, with commands generated from a fixed seed
+ITERATIONS = 200
+ALPHABET = u'abcXYZ019_$;/->()[ éא中\U0001f600'
+
+
+def random_string(rng: random.Random, nullable: bool = True):
+    if nullable and rng.random() < 0.1:
+        return None
+    return u''.join(rng.choice(ALPHABET) for _ in range(rng.choice((0, 1, 5, 40))))
+
+
+def random_integer(rng: random.Random, nullable: bool = True):
+    if nullable and rng.random() < 0.1:
+        return None
+    return rng.choice((0, 1, -1, 127, 128, -(1 << 63) + 1, (1 << 63) - 1, (1 << 80), rng.randint(-1 << 40, 1 << 40)))
+
+
+def random_symbol(rng: random.Random) -> Symbol:
+    cls = u'L%s;' % random_string(rng, nullable=False)
+    symbol_type = rng.choice((SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_CLASS))
+    if symbol_type == SYMBOL_TYPE_CLASS:
+        signature = cls
+    elif symbol_type == SYMBOL_TYPE_METHOD:
+        signature = u'%s->%s()V' % (cls, random_string(rng, nullable=False))
+    else:
+        signature = u'%s->%s:I' % (cls, random_string(rng, nullable=False))
+    timestamp = None if rng.random() < 0.1 else rng.randint(-(1 << 63) + 1, (1 << 63) - 1)
+    return Symbol(symbol_type, signature, random_string(rng), timestamp=timestamp, author=random_string(rng))
+
+
+def random_field(rng: random.Random, kind: int):
+    if kind == FIELD_STRING:
+        return random_string(rng)
+    elif kind == FIELD_INTEGER:
+        return random_integer(rng)
+    elif kind == FIELD_BOOLEAN:
+        return rng.random() < 0.5
+    elif kind == FIELD_SYMBOLS:
+        return [random_symbol(rng) for _ in range(rng.choice((0, 1, 3, 50)))]
+    elif kind == FIELD_STRINGS:
+        return None if rng.random() < 0.1 else [random_string(rng) for _ in range(rng.choice((0, 1, 4)))]
+    elif kind == FIELD_BYTES:
+        return None if rng.random() < 0.1 else bytes(rng.getrandbits(8) for _ in range(rng.choice((0, 1, 300))))
+    elif kind == FIELD_INTEGERS:
+        return None if rng.random() < 0.1 else [random_integer(rng) for _ in range(rng.choice((0, 1, 4)))]
+    raise ValueError(kind)
+
+
+def random_command(rng: random.Random, tag: int):
+    typ, fields = BINARY_SCHEMAS[tag]
+    return typ(**{name: random_field(rng, kind) for name, kind in fields})
+
+
+def normalized(command) -> dict:
+    # Symbols are decoded as batches, which are compared by their symbols
+    return {name: list(value) if isinstance(value, SymbolBatch) else value for name, value in vars(command).items()}
+
+
+@pytest.mark.parametrize('tag', sorted(BINARY_SCHEMAS))
+def test_schema_covers_command(tag):
+    typ, fields = BINARY_SCHEMAS[tag]
+    command = random_command(random.Random(tag), tag)
+    assert set(vars(command)) == {name for name, _ in fields}
+
+
+@pytest.mark.parametrize('tag', sorted(BINARY_SCHEMAS))
+def test_binary_round_trip(tag):
+    rng = random.Random(tag)
+    for _ in range(ITERATIONS):
+        command = random_command(rng, tag)
+        decoded = BINARY_CODEC.decode(BINARY_CODEC.encode(command))
+        assert type(decoded) is type(command)
+        assert normalized(decoded) == normalized(command)
+
+
+@pytest.mark.parametrize('tag', sorted(tag for tag, (_, fields) in BINARY_SCHEMAS.items()
+                                       if all(kind != FIELD_BYTES for _, kind in fields)))
+def test_json_round_trip(tag):
+    rng = random.Random(tag)
+    for _ in range(ITERATIONS):
+        command = random_command(rng, tag)
+        decoded = JSON_CODEC.decode(JSON_CODEC.encode(command))
+        assert type(decoded) is type(command)
+        assert normalized(decoded) == normalized(command)
+
+
+@pytest.mark.parametrize('tag', sorted(BINARY_SCHEMAS))
+def test_binary_peek_project(tag):
+    rng = random.Random(tag)
+    for _ in range(ITERATIONS // 10):
+        command = random_command(rng, tag)
+        peeked = type(command), getattr(command, 'project', None)
+        assert BINARY_CODEC.peek_project(BINARY_CODEC.encode(command)) == peeked
+        if all(kind != FIELD_BYTES for _, kind in BINARY_SCHEMAS[tag][1]):
+            assert JSON_CODEC.peek_project(JSON_CODEC.encode(command)) == peeked
+
+
+def test_binary_peek_long_project():
+    project = u'p' * (BINARY_CODEC.PEEK_BYTES * 3)
+    command = UpstreamSymbols(project, [random_symbol(random.Random(0))], True)
+    assert BINARY_CODEC.peek_project(BINARY_CODEC.encode(command)) == (type(command), project)
+
+
+def shuffled(value, rng: random.Random):
+    # The JSON value with its objects' keys reordered, as a peer whose dicts are unordered (i.e. Jython) encodes them
+    if isinstance(value, dict):
+        items = list(value.items())
+        rng.shuffle(items)
+        return {key: shuffled(item, rng) for key, item in items}
+    elif isinstance(value, list):
+        return [shuffled(item, rng) for item in value]
+    return value
+
+
+@pytest.mark.parametrize('project', [u'project', u'a"b', u'\\', u'{"project": "x"}', u'p, "__type__": "Subscribe"',
+                                     u'\u05d0\U0001f600', None])
+def test_json_peek_project(project):
+    rng = random.Random(0)
+    # Symbols whose text looks like the keys peeked at
+    symbols = [Symbol(SYMBOL_TYPE_CLASS, u'La;', name, author=name)
+               for name in (u'{"project": "other", "__type__": "Subscribe"}', u'\\", "project": "other', u'"')]
+    command = UpstreamSymbols(project, symbols, True)
+    for _ in range(20):
+        data = json.dumps(shuffled(json.loads(JSON_CODEC.encode(command).decode('utf-8')), rng)).encode('utf-8')
+        assert JSON_CODEC.peek_project(data) == (UpstreamSymbols, project)
+
+
+@pytest.mark.parametrize('tag', sorted(tag for tag, (_, fields) in BINARY_SCHEMAS.items() if len(fields) > 1))
+def test_binary_decodes_older_peers(tag):
+    # Older peers don't send trailing fields appended since, which are decoded as the command's defaults
+    typ, fields = BINARY_SCHEMAS[tag]
+    command = random_command(random.Random(tag), tag)
+    for kept in range(1, len(fields)):
+        # Encodes only the first `kept` fields, as an older peer would
+        older = bytearray()
+        BINARY_CODEC._write_varint(older, tag)
+        for name, kind in fields[:kept]:
+            BINARY_CODEC._write_field(older, kind, getattr(command, name))
+        try:
+            decoded = BINARY_CODEC.decode(bytes(older))
+        except TypeError:
+            # The missing field is a required argument of the command
+            continue
+        for name, _ in fields[:kept]:
+            assert normalized(decoded)[name] == normalized(command)[name]
@@ -0,0 +1,129 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.async_symbol_store import AsyncSymbolStore
+from server.compactor import Compactor, CompactorMetrics
+from server.metrics import MetricsRegistry
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+
+
+def symbol(signature: str, timestamp: int, author: str = 'alice') -> Symbol:
+    return Symbol(SYMBOL_TYPE_METHOD, signature, f'name{timestamp}', timestamp=timestamp, author=author)
+
+
+def random_history(store: PySqliteSymbolStore, rng: random.Random, pushes: int = 300):
+    for timestamp in range(1, pushes + 1):
+        store.push_symbols([symbol(f'La;->m{rng.randrange(20)}()V', timestamp, rng.choice(('alice', 'bob')))])
+
+
+def history(store: PySqliteSymbolStore) -> list:
+    return sorted(store._conn.execute_query('SELECT author, canonical_signature, timestamp FROM symbols'))
+
+
+def expected_superseded(rows: list, keep_versions: int, before: int) -> list:
+    versions = {}
+    for author, signature, timestamp in sorted(rows, key=lambda row: -row[2]):
+        versions.setdefault((author, signature), []).append(timestamp)
+    return sorted((author, signature, timestamp)
+                  for (author, signature), timestamps in versions.items()
+                  for version, timestamp in enumerate(timestamps, 1)
+                  if version > 1 and ((keep_versions > 0 and version > keep_versions) or timestamp < before))
+
+
+def test_superseded_pages(server_store):
+    random_history(server_store, random.Random(0))
+    rows = history(server_store)
+    for keep_versions, before in ((0, 0), (1, 0), (3, 0), (0, 150), (2, 100)):
+        pages = []
+        after = None
+        while True:
+            page = server_store.get_superseded_symbols(keep_versions, before, after, limit=7)
+            if not page:
+                break
+            assert len(page) <= 7
+            pages.extend(page)
+            after = page[-1]
+        assert pages == expected_superseded(rows, keep_versions, before)
+
+
+class Stores:
+    # Project stores opened by the compactor
+    def __init__(self, directory):
+        self._directory = directory
+        self.used = []
+
+    def store(self, project: str) -> PySqliteSymbolStore:
+        return PySqliteSymbolStore(str(self._directory / f'{project}.db'))
+
+    @asynccontextmanager
+    async def use(self, project: str):
+        self.used.append(project)
+        store = AsyncSymbolStore(project, lambda: self.store(project))
+        try:
+            yield store
+        finally:
+            store.close()
+
+
+def compactor(stores: Stores, projects: list, keep_versions: int = 0, max_age: float = 0) -> Compactor:
+    return Compactor(lambda: projects, stores.use, 0, keep_versions, max_age, CompactorMetrics(MetricsRegistry()))
+
+
+def test_compaction_deletes_pages(tmp_path):
+    stores = Stores(tmp_path)
+    store = stores.store('project')
+    random_history(store, random.Random(1))
+    rows = history(store)
+    latest = sorted((s.author, s.canonical_signature, s.timestamp) for s in store.get_symbols())
+    store.close()
+
+    compaction = compactor(stores, ['project'], keep_versions=2)
+    compaction.DELETE_BATCH_ROWS = 10
+    asyncio.run(compaction.compact('project'))
+
+    store = stores.store('project')
+    try:
+        superseded = expected_superseded(rows, 2, 0)
+        assert history(store) == sorted(set(rows) - set(superseded))
+        assert sorted((s.author, s.canonical_signature, s.timestamp) for s in store.get_symbols()) == latest
+        assert compaction._metrics.rows.value == len(superseded)
+    finally:
+        store.close()
+
+
+def test_without_pruning_only_written_stores_visited(tmp_path):
+    stores = Stores(tmp_path)
+    compaction = compactor(stores, ['a', 'b', 'c'])
+    assert not compaction.prunes_history
+
+    asyncio.run(compaction.compact_all())
+    assert stores.used == []
+
+    compaction.mark_written('b')
+    asyncio.run(compaction.compact_all())
+    assert stores.used == ['b']
+    # Each write schedules a single compaction
+    asyncio.run(compaction.compact_all())
+    assert stores.used == ['b']
+
+
+def test_kept_versions_pruned_once_then_on_writes(tmp_path):
+    stores = Stores(tmp_path)
+    compaction = compactor(stores, ['a', 'b', 'c'], keep_versions=1)
+    # History written before the server started is pruned by the first run
+    asyncio.run(compaction.compact_all())
+    assert stores.used == ['a', 'b', 'c']
+
+    compaction.mark_written('c')
+    asyncio.run(compaction.compact_all())
+    assert stores.used == ['a', 'b', 'c', 'c']
+
+
+def test_aged_history_pruned_every_run(tmp_path):
+    stores = Stores(tmp_path)
+    compaction = compactor(stores, ['a', 'b'], max_age=60)
+    asyncio.run(compaction.compact_all())
+    asyncio.run(compaction.compact_all())
+    assert stores.used == ['a', 'b', 'a', 'b']
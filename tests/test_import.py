@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from common.commands import Subscribe, DownstreamSymbols
+from common.symbol import SYMBOL_TYPE_METHOD
+from server.bulk_import import import_online
+from server.default_symbol_server import DefaultSymbolServer
+from test_symbol_server import connect, send_command, recv_command
+
+
+def rows(count: int, prefix: str = 'name'):
+    return [(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', f'{prefix}{i}') for i in range(count)]
+
+
+async def latest(server: DefaultSymbolServer, project: str = 'project') -> dict:
+    async with server._stores.use(project) as store:
+        symbols = await store.read(lambda s: list(s.get_symbols()))
+    return {symbol.canonical_signature: (symbol.name, symbol.author) for symbol in symbols}
+
+
+def test_import_parses_off_writer(tmp_path):
+    async def scenario():
+        server = DefaultSymbolServer('127.0.0.1', 0, tmp_path, None)
+        server.IMPORT_BATCH_SYMBOLS = 10
+        threads = set()
+
+        def parse():
+            for row in rows(35):
+                threads.add(threading.current_thread().name)
+                yield row
+
+        try:
+            assert await server.import_symbols('project', parse(), 'importer') == 35
+            assert await latest(server) == {signature: (name, 'importer') for _, signature, name in rows(35)}
+            assert threads and not any(name.startswith('jsync-writer') for name in threads)
+            # Symbols already named so aren't changed
+            assert await server.import_symbols('project', rows(35), 'importer') == 0
+        finally:
+            server._stores.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_import_leaves_nothing_staged(tmp_path):
+    async def scenario():
+        server = DefaultSymbolServer('127.0.0.1', 0, tmp_path, None)
+        server.IMPORT_BATCH_SYMBOLS = 10
+
+        def parse():
+            yield from rows(25)
+            raise ValueError('malformed mapping')
+
+        try:
+            with pytest.raises(ValueError):
+                await server.import_symbols('project', parse(), 'importer')
+            assert await latest(server) == {}
+            assert await server.import_symbols('project', rows(5, 'other'), 'importer') == 5
+            assert await latest(server) == {signature: (name, 'importer') for _, signature, name in rows(5, 'other')}
+        finally:
+            server._stores.close()
+
+    asyncio.run(scenario())
+
+
+def test_online_import(tmp_path):
+    async def scenario():
+        (tmp_path / 'stores').mkdir()
+        server = DefaultSymbolServer('127.0.0.1', 0, tmp_path / 'stores', None)
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        mapping = tmp_path / 'renames.txt'
+        mapping.write_text(''.join(f'{signature} = {name}\n' for _, signature, name in rows(20)), encoding='utf-8')
+        try:
+            # A subscriber (of a version which can't resync) is sent the imported changes
+            reader, writer = await connect(port, 'subscriber')
+            await send_command(writer, Subscribe('project'))
+            address = f'127.0.0.1:{port}'
+            assert await asyncio.wait_for(import_online(address, 'project', 'jeb', 'importer', mapping), 10) == 20
+            update = await asyncio.wait_for(recv_command(reader), 10)
+            assert isinstance(update, DownstreamSymbols)
+            assert {symbol.name for symbol in update.symbols} == {name for _, _, name in rows(20)}
+            writer.close()
+
+            assert await latest(server) == {signature: (name, 'importer') for _, signature, name in rows(20)}
+            assert await import_online(address, 'project', 'jeb', 'importer', mapping) == 0
+            with pytest.raises(RuntimeError, match='Unknown mapping format'):
+                await import_online(address, 'project', 'unknown', 'importer', mapping)
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server._stores.close()
+
+    asyncio.run(scenario())
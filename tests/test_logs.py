@@ -0,0 +1,128 @@
+import json
+import logging
+
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.config import ServerConfig
+from server.logs import (RateLimitFilter, AuditLogHandler, AUDIT_LOGGER, AUDIT_LOG_DIRECTORY, audit_log_directory,
+                         setup_logging)
+
+
+def record(message: str, level: int = logging.INFO, name: str = 'root', **extra) -> logging.LogRecord:
+    result = logging.LogRecord(name, level, __file__, 0, message, None, None)
+    result.__dict__.update(extra)
+    return result
+
+
+def passed(rate_filter: RateLimitFilter, messages) -> list:
+    results = []
+    for message in messages:
+        entry = record(message)
+        if rate_filter.filter(entry):
+            results.append(entry.getMessage())
+    return results
+
+
+def test_rate_limit_suppresses_kind():
+    rate_filter = RateLimitFilter(3)
+    assert passed(rate_filter, [f'[Tag] message {i}' for i in range(10)]) == \
+        ['[Tag] message 0', '[Tag] message 1', '[Tag] message 2']
+    # Other kinds (by tag, level or untagged text) have their own budget
+    assert passed(rate_filter, ['[Other] message', 'untagged 1', 'untagged 2']) == \
+        ['[Other] message', 'untagged 1', 'untagged 2']
+    assert rate_filter.filter(record('[Tag] message', logging.WARNING))
+
+
+def test_rate_limit_counts_suppressed():
+    rate_filter = RateLimitFilter(2)
+    assert len(passed(rate_filter, ['[Tag] message'] * 7)) == 2
+    # Once tokens refill, the next message counts those suppressed meanwhile
+    rate_filter._buckets[(logging.INFO, '[Tag]')].updated -= 1
+    assert passed(rate_filter, ['[Tag] message'] * 3) == ['[Tag] message (5 similar messages suppressed)',
+                                                           '[Tag] message']
+
+
+def test_rate_limit_disabled():
+    assert len(passed(RateLimitFilter(0), ['[Tag] message'] * 100)) == 100
+
+
+def test_rate_limit_bounds_kinds():
+    rate_filter = RateLimitFilter(1)
+    passed(rate_filter, [f'message {i}' for i in range(RateLimitFilter.MAX_KINDS * 2)])
+    assert len(rate_filter._buckets) <= RateLimitFilter.MAX_KINDS
+
+
+def symbols(count: int, name: str = 'renamed') -> list:
+    return [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', name, timestamp=i, author='alice') for i in range(count)]
+
+
+def audit(handler: AuditLogHandler, project: str, batch: list):
+    handler.handle(record(f'[Symbol] alice @ {project}', name=AUDIT_LOGGER, audit_project=project,
+                          audit_symbols=batch))
+
+
+def lines(path) -> list:
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_audit_log_lines(tmp_path):
+    handler = AuditLogHandler(tmp_path, 1 << 20, 1)
+    try:
+        audit(handler, 'project', symbols(3))
+        audit(handler, 'other', symbols(1, u'א'))
+        # Only audit records with symbols are written
+        handler.handle(record('[Symbol] unrelated', audit_project='project', audit_symbols=symbols(1)))
+        audit(handler, 'project', [])
+    finally:
+        handler.close()
+
+    assert lines(tmp_path / 'project.audit.log') == [
+        {'timestamp': i, 'project': 'project', 'author': 'alice', 'symbol_type': SYMBOL_TYPE_METHOD,
+         'canonical_signature': f'La;->m{i}()V', 'name': 'renamed'} for i in range(3)]
+    assert [line['name'] for line in lines(tmp_path / 'other.audit.log')] == [u'א']
+
+
+def test_audit_log_rotation(tmp_path):
+    handler = AuditLogHandler(tmp_path, 1000, 2)
+    try:
+        for i in range(20):
+            audit(handler, 'project', symbols(3, f'name{i}'))
+    finally:
+        handler.close()
+
+    logs = sorted(path.name for path in tmp_path.iterdir())
+    assert logs == ['project.audit.log', 'project.audit.log.1', 'project.audit.log.2']
+    assert all((tmp_path / name).stat().st_size <= 1000 for name in logs)
+    # The latest batch is in the current log, and a batch is never split by rotation
+    assert [line['name'] for line in lines(tmp_path / 'project.audit.log')][-3:] == ['name19'] * 3
+    for name in logs:
+        assert len(lines(tmp_path / name)) % 3 == 0
+
+
+def test_audit_log_open_files_bounded(tmp_path):
+    handler = AuditLogHandler(tmp_path, 1 << 20, 1)
+    handler.MAX_OPEN_FILES = 2
+    try:
+        for project in ('a', 'b', 'c', 'a'):
+            audit(handler, project, symbols(1))
+        assert list(handler._files) == ['c', 'a']
+    finally:
+        handler.close()
+    assert len(lines(tmp_path / 'a.audit.log')) == 2
+
+
+def test_audit_log_within_store_directory(tmp_path):
+    assert audit_log_directory(ServerConfig(), tmp_path) == tmp_path / AUDIT_LOG_DIRECTORY
+    assert audit_log_directory(ServerConfig(audit_log_directory=str(tmp_path / 'logs')), tmp_path) == \
+        tmp_path / 'logs'
+
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    listener = setup_logging(ServerConfig(), tmp_path)
+    try:
+        logging.getLogger(AUDIT_LOGGER).info('[Symbol] alice @ project', extra={
+            'audit_project': 'project', 'audit_symbols': symbols(2)})
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+    assert len(lines(tmp_path / AUDIT_LOG_DIRECTORY / 'project.audit.log')) == 2
@@ -0,0 +1,112 @@
+import pytest
+
+from common.symbol import SYMBOL_TYPE_CLASS, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD
+from server.mappings import MAPPING_FORMATS, parse_proguard, parse_jobf, parse_jeb, type_descriptor
+
+
+def mapping(tmp_path, text: str) -> str:
+    path = tmp_path / 'mapping'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+PROGUARD = """\
+# compiler: R8
+com.example.Parser -> a.b:
+    java.lang.String name -> a
+    int[][] counts -> b
+    com.example.Token current -> c
+    1:5:void parse(java.lang.String,int):10:14 -> a
+    6:8:void parse(java.lang.String,int):20:22 -> a
+    com.example.Token next(com.example.Token[],long) -> b
+    void <init>() -> <init>
+    void unchanged() -> unchanged
+    9:9:void com.example.Other.inlined():30:30 -> c
+com.example.Token -> a.c:
+    boolean valid -> a
+com.example.Same -> a.Same:
+com.example.Outer$Inner -> a.d$e:
+    # {"id":"sourceFile","fileName":"Outer.java"}
+"""
+
+
+def test_proguard(tmp_path):
+    assert list(parse_proguard(mapping(tmp_path, PROGUARD))) == [
+        (SYMBOL_TYPE_CLASS, 'La/b;', 'Parser'),
+        (SYMBOL_TYPE_FIELD, 'La/b;->a:Ljava/lang/String;', 'name'),
+        (SYMBOL_TYPE_FIELD, 'La/b;->b:[[I', 'counts'),
+        # Types are of the obfuscated classes, even if mapped further down
+        (SYMBOL_TYPE_FIELD, 'La/b;->c:La/c;', 'current'),
+        # Once per method, rather than per line range
+        (SYMBOL_TYPE_METHOD, 'La/b;->a(Ljava/lang/String;I)V', 'parse'),
+        (SYMBOL_TYPE_METHOD, 'La/b;->b([La/c;J)La/c;', 'next'),
+        (SYMBOL_TYPE_CLASS, 'La/c;', 'Token'),
+        (SYMBOL_TYPE_FIELD, 'La/c;->a:Z', 'valid'),
+        (SYMBOL_TYPE_CLASS, 'La/d$e;', 'Inner'),
+    ]
+
+
+def test_proguard_without_final_newline(tmp_path):
+    # The last class is still mapped, both by itself and in the types of members above it
+    text = 'com.example.Parser -> a.b:\n    com.example.Token current -> c\ncom.example.Token -> a.c:'
+    assert list(parse_proguard(mapping(tmp_path, text))) == [
+        (SYMBOL_TYPE_CLASS, 'La/b;', 'Parser'),
+        (SYMBOL_TYPE_FIELD, 'La/b;->c:La/c;', 'current'),
+        (SYMBOL_TYPE_CLASS, 'La/c;', 'Token'),
+    ]
+
+
+def test_type_descriptor():
+    classes = {'com.example.Token': 'a.c'}
+    assert type_descriptor('void', classes) == 'V'
+    assert type_descriptor('double[]', classes) == '[D'
+    assert type_descriptor('com.example.Token[][]', classes) == '[[La/c;'
+    assert type_descriptor('java.util.List', classes) == 'Ljava/util/List;'
+
+
+JOBF = """\
+p a = example
+c a.b = Parser
+c a.d$e = Inner
+f a.b.a:Ljava/lang/String; = name
+f a.b.c = untyped
+m a.b.a(Ljava/lang/String;I)V = parse
+m a.d$e.b()La/b; = parser
+c a.c =
+malformed
+"""
+
+
+def test_jobf(tmp_path):
+    assert list(parse_jobf(mapping(tmp_path, JOBF))) == [
+        (SYMBOL_TYPE_CLASS, 'La/b;', 'Parser'),
+        (SYMBOL_TYPE_CLASS, 'La/d$e;', 'Inner'),
+        (SYMBOL_TYPE_FIELD, 'La/b;->a:Ljava/lang/String;', 'name'),
+        (SYMBOL_TYPE_METHOD, 'La/b;->a(Ljava/lang/String;I)V', 'parse'),
+        (SYMBOL_TYPE_METHOD, 'La/d$e;->b()La/b;', 'parser'),
+    ]
+
+
+JEB = """\
+# Exported from JEB
+La/b; = Parser
+
+La/b;->a:Ljava/lang/String; = name
+La/b;->a(Ljava/lang/String;I)V = parse
+La/c; =
+La/d;->b()V = méthode
+"""
+
+
+def test_jeb(tmp_path):
+    assert list(parse_jeb(mapping(tmp_path, JEB))) == [
+        (SYMBOL_TYPE_CLASS, 'La/b;', 'Parser'),
+        (SYMBOL_TYPE_FIELD, 'La/b;->a:Ljava/lang/String;', 'name'),
+        (SYMBOL_TYPE_METHOD, 'La/b;->a(Ljava/lang/String;I)V', 'parse'),
+        (SYMBOL_TYPE_METHOD, 'La/d;->b()V', u'méthode'),
+    ]
+
+
+@pytest.mark.parametrize('mapping_format', sorted(MAPPING_FORMATS))
+def test_empty_mapping(tmp_path, mapping_format):
+    assert list(MAPPING_FORMATS[mapping_format](mapping(tmp_path, ''))) == []
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from server.metrics import MetricsRegistry, MetricsListener
+
+
+def test_render_exposition_format():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests').inc(3)
+    commands = registry.counter('commands_total', 'Commands, by type', labels=('type',))
+    commands.labels('Subscribe').inc()
+    commands.labels('Full"Sync\\\n').inc(2.5)
+    registry.gauge('open', 'Open things').set(-2)
+    registry.callback_gauge('subscribers', 'Subscribers, by project', lambda: [(('a',), 1), (('b',), 0)],
+                            labels=('project',))
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(1, 0.1))
+    for value in (0.05, 0.1, 0.5, 2):
+        latency.observe(value)
+    sizes = registry.histogram('size_bytes', 'Sizes, by kind', buckets=(10,), labels=('kind',))
+    sizes.labels('page').observe(4)
+
+    assert registry.render() == '''\
+# HELP requests_total Requests
+# TYPE requests_total counter
+requests_total 3
+# HELP commands_total Commands, by type
+# TYPE commands_total counter
+commands_total{type="Subscribe"} 1
+commands_total{type="Full\\"Sync\\\\\\n"} 2.5
+# HELP open Open things
+# TYPE open gauge
+open -2
+# HELP subscribers Subscribers, by project
+# TYPE subscribers gauge
+subscribers{project="a"} 1
+subscribers{project="b"} 0
+# HELP latency_seconds Latency
+# TYPE latency_seconds histogram
+latency_seconds_bucket{le="0.1"} 2
+latency_seconds_bucket{le="1"} 3
+latency_seconds_bucket{le="+Inf"} 4
+latency_seconds_sum 2.65
+latency_seconds_count 4
+# HELP size_bytes Sizes, by kind
+# TYPE size_bytes histogram
+size_bytes_bucket{kind="page",le="10"} 1
+size_bytes_bucket{kind="page",le="+Inf"} 1
+size_bytes_sum{kind="page"} 4
+size_bytes_count{kind="page"} 1
+'''
+
+
+def test_metric_registered_once():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests')
+    with pytest.raises(ValueError):
+        registry.gauge('requests_total', 'Requests')
+
+
+def test_listener_serves_metrics():
+    async def get(port: int, request: bytes) -> bytes:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+
+    async def scenario():
+        registry = MetricsRegistry()
+        registry.counter('requests_total', 'Requests').inc()
+        listener = MetricsListener(registry, '127.0.0.1', 0)
+        await listener.start()
+        port = listener._server.sockets[0].getsockname()[1]
+        try:
+            response = await get(port, b'GET /metrics?name=requests_total HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            headers, body = response.split(b'\r\n\r\n', 1)
+            assert headers.split(b'\r\n')[0] == b'HTTP/1.1 200 OK'
+            assert b'Content-Type: text/plain; version=0.0.4; charset=utf-8' in headers.split(b'\r\n')
+            assert f'Content-Length: {len(body)}'.encode('ascii') in headers.split(b'\r\n')
+            assert body.decode('utf-8') == registry.render()
+
+            for request in (b'GET / HTTP/1.1\r\n\r\n', b'POST /metrics HTTP/1.1\r\n\r\n'):
+                response = await get(port, request)
+                assert response.startswith(b'HTTP/1.1 404 Not Found\r\n')
+                assert response.endswith(b'\r\n\r\nNot Found\n')
+
+            # Connections closed before sending a whole request are dropped
+            await get(port, b'GET /metrics')
+            assert (await get(port, b'GET /metrics HTTP/1.1\r\n\r\n')).startswith(b'HTTP/1.1 200 OK\r\n')
+        finally:
+            listener.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+
+from common.codecs import JSON_CODEC
+from common.commands import ResyncRequired
+from common.consts import RESYNC_PROTOCOL_VERSION
+from server.config import ServerConfig, OVERFLOW_DISCONNECT, OVERFLOW_RESYNC
+from server.default_symbol_server import DefaultSymbolServer
+from server.metrics import MetricsRegistry
+from server.outbox import ClientOutbox, OutboxMetrics
+from server.symbol_server import Client
+
+
+class FakeTransport:
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class SlowWriter:
+    # A client which only reads (i.e. drains) once released
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.written = []
+        self.released = asyncio.Event()
+
+    def write(self, data: bytes):
+        self.written.append(data)
+
+    async def drain(self):
+        await self.released.wait()
+
+    def get_extra_info(self, name):
+        return None
+
+
+def outbox(max_update_bytes: int = 100, max_response_bytes: int = 100):
+    writer = SlowWriter()
+    metrics = OutboxMetrics(MetricsRegistry())
+    return ClientOutbox(writer, max_update_bytes, max_response_bytes, metrics), writer, metrics
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_updates_bounded_by_bytes():
+    async def scenario():
+        box, writer, metrics = outbox()
+        assert box.offer(b'u' * 60)
+        assert not box.offer(b'u' * 60)
+        assert box.offer(b'u' * 40)
+        assert box.update_bytes == 100
+        assert metrics.overflows.value == 1
+        assert metrics.queued.value == 100
+
+    asyncio.run(scenario())
+
+
+def test_large_update_let_through_alone():
+    async def scenario():
+        box, writer, metrics = outbox()
+        assert box.offer(b'u' * 500)
+        assert not box.offer(b'u')
+
+    asyncio.run(scenario())
+
+
+def test_responses_dont_overflow_updates():
+    async def scenario():
+        box, writer, metrics = outbox(max_update_bytes=100, max_response_bytes=1000)
+        for _ in range(10):
+            await box.put(b'r' * 90)
+        assert box.response_bytes == 900
+        assert box.offer(b'u' * 100)
+        assert metrics.overflows.value == 0
+
+    asyncio.run(scenario())
+
+
+def test_responses_wait_for_room():
+    async def scenario():
+        box, writer, metrics = outbox(max_response_bytes=100)
+        box.start()
+        await box.put(b'1' * 60)
+        # The first response is being sent (waiting for the client), the second is queued
+        await box.put(b'2' * 60)
+        third = asyncio.ensure_future(box.put(b'3' * 60))
+        await settle()
+        assert not third.done()
+
+        writer.released.set()
+        await asyncio.wait_for(third, 1)
+        await settle()
+        assert writer.written == [b'1' * 60, b'2' * 60, b'3' * 60]
+        assert box.response_bytes == 0
+        box.close()
+
+    asyncio.run(scenario())
+
+
+def test_frames_sent_in_order():
+    async def scenario():
+        box, writer, metrics = outbox(max_update_bytes=1000, max_response_bytes=1000)
+        frames = []
+        for i in range(20):
+            frame = str(i).encode()
+            frames.append(frame)
+            if i % 3:
+                assert box.offer(frame)
+            else:
+                await box.put(frame)
+
+        writer.released.set()
+        box.start()
+        await settle()
+        assert writer.written == frames
+        assert metrics.sent.value == len(frames)
+        assert metrics.queued.value == 0
+        box.close()
+
+    asyncio.run(scenario())
+
+
+def test_clear_updates_keeps_responses():
+    async def scenario():
+        box, writer, metrics = outbox(max_update_bytes=1000, max_response_bytes=1000)
+        await box.put(b'response1')
+        box.offer(b'update1')
+        await box.put(b'response2')
+        box.offer(b'update2')
+        box.clear_updates()
+        assert box.update_bytes == 0
+        assert metrics.queued.value == box.response_bytes == len(b'response1response2')
+
+        writer.released.set()
+        box.start()
+        await settle()
+        assert writer.written == [b'response1', b'response2']
+        box.close()
+
+    asyncio.run(scenario())
+
+
+def test_abort_fails_waiting_responses():
+    async def scenario():
+        box, writer, metrics = outbox(max_response_bytes=10)
+        await box.put(b'r' * 10)
+        waiting = asyncio.ensure_future(box.put(b'r' * 10))
+        await settle()
+        box.abort()
+        with pytest.raises(ConnectionResetError):
+            await asyncio.wait_for(waiting, 1)
+        assert writer.transport.aborted
+        assert metrics.queued.value == 0
+
+    asyncio.run(scenario())
+
+
+def client(server: DefaultSymbolServer, version: int) -> Client:
+    writer = SlowWriter()
+    return Client('client', 'address', None, writer, JSON_CODEC, None, version,
+                  ClientOutbox(writer, server._config.outbound_queue_bytes, server._config.outbound_response_bytes,
+                               server._outbox_metrics))
+
+
+def overflowing_server(tmp_path, policy: str) -> DefaultSymbolServer:
+    return DefaultSymbolServer('127.0.0.1', 0, tmp_path, None,
+                               ServerConfig(outbound_queue_bytes=100, outbound_response_bytes=100,
+                                            outbound_overflow_policy=policy))
+
+
+@pytest.mark.parametrize('policy, version', [(OVERFLOW_DISCONNECT, RESYNC_PROTOCOL_VERSION),
+                                             (OVERFLOW_RESYNC, RESYNC_PROTOCOL_VERSION - 1)])
+def test_overflow_disconnects(tmp_path, policy, version):
+    async def scenario():
+        server = overflowing_server(tmp_path, policy)
+        subscriber = client(server, version)
+        server.enqueue_frame(subscriber, b'u' * 80)
+        assert not subscriber.writer.transport.aborted
+        server.enqueue_frame(subscriber, b'u' * 80)
+        assert subscriber.writer.transport.aborted
+
+    asyncio.run(scenario())
+
+
+def test_overflow_resyncs(tmp_path):
+    async def scenario():
+        server = overflowing_server(tmp_path, OVERFLOW_RESYNC)
+        subscriber = client(server, RESYNC_PROTOCOL_VERSION)
+        subscriber.associated_projects.add('project')
+        # A full sync in progress is unaffected by the overflow
+        await server.push_frame(subscriber, b'page')
+        server.enqueue_frame(subscriber, b'u' * 80)
+        server.enqueue_frame(subscriber, b'u' * 80)
+        assert not subscriber.writer.transport.aborted
+
+        subscriber.writer.released.set()
+        subscriber.outbox.start()
+        await settle()
+        assert subscriber.writer.written == [b'page', server.encode_frame(subscriber, ResyncRequired('project'))]
+        subscriber.outbox.close()
+
+    asyncio.run(scenario())
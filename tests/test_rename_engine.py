@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from common.symbol_batch import SymbolBatch
+from conftest import FakeRenameEngine
+
+
+def random_symbols(rng: random.Random, count: int):
+    return [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{rng.randrange(count)}()V',
+                   rng.choice((None, FakeRenameEngine.ORIGINAL_NAME, 'renamed', f'name{i}')),
+                   timestamp=rng.randrange(1, 100), author=rng.choice(('me', 'alice', 'bob')))
+            for i in range(count)]
+
+
+def stored(engine: FakeRenameEngine, project: str):
+    return sorted((symbol.author, symbol.canonical_signature, symbol.name, symbol.timestamp)
+                  for symbol in engine._symbol_stores[project].get_symbols())
+
+
+def test_record_symbols_of_batches(tmp_path):
+    # Batches are recorded (by their rows) exactly as lists of their symbols are
+    symbols = random_symbols(random.Random(0), 1000)
+    by_list = FakeRenameEngine('me', tmp_path / 'list')
+    by_batch = FakeRenameEngine('me', tmp_path / 'batch')
+    (tmp_path / 'list').mkdir()
+    (tmp_path / 'batch').mkdir()
+    try:
+        for i in range(0, len(symbols), 100):
+            by_list.record_symbols('project', symbols[i:i + 100])
+            by_batch.record_symbols('project', SymbolBatch.from_symbols(symbols[i:i + 100]))
+
+        assert stored(by_batch, 'project') == stored(by_list, 'project')
+        assert by_batch._dirty_symbols == by_list._dirty_symbols
+        assert by_batch._dirty_symbols['project'] == {symbol.stripped for symbol in symbols}
+    finally:
+        by_list.close()
+        by_batch.close()
+
+
+def test_record_symbols_deletes_original_names(rename_engine):
+    rename_engine.record_symbols('project', [Symbol(SYMBOL_TYPE_METHOD, 'La;->m()V', 'renamed', 1, 'alice'),
+                                             Symbol(SYMBOL_TYPE_METHOD, 'La;->n()V', 'renamed', 1, 'alice')])
+    rename_engine.record_symbols('project', SymbolBatch.from_symbols([
+        Symbol(SYMBOL_TYPE_METHOD, 'La;->m()V', FakeRenameEngine.ORIGINAL_NAME, 2, 'alice'),
+        Symbol(SYMBOL_TYPE_METHOD, 'La;->n()V', None, 2, 'alice'),
+    ]))
+    assert stored(rename_engine, 'project') == []
+
+
+def test_flush_keeps_symbols_dirtied_meanwhile(rename_engine):
+    first = Symbol(SYMBOL_TYPE_METHOD, 'La;->m()V', 'first', 1, 'alice')
+    second = Symbol(SYMBOL_TYPE_METHOD, 'La;->m()V', 'second', 2, 'alice')
+    rename_engine.record_symbols('project', [first])
+    enqueue_rename = rename_engine._enqueue_rename
+
+    def enqueue_recording(project, symbol):
+        # A newer rename is recorded (e.g. downstream) while the older one is flushed
+        rename_engine.record_symbols('project', [second])
+        return enqueue_rename(project, symbol)
+
+    rename_engine._enqueue_rename = enqueue_recording
+    rename_engine.flush_all_symbols()
+    assert rename_engine._dirty_symbols['project'] == {first.stripped}
+
+    rename_engine._enqueue_rename = enqueue_rename
+    rename_engine.flush_all_symbols()
+    assert rename_engine._dirty_symbols['project'] == set()
+    assert rename_engine.names['La;->m()V'] == 'second'
+
+
+def test_failed_flush_keeps_symbols_dirty(rename_engine):
+    symbols = [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', 'renamed', 1, 'alice') for i in range(5)]
+    rename_engine.record_symbols('project', symbols)
+    rename_engine.record_symbols('other', symbols)
+    rename_engine.FLUSH_BATCH_SYMBOLS = 2
+
+    def failing_enqueue(project, symbol):
+        raise EnvironmentError('decompiler gone')
+
+    enqueue_rename, rename_engine._enqueue_rename = rename_engine._enqueue_rename, failing_enqueue
+    with pytest.raises(EnvironmentError):
+        rename_engine.flush_all_symbols()
+    stripped = {symbol.stripped for symbol in symbols}
+    assert rename_engine._dirty_symbols == {'project': stripped, 'other': stripped}
+
+    rename_engine._enqueue_rename = enqueue_rename
+    rename_engine.flush_all_symbols()
+    assert rename_engine._dirty_symbols == {'project': set(), 'other': set()}
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from client_base.connection import ConnectionError
+from client_base.rename_listener import RenameListenerABC
+from client_base.rename_outbox import RenameOutbox
+from common.commands import UpstreamSymbols
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+
+
+def rename(i: int, name: str = 'renamed') -> Symbol:
+    return Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', f'{name}{i}')
+
+
+def wait_until(predicate, timeout: float = 5) -> bool:
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Recorder:
+    # Records the batches handed to it, failing the first `failures` calls with `error`
+    def __init__(self, failures: int = 0, error: type = RuntimeError):
+        self.batches = []
+        self.calls = 0
+        self._failures = failures
+        self._error = error
+        self.handled = threading.Event()
+
+    def __call__(self, project: str, symbols: list):
+        self.calls += 1
+        if self.calls <= self._failures:
+            raise self._error('failed')
+        self.batches.append((project, [symbol.name for symbol in symbols]))
+        self.handled.set()
+
+
+def test_renames_batched():
+    recorder = Recorder()
+    outbox = RenameOutbox(recorder, window=0.2, max_symbols=3)
+    # Holding the sender thread off, so the window can't pass before all renames are offered
+    with outbox._condition:
+        for i in range(2):
+            outbox.offer('project', rename(i))
+        outbox.offer('other', rename(0))
+        # A later rename of a signature replaces the pending one, moving it to the end
+        outbox.offer('project', rename(0, 'again'))
+    assert recorder.handled.wait(5)
+    outbox.close()
+    assert recorder.batches == [('project', ['renamed1', 'again0']), ('other', ['renamed0'])]
+
+
+def test_full_batch_sent_before_window():
+    recorder = Recorder()
+    outbox = RenameOutbox(recorder, window=60, max_symbols=3)
+    try:
+        for i in range(3):
+            outbox.offer('project', rename(i))
+        assert recorder.handled.wait(5)
+        assert recorder.batches == [('project', ['renamed0', 'renamed1', 'renamed2'])]
+    finally:
+        outbox.close()
+
+
+def test_close_sends_pending():
+    recorder = Recorder()
+    outbox = RenameOutbox(recorder, window=60)
+    for i in range(5):
+        outbox.offer('project', rename(i))
+    outbox.close()
+    assert recorder.batches == [('project', [f'renamed{i}' for i in range(5)])]
+    # Renames offered once closed are dropped
+    outbox.offer('project', rename(5))
+    assert recorder.calls == 1
+
+
+def test_failed_batch_retried():
+    recorder = Recorder(failures=2)
+    outbox = RenameOutbox(recorder, window=0, retry_delay=0.01, max_attempts=3)
+    outbox.offer('project', rename(0))
+    outbox.close()
+    assert recorder.calls == 3
+    assert recorder.batches == [('project', ['renamed0'])]
+
+
+def test_failing_batch_dropped():
+    recorder = Recorder(failures=3)
+    outbox = RenameOutbox(recorder, window=0, retry_delay=0.01, max_attempts=3)
+    outbox.offer('project', rename(0))
+    assert wait_until(lambda: recorder.calls == 3)
+    # Later batches are still sent
+    outbox.offer('project', rename(1))
+    outbox.close()
+    assert recorder.batches == [('project', ['renamed1'])]
+
+
+def test_connection_lost_stops_sending():
+    recorder = Recorder(failures=1, error=ConnectionError)
+    outbox = RenameOutbox(recorder, window=0, retry_delay=0.01)
+    outbox.offer('project', rename(0))
+    outbox.close()
+    outbox.offer('project', rename(1))
+    assert recorder.calls == 1 and recorder.batches == []
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commands = []
+
+    def send_command(self, command):
+        self.commands.append(command)
+
+
+class FakeRenameListener(RenameListenerABC):
+    def start(self):
+        pass
+
+
+def test_renames_recorded_before_sent(rename_engine):
+    connection = FakeConnection()
+    listener = FakeRenameListener(connection, rename_engine)
+    listener._outbox = RenameOutbox(listener._send_renames, window=60)
+    try:
+        symbol = rename(0)
+        listener.on_rename('project', symbol)
+        # Known right away, so the rename (once applied again by a flush) isn't sent back
+        assert rename_engine.is_symbol_rename_known('project', symbol, True)
+        listener.on_rename('project', symbol)
+        assert connection.commands == []
+    finally:
+        listener.close()
+
+    command, = connection.commands
+    assert isinstance(command, UpstreamSymbols)
+    assert [(sent.canonical_signature, sent.name, sent.author) for sent in command.symbols] == \
+        [(symbol.canonical_signature, symbol.name, 'me')]
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import signal
+import socket
+from typing import Dict
+
+from benchmark.server_process import ServerProcess
+from common.commands import Subscribe, UpstreamSymbols, DownstreamSymbols, FullSyncRequest, FullSyncComplete
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from test_symbol_server import connect, send_command, recv_command, until
+
+PROJECT = 'project'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def symbols(prefix: str, count: int) -> list:
+    return [Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', f'{prefix}{i}') for i in range(count)]
+
+
+async def full_sync(port: int) -> Dict[str, str]:
+    reader, writer = await connect(port, 'syncing')
+    try:
+        await send_command(writer, FullSyncRequest(PROJECT, 0))
+        names = {}
+        while True:
+            command = await recv_command(reader)
+            if isinstance(command, FullSyncComplete):
+                return names
+            names.update((symbol.canonical_signature, symbol.name) for symbol in command.symbols)
+    finally:
+        writer.close()
+
+
+async def upload(port: int, prefix: str, count: int):
+    reader, writer = await connect(port, 'uploading')
+    try:
+        await send_command(writer, UpstreamSymbols(PROJECT, symbols(prefix, count), False))
+        # Uploads are committed in order, so a full sync completes only after the upload was
+        await send_command(writer, FullSyncRequest(PROJECT, 0))
+        while not isinstance(await recv_command(reader), FullSyncComplete):
+            pass
+    finally:
+        writer.close()
+
+
+async def synced(port: int, expected: Dict[str, str]):
+    # Waits for the server to have exactly the expected symbols
+    for _ in range(300):
+        if await full_sync(port) == expected:
+            return
+        await asyncio.sleep(0.1)
+    assert await full_sync(port) == expected
+
+
+def names(prefix: str, count: int) -> Dict[str, str]:
+    return {symbol.canonical_signature: symbol.name for symbol in symbols(prefix, count)}
+
+
+def test_follower(tmp_path):
+    # A primary and a follower, each in its own process, through catching up, a reset once the primary's store was
+    # replaced, and the follower's promotion
+    async def scenario():
+        resources = tmp_path / 'resources'
+        resources.mkdir()
+        primary_port, follower_port = free_port(), free_port()
+        directories = {name: tmp_path / name for name in ('primary', 'follower')}
+        for directory in directories.values():
+            directory.mkdir()
+
+        def primary_process():
+            return ServerProcess(directories['primary'], resources, primary_port, [],
+                                 tmp_path / 'primary.log')
+
+        primary = primary_process()
+        follower = ServerProcess(directories['follower'], resources, follower_port,
+                                 ['--replicate-from', f'127.0.0.1:{primary_port}'], tmp_path / 'follower.log')
+        try:
+            await primary.start()
+            await upload(primary_port, 'first', 50)
+
+            # Catches up on what the primary had, then follows its changes, fanning them out to subscribers
+            await follower.start()
+            await synced(follower_port, names('first', 50))
+            reader, writer = await connect(follower_port, 'subscriber')
+            await send_command(writer, Subscribe(PROJECT))
+            await until(lambda: 'subscriber' in (tmp_path / 'follower.log').read_text())
+            await upload(primary_port, 'second', 10)
+            update = await asyncio.wait_for(recv_command(reader), 10)
+            assert isinstance(update, DownstreamSymbols)
+            assert {symbol.name for symbol in update.symbols} == set(names('second', 10).values())
+            writer.close()
+
+            # Uploads to the follower are rejected, disconnecting the client
+            reader, writer = await connect(follower_port, 'rejected')
+            await send_command(writer, UpstreamSymbols(PROJECT, symbols('rejected', 1), False))
+            assert await asyncio.wait_for(reader.read(), 10) == b''
+            expected = {**names('first', 50), **names('second', 10)}
+            assert await full_sync(follower_port) == expected
+
+            # The primary's store is replaced by one with fewer changes, which the follower is reset to
+            primary.stop()
+            (directories['primary'] / f'{PROJECT}.db').unlink()
+            for suffix in ('-wal', '-shm'):
+                path = directories['primary'] / f'{PROJECT}.db{suffix}'
+                if path.exists():
+                    path.unlink()
+            primary = primary_process()
+            await primary.start()
+            await upload(primary_port, 'replaced', 5)
+            await synced(follower_port, names('replaced', 5))
+
+            # Once the primary is gone, the promoted follower accepts uploads
+            primary.stop()
+            os.kill(follower.pid, signal.SIGUSR1)
+            await until(lambda: 'Promoted' in (tmp_path / 'follower.log').read_text())
+            await upload(follower_port, 'promoted', 3)
+            assert await full_sync(follower_port) == {**names('replaced', 5), **names('promoted', 3)}
+        finally:
+            primary.stop()
+            follower.stop()
+
+    asyncio.run(scenario())
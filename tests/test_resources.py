@@ -0,0 +1,172 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+import client_base.resources as resources
+from client_base.connection import ConnectionABC, ConnectionError
+from client_base.resources import fetch_resource, recorded_sha256, resource_is_fresh, HASH_SUFFIX, PARTIAL_SUFFIX
+from common.commands import ResourceChunk, ResourceChunkRequest
+
+
+class FakeResourceServer(ConnectionABC):
+    # Serves a resource in chunks, as SymbolServer.push_resource does, optionally dropping the connection after a few
+    # chunks or corrupting their content
+    def __init__(self, name: str, content: bytes, chunk_bytes: int = 10):
+        ConnectionABC.__init__(self, 'localhost', 0)
+        self.name = name
+        self.content = content
+        self.chunk_bytes = chunk_bytes
+        self.requests = []
+        self.drop_after = None
+        self.corrupt = 0
+        self._responses = []
+
+    @property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.content).hexdigest()
+
+    def send_command(self, command):
+        assert isinstance(command, ResourceChunkRequest) and command.name == self.name
+        self.requests.append(command)
+        size = len(self.content)
+        if command.sha256 == self.sha256 and not command.offset:
+            self._responses = [ResourceChunk(self.name, self.sha256, size, size, b'')]
+            return
+
+        offset = command.offset if command.sha256 == self.sha256 and 0 < command.offset <= size else 0
+        self._responses = []
+        while True:
+            chunk = self.content[offset:offset + self.chunk_bytes]
+            if self.corrupt:
+                chunk = bytes(b ^ 0xff for b in chunk)
+            self._responses.append(ResourceChunk(self.name, self.sha256, size, offset, chunk))
+            offset += len(chunk)
+            if offset >= size:
+                break
+        if self.corrupt:
+            self.corrupt -= 1
+
+    def recv_command(self):
+        if self.drop_after is not None:
+            if self.drop_after == 0:
+                self.drop_after = None
+                raise ConnectionError()
+            self.drop_after -= 1
+        return self._responses.pop(0)
+
+    def send_packet(self, data):
+        raise NotImplementedError
+
+    def recv_packet(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'library.jar')
+
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    assert fetch_resource(server, path)
+    assert read(path) == CONTENT
+    assert recorded_sha256(path) == server.sha256
+    assert resource_is_fresh(path)
+
+    # Up to date, without hashing the file again
+    hashes = []
+    original = resources.file_sha256
+    resources.file_sha256 = lambda p: hashes.append(p) or original(p)
+    try:
+        assert not fetch_resource(server, path)
+    finally:
+        resources.file_sha256 = original
+    assert hashes == []
+    assert server.requests[-1].sha256 == server.sha256
+
+
+def test_resume(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    server.drop_after = 30
+    with pytest.raises(ConnectionError):
+        fetch_resource(server, path)
+    assert not os.path.exists(path)
+    partial = '%s.%s%s' % (path, server.sha256, PARTIAL_SUFFIX)
+    assert os.path.getsize(partial) == 30 * server.chunk_bytes
+
+    assert fetch_resource(server, path)
+    assert server.requests[-1].offset == 30 * server.chunk_bytes
+    assert server.requests[-1].sha256 == server.sha256
+    assert read(path) == CONTENT
+    assert not os.path.exists(partial)
+
+
+def test_resume_of_changed_resource(path):
+    # A partial download of a resource which changed since is restarted
+    server = FakeResourceServer('library.jar', CONTENT)
+    server.drop_after = 30
+    with pytest.raises(ConnectionError):
+        fetch_resource(server, path)
+
+    server.content = CONTENT[::-1]
+    assert fetch_resource(server, path)
+    assert read(path) == CONTENT[::-1]
+    assert [partial for partial in os.listdir(os.path.dirname(path)) if partial.endswith(PARTIAL_SUFFIX)] == []
+
+
+def test_hash_mismatch_retried(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    server.corrupt = 1
+    assert fetch_resource(server, path)
+    assert len(server.requests) == 2
+    assert read(path) == CONTENT
+
+
+def test_hash_mismatch_gives_up(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    server.corrupt = resources.RESOURCE_FETCH_ATTEMPTS
+    with pytest.raises(EnvironmentError):
+        fetch_resource(server, path)
+    assert not os.path.exists(path)
+    assert [partial for partial in os.listdir(os.path.dirname(path)) if partial.endswith(PARTIAL_SUFFIX)] == []
+
+
+def test_local_changes_make_resource_stale(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    fetch_resource(server, path)
+    with open(path, 'ab') as f:
+        f.write(b'corrupt')
+    assert recorded_sha256(path) is None
+    assert not resource_is_fresh(path)
+
+    # The modified file is hashed, differs from the server's, and is downloaded again
+    assert fetch_resource(server, path)
+    assert read(path) == CONTENT
+    assert resource_is_fresh(path)
+
+
+def test_recheck_after_max_age(path):
+    server = FakeResourceServer('library.jar', CONTENT)
+    fetch_resource(server, path)
+    checked = time.time() - resources.RESOURCE_RECHECK_SECONDS - 1
+    os.utime(path + HASH_SUFFIX, (checked, checked))
+    assert not resource_is_fresh(path)
+    assert not fetch_resource(server, path)
+    assert resource_is_fresh(path)
+
+
+def test_missing_resource_not_fresh(path):
+    assert not resource_is_fresh(path)
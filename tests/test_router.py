@@ -0,0 +1,60 @@
+import asyncio
+
+from common.commands import Subscribe, FullSyncRequest, FullSyncComplete
+from server.router import SymbolRouter
+from test_symbol_server import connect, send_command, recv_command, until
+
+
+def test_exited_worker_restarted(tmp_path):
+    async def scenario():
+        router = SymbolRouter('127.0.0.1', 0, tmp_path, None, 1)
+        router.MIN_RESTART_DELAY = 0.01
+        await router.start_workers()
+        listener = await asyncio.start_server(router.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await connect(port, 'alice')
+            await send_command(writer, Subscribe('project'))
+            await send_command(writer, FullSyncRequest('project', 0))
+            assert isinstance(await recv_command(reader), FullSyncComplete)
+
+            exited = router._workers[0]
+            exited.process.kill()
+            # The worker's clients are dropped, and reconnect to the restarted worker
+            assert await asyncio.wait_for(reader.read(), 5) == b''
+            await until(lambda: router._workers[0] is not exited and router._workers[0].alive, 30)
+            assert router._worker_restarts.value == 1
+
+            reader, writer = await connect(port, 'alice')
+            await send_command(writer, Subscribe('project'))
+            await send_command(writer, FullSyncRequest('project', 0))
+            assert isinstance(await asyncio.wait_for(recv_command(reader), 30), FullSyncComplete)
+            writer.close()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            router.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_command_keeps_connection(tmp_path):
+    async def scenario():
+        router = SymbolRouter('127.0.0.1', 0, tmp_path, None, 1)
+        await router.start_workers()
+        listener = await asyncio.start_server(router.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await connect(port, 'alice')
+            # The store of a project within a missing directory can't be opened, failing the command alone
+            await send_command(writer, FullSyncRequest('missing/project', 0))
+            await send_command(writer, FullSyncRequest('project', 0))
+            assert isinstance(await asyncio.wait_for(recv_command(reader), 30), FullSyncComplete)
+            assert router._workers[0].alive
+            writer.close()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            router.close()
+
+    asyncio.run(scenario())
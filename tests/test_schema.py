@@ -0,0 +1,131 @@
+import re
+import sqlite3
+
+import pytest
+
+from common.sql_queries import (GET_SYMBOLS_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY, GET_SYMBOLS_AUTHOR_QUERY,
+                                GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY, GET_SYMBOLS_SEQ_PAGE_QUERY,
+                                GET_SYMBOLS_PAGE_QUERY, PUSH_SYMBOLS_QUERY, DELETE_SYMBOLS_QUERY,
+                                GET_CANDIDATE_SYMBOLS_QUERY, CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY,
+                                GET_CHANGED_CANDIDATE_SYMBOLS_QUERY, CREATE_CANDIDATE_SYMBOLS_TABLE_QUERY,
+                                GET_SUPERSEDED_SYMBOLS_PAGE_QUERY, SCHEMA_MIGRATIONS, CREATE_SYMBOLS_TABLE_QUERY)
+from client_base.sql_queries import (CLIENT_SCHEMA_MIGRATIONS, CLIENT_DELETE_SYMBOLS_QUERY, GET_CANDIDATE_RENAMES_QUERY,
+                                     GET_RENAME_BY_CANONICAL_SIGNATURE_QUERY, DELETE_RENAME_QUERY)
+from common.symbol import Symbol, SYMBOL_TYPE_CLASS, SYMBOL_TYPE_METHOD
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+
+# Tables holding a statement's own input (its bound values, or the candidates staged for it), which it may scan
+INPUT_TABLES = {'input', 'CONSTANT', 'candidate_signatures', 'candidate_symbols'}
+
+# Queries run per uploaded symbol, flush, page or compaction, which must search their tables rather than scan them
+SERVER_HOT_QUERIES = [GET_SYMBOLS_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY, GET_SYMBOLS_AUTHOR_QUERY,
+                      GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY, GET_SYMBOLS_PAGE_QUERY, GET_SYMBOLS_SEQ_PAGE_QUERY,
+                      PUSH_SYMBOLS_QUERY, DELETE_SYMBOLS_QUERY, GET_CANDIDATE_SYMBOLS_QUERY,
+                      GET_CHANGED_CANDIDATE_SYMBOLS_QUERY, GET_SUPERSEDED_SYMBOLS_PAGE_QUERY]
+CLIENT_HOT_QUERIES = [GET_SYMBOLS_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY, GET_SYMBOLS_AUTHOR_QUERY,
+                      GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY, PUSH_SYMBOLS_QUERY, CLIENT_DELETE_SYMBOLS_QUERY,
+                      GET_CANDIDATE_SYMBOLS_QUERY, GET_CHANGED_CANDIDATE_SYMBOLS_QUERY, GET_CANDIDATE_RENAMES_QUERY,
+                      GET_RENAME_BY_CANONICAL_SIGNATURE_QUERY, DELETE_RENAME_QUERY]
+
+
+def query_plan(store, query):
+    numbered = [int(number) for number in re.findall(r'\?(\d+)', query)]
+    arguments = [0] * (max(numbered) if numbered else query.count('?'))
+    return ' / '.join(row[-1] for row in store._conn.execute_query('EXPLAIN QUERY PLAN ' + query, *arguments))
+
+
+def scanned_tables(store, query):
+    return [step.split()[1] for step in query_plan(store, query).split(' / ') if step.startswith('SCAN ')]
+
+
+@pytest.mark.parametrize('query', [GET_SYMBOLS_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY,
+                                   GET_SYMBOLS_SEQ_PAGE_QUERY])
+def test_server_queries_use_covering_indexes(server_store, query):
+    assert 'USING COVERING INDEX' in query_plan(server_store, query)
+
+
+def staged(store):
+    store._conn.execute(CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY)
+    store._conn.execute(CREATE_CANDIDATE_SYMBOLS_TABLE_QUERY)
+    return store
+
+
+@pytest.mark.parametrize('query', SERVER_HOT_QUERIES)
+def test_server_hot_queries_search(server_store, query):
+    assert set(scanned_tables(staged(server_store), query)) <= INPUT_TABLES
+
+
+@pytest.mark.parametrize('query', CLIENT_HOT_QUERIES)
+def test_client_hot_queries_search(client_store, query):
+    assert set(scanned_tables(staged(client_store), query)) <= INPUT_TABLES
+
+
+@pytest.mark.parametrize('query', [GET_SYMBOLS_AUTHOR_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_AUTHOR_QUERY])
+def test_server_author_queries_use_primary_key(server_store, query):
+    # `latest_symbols` is WITHOUT ROWID, so its primary key covers every column
+    assert 'USING PRIMARY KEY' in query_plan(server_store, query)
+
+
+@pytest.mark.parametrize('query', [GET_SYMBOLS_QUERY, GET_SYMBOLS_CANONICAL_SIGNATURE_QUERY])
+def test_client_queries_use_covering_indexes(client_store, query):
+    assert 'USING COVERING INDEX' in query_plan(client_store, query)
+
+
+@pytest.mark.parametrize('store_fixture', ['server_store', 'client_store'])
+def test_candidate_signatures_search_index(request, store_fixture):
+    # Only the candidates are scanned, each searching the index for its symbols
+    store = request.getfixturevalue(store_fixture)
+    store._conn.execute(CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY)
+    assert scanned_tables(store, GET_CANDIDATE_SYMBOLS_QUERY) == ['candidate_signatures']
+    assert 'USING COVERING INDEX' in query_plan(store, GET_CANDIDATE_SYMBOLS_QUERY)
+
+
+def test_candidate_renames_search_primary_key(client_store):
+    client_store._conn.execute(CREATE_CANDIDATE_SIGNATURES_TABLE_QUERY)
+    assert scanned_tables(client_store, GET_CANDIDATE_RENAMES_QUERY) == ['candidate_signatures']
+
+
+def test_migrations_are_recorded(server_store, client_store):
+    assert server_store.schema_version == len(SCHEMA_MIGRATIONS)
+    assert client_store.schema_version == len(CLIENT_SCHEMA_MIGRATIONS)
+
+
+def test_newer_schema_is_refused(server_store):
+    server_store.set_metadata_property('schema_version', str(len(SCHEMA_MIGRATIONS) + 1))
+    with pytest.raises(EnvironmentError):
+        server_store.migrate(SCHEMA_MIGRATIONS)
+
+
+def test_baseline_store_migrated_in_place(tmp_path):
+    # A store of the baseline schema (version 0): the history table alone, without metadata
+    path = str(tmp_path / 'baseline.db')
+    history = [('alice', SYMBOL_TYPE_METHOD, 'La;->a()V', 'a1', 1), ('alice', SYMBOL_TYPE_METHOD, 'La;->a()V', 'a2', 3),
+               ('bob', SYMBOL_TYPE_METHOD, 'La;->a()V', 'b1', 2), ('alice', SYMBOL_TYPE_CLASS, 'La;', 'A', 2),
+               ('alice', SYMBOL_TYPE_CLASS, 'La;', None, 4)]
+    with sqlite3.connect(path) as conn:
+        conn.execute(CREATE_SYMBOLS_TABLE_QUERY)
+        conn.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?)', history)
+    conn.close()
+
+    store = PySqliteSymbolStore(path)
+    try:
+        assert store.schema_version == len(SCHEMA_MIGRATIONS)
+        assert set(store._conn.execute_query('SELECT * FROM symbols')) == set(history)
+        latest = [('bob', 'La;->a()V', 'b1', 2), ('alice', 'La;->a()V', 'a2', 3), ('alice', 'La;', None, 4)]
+        assert {(s.author, s.canonical_signature, s.name, s.timestamp) for s in store.get_symbols()} == set(latest)
+        # The latest versions are numbered in order of change
+        symbols, sequences = store.get_changes_page(after=0, limit=10)
+        assert [(s.author, s.canonical_signature, s.name, s.timestamp) for s in symbols] == latest
+        assert sequences == [1, 2, 3] and store.sequence == 3
+
+        store.push_symbols([Symbol(SYMBOL_TYPE_METHOD, 'La;->a()V', 'b2', timestamp=5, author='bob')])
+        assert store.sequence == 4
+    finally:
+        store.close()
+
+    # Migrated once
+    store = PySqliteSymbolStore(path)
+    try:
+        assert store.schema_version == len(SCHEMA_MIGRATIONS) and store.sequence == 4
+    finally:
+        store.close()
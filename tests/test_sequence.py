@@ -0,0 +1,105 @@
+import sqlite3
+
+from common.sql_queries import SCHEMA_MIGRATIONS, CREATE_SYMBOLS_TABLE_QUERY, CREATE_METADATA_TABLE_QUERY
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+
+
+def symbol(signature: str, name: str, timestamp: int, author: str = 'alice') -> Symbol:
+    return Symbol(SYMBOL_TYPE_METHOD, signature, name, timestamp=timestamp, author=author)
+
+
+def changes(store, after: int = 0):
+    symbols, sequences = store.get_changes_page(after=after, limit=1 << 20)
+    return [(symbol.author, symbol.canonical_signature, symbol.name, sequence)
+            for symbol, sequence in zip(symbols, sequences)]
+
+
+def indexes(store) -> dict:
+    # Index name -> whether it's unique
+    return {name: bool(unique)
+            for _, name, unique, _, _ in store._conn.execute_query('PRAGMA index_list(latest_symbols)')}
+
+
+def test_each_change_takes_next_sequence(server_store):
+    server_store.push_symbols([symbol('La;->a()V', 'a1', 1), symbol('La;->b()V', 'b1', 1)])
+    server_store.push_symbols([symbol('La;->a()V', 'a2', 2)])
+    # Older than the latest version, not a change
+    server_store.push_symbols([symbol('La;->b()V', 'b0', 0)])
+    assert server_store.sequence == 3
+    assert changes(server_store) == [('alice', 'La;->b()V', 'b1', 2), ('alice', 'La;->a()V', 'a2', 3)]
+    assert changes(server_store, after=2) == [('alice', 'La;->a()V', 'a2', 3)]
+
+
+def test_seq_index_is_not_unique(server_store):
+    assert indexes(server_store)['latest_symbols_seq_page'] is False
+    assert 'latest_symbols_seq' not in indexes(server_store)
+
+
+def test_migration_adds_seq_index(tmp_path):
+    path = str(tmp_path / 'old.db')
+    # A store created before sequence numbers
+    with sqlite3.connect(path) as conn:
+        for statement in [CREATE_SYMBOLS_TABLE_QUERY, CREATE_METADATA_TABLE_QUERY] + \
+                [statement for migration in SCHEMA_MIGRATIONS[:2] for statement in migration]:
+            conn.execute(statement)
+        conn.execute("REPLACE INTO metadata(property, value) VALUES ('schema_version', '2')")
+    conn.close()
+
+    store = PySqliteSymbolStore(path)
+    try:
+        assert store.schema_version == len(SCHEMA_MIGRATIONS)
+        assert indexes(store)['latest_symbols_seq_page'] is False
+        assert 'latest_symbols_seq' not in indexes(store)
+    finally:
+        store.close()
+
+
+def test_delete_history_keeps_latest_versions(server_store):
+    server_store.push_symbols([symbol('La;->a()V', 'a1', 1)])
+    server_store.push_symbols([symbol('La;->a()V', 'a2', 2)])
+    server_store.push_symbols([symbol('La;->b()V', 'b1', 1)])
+    before = changes(server_store)
+
+    # Deleting the latest version of a symbol (or the only one) is ignored, so its change never goes missing from
+    # sequence pages
+    server_store.delete_history([('alice', 'La;->a()V', 2), ('alice', 'La;->b()V', 1)])
+    assert changes(server_store) == before
+    assert server_store.sequence == 3
+
+    # Superseded versions are deleted without being a change
+    server_store.delete_history([('alice', 'La;->a()V', 1)])
+    assert changes(server_store) == before
+    assert server_store.sequence == 3
+    assert sorted((s.canonical_signature, s.timestamp) for s in server_store.get_symbols()) == \
+        [('La;->a()V', 2), ('La;->b()V', 1)]
+
+
+def test_compaction_keeps_latest_versions(server_store):
+    for timestamp in range(1, 6):
+        server_store.push_symbols([symbol('La;->a()V', f'a{timestamp}', timestamp)])
+    server_store.push_symbols([symbol('La;->b()V', 'b1', 1)])
+    before = changes(server_store)
+
+    server_store.delete_history(server_store.get_superseded_symbols(before=1 << 40))
+    assert changes(server_store) == before
+    assert list(server_store._conn.execute_query('SELECT COUNT(*) FROM symbols'))[0][0] == 2
+
+
+def test_replicated_changes_keep_sequence_numbers(tmp_path):
+    primary = PySqliteSymbolStore(str(tmp_path / 'primary.db'))
+    follower = PySqliteSymbolStore(str(tmp_path / 'follower.db'))
+    try:
+        primary.push_symbols([symbol('La;->a()V', 'a1', 1), symbol('La;->b()V', 'b1', 1)])
+        primary.push_symbols([symbol('La;->a()V', 'a2', 2, author='bob')])
+        primary.push_symbols([symbol('La;->a()V', 'a3', 3)])
+        symbols, sequences = primary.get_changes_page(limit=2)
+        follower.apply_changes(symbols, sequences)
+        symbols, sequences = primary.get_changes_page(after=sequences[-1])
+        follower.apply_changes(symbols, sequences)
+
+        assert changes(follower) == changes(primary)
+        assert follower.sequence == primary.sequence
+    finally:
+        primary.close()
+        follower.close()
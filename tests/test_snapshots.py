@@ -0,0 +1,222 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from common.codecs import JSON_CODEC
+from common.commands import DownstreamSymbols, FullSyncRequest, FullSyncComplete
+from common.compression import packet_size, decompress_packet
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.async_symbol_store import AsyncSymbolStore
+from server.config import ServerConfig
+from server.default_symbol_server import DefaultSymbolServer
+from server.metrics import MetricsRegistry
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+from server.snapshots import SnapshotCache, SnapshotMetrics, PACKET_SIZE
+from server.symbol_server import SymbolServer
+from test_symbol_server import connect, handshake, push, send_command, recv_command, until
+
+KEY = (JSON_CODEC.name, None, False)
+
+
+def symbol(i: int, name: str = 'name') -> Symbol:
+    return Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i}()V', f'{name}{i}', timestamp=1, author='alice')
+
+
+def decode(frame) -> DownstreamSymbols:
+    size, compressed = packet_size(PACKET_SIZE.unpack_from(frame)[0])
+    assert len(frame) == PACKET_SIZE.size + size
+    return JSON_CODEC.decode(decompress_packet(bytes(frame[PACKET_SIZE.size:]), compressed))
+
+
+def names(snapshot) -> list:
+    commands = [decode(frame) for frame in snapshot.frames()]
+    assert all(isinstance(command, DownstreamSymbols) and command.project == 'project' for command in commands)
+    return [symbol.name for command in commands for symbol in command.symbols]
+
+
+class Snapshots:
+    # A snapshot cache of the stores in `directory`, with a store opened for every use
+    def __init__(self, directory, rebuild_changes: int = 5, split_page=SymbolServer.split_page):
+        self.directory = directory
+        self.metrics = SnapshotMetrics(MetricsRegistry(), lambda: self.cache.sizes())
+        self.cache = SnapshotCache(lambda project: directory / 'snapshots' / project, self.use, split_page,
+                                   rebuild_changes, self.metrics)
+
+    @asynccontextmanager
+    async def use(self, project: str):
+        store = AsyncSymbolStore(project, lambda: PySqliteSymbolStore(str(self.directory / f'{project}.db')))
+        try:
+            yield store
+        finally:
+            store.close()
+
+    async def built(self):
+        await asyncio.gather(*self.cache._builds.values())
+
+    def requests(self, result: str) -> int:
+        return self.metrics.requests.labels(result).value
+
+
+def test_snapshot_built_and_served(tmp_path):
+    async def scenario():
+        snapshots = Snapshots(tmp_path)
+        push(tmp_path, [symbol(i) for i in range(10)])
+        try:
+            # Missing at first, and built in the background
+            assert snapshots.cache.get('project', KEY, 10) is None
+            await snapshots.built()
+            snapshot = snapshots.cache.get('project', KEY, 10)
+            assert (snapshot.sequence, snapshot.symbols) == (10, 10)
+            assert names(snapshot) == [f'name{i}' for i in range(10)]
+            assert snapshots.cache.sizes() == [(('project',), snapshot.size)]
+            assert (snapshots.requests('miss'), snapshots.requests('hit')) == (1, 1)
+            assert snapshots.metrics.builds.value == 1
+        finally:
+            snapshots.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_small_project_not_snapshotted(tmp_path):
+    async def scenario():
+        snapshots = Snapshots(tmp_path)
+        push(tmp_path, [symbol(i) for i in range(4)])
+        assert snapshots.cache.get('project', KEY, 4) is None
+        assert not snapshots.cache._builds
+        assert snapshots.requests('miss') == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_snapshot_rebuilt(tmp_path):
+    async def scenario():
+        snapshots = Snapshots(tmp_path)
+        push(tmp_path, [symbol(i) for i in range(10)])
+        try:
+            snapshots.cache.get('project', KEY, 10)
+            await snapshots.built()
+
+            # Fewer changes than `rebuild_changes` behind, still served as is
+            push(tmp_path, [symbol(i, 'renamed') for i in range(4)])
+            assert snapshots.cache.get('project', KEY, 14).sequence == 10
+            assert not snapshots.cache._builds
+
+            # Served while rebuilt
+            push(tmp_path, [symbol(4, 'renamed')])
+            assert snapshots.cache.get('project', KEY, 15).sequence == 10
+            await snapshots.built()
+            snapshot = snapshots.cache.get('project', KEY, 15)
+            assert (snapshot.sequence, snapshot.symbols) == (15, 10)
+            assert sorted(names(snapshot)) == sorted([f'renamed{i}' for i in range(5)] +
+                                                     [f'name{i}' for i in range(5, 10)])
+            assert snapshots.requests('hit') == 3 and snapshots.metrics.builds.value == 2
+        finally:
+            snapshots.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_ahead_of_store_dropped(tmp_path):
+    async def scenario():
+        snapshots = Snapshots(tmp_path)
+        push(tmp_path, [symbol(i) for i in range(10)])
+        try:
+            snapshots.cache.get('project', KEY, 10)
+            await snapshots.built()
+
+            # The store was replaced (e.g. reset by replication) by one at an earlier sequence number
+            (tmp_path / 'project.db').unlink()
+            push(tmp_path, [symbol(i, 'other') for i in range(3)])
+            assert snapshots.cache.get('project', KEY, 3) is None
+            assert snapshots.requests('miss') == 2
+        finally:
+            snapshots.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidated_snapshot_deleted(tmp_path):
+    async def scenario():
+        snapshots = Snapshots(tmp_path)
+        push(tmp_path, [symbol(i) for i in range(10)])
+        try:
+            snapshots.cache.get('project', KEY, 10)
+            await snapshots.built()
+            assert list((tmp_path / 'snapshots' / 'project').iterdir())
+
+            snapshots.cache.invalidate('project')
+            assert not (tmp_path / 'snapshots' / 'project').exists()
+            assert snapshots.cache.sizes() == []
+            # Rebuilt from the store on the next request
+            assert snapshots.cache.get('project', KEY, 10) is None
+            await snapshots.built()
+            assert snapshots.cache.get('project', KEY, 10).sequence == 10
+        finally:
+            snapshots.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_build_cleaned_up(tmp_path):
+    def failing_split_page(symbols):
+        raise RuntimeError('encoding failed')
+
+    async def scenario():
+        snapshots = Snapshots(tmp_path, split_page=failing_split_page)
+        push(tmp_path, [symbol(i) for i in range(10)])
+        try:
+            assert snapshots.cache.get('project', KEY, 10) is None
+            await snapshots.built()
+            assert list((tmp_path / 'snapshots' / 'project').iterdir()) == []
+            assert snapshots.metrics.builds.value == 0
+            # Retried on the next request
+            assert snapshots.cache.get('project', KEY, 10) is None
+            assert snapshots.cache._builds
+            await snapshots.built()
+        finally:
+            snapshots.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_sync_sends_delta_after_snapshot(tmp_path):
+    async def scenario():
+        (tmp_path / 'stores').mkdir()
+        push(tmp_path / 'stores', [symbol(i) for i in range(10)])
+        server = DefaultSymbolServer('127.0.0.1', 0, tmp_path / 'stores', None,
+                                     ServerConfig(snapshot_rebuild_changes=5))
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        async def full_sync() -> tuple:
+            reader, writer = await connect(port, 'alice')
+            try:
+                await handshake(reader, writer)
+                await send_command(writer, FullSyncRequest('project', 0))
+                received = []
+                while True:
+                    command = await recv_command(reader)
+                    if isinstance(command, FullSyncComplete):
+                        return received, command.seq
+                    received.extend(symbol.name for symbol in command.symbols)
+            finally:
+                writer.close()
+
+        try:
+            assert await full_sync() == ([f'name{i}' for i in range(10)], 10)
+            await until(lambda: not server._snapshots._builds)
+
+            push(tmp_path / 'stores', [symbol(3, 'renamed'), symbol(10)])
+            received, seq = await full_sync()
+            # The snapshot (at sequence number 10) followed by the changes since
+            assert received == [f'name{i}' for i in range(10)] + ['renamed3', 'name10']
+            assert seq == 12
+            assert server._snapshot_metrics.requests.labels('hit').value == 1
+            assert server._snapshot_metrics.delta_symbols.count == 1
+            assert server._snapshot_metrics.delta_symbols.sum == 2
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server._snapshots.close()
+            server._stores.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from server.pysqlite_symbol_store import SqliteAdapter
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    adapter = SqliteAdapter(str(tmp_path / 'test.db'))
+    adapter.execute('CREATE TABLE items (value INTEGER)')
+    yield adapter
+    adapter.close()
+
+
+def values(adapter: SqliteAdapter) -> list:
+    return [value for value, in adapter.execute_query('SELECT value FROM items ORDER BY value')]
+
+
+def test_transaction_commits_together(adapter):
+    with adapter.transaction():
+        adapter.execute('INSERT INTO items VALUES (1)')
+        adapter.executemany('INSERT INTO items VALUES (?)', [(2, ), (3, )])
+        assert adapter.in_transaction
+    assert not adapter.in_transaction
+    assert values(adapter) == [1, 2, 3]
+
+
+def test_transaction_rolled_back_on_exception(adapter):
+    adapter.execute('INSERT INTO items VALUES (1)')
+    with pytest.raises(ValueError):
+        with adapter.transaction():
+            adapter.execute('INSERT INTO items VALUES (2)')
+            adapter.executemany('INSERT INTO items VALUES (?)', [(3, )])
+            raise ValueError()
+    assert values(adapter) == [1]
+    assert not adapter.in_transaction
+
+
+def test_nested_transaction_joins_outer(adapter):
+    with pytest.raises(ValueError):
+        with adapter.transaction():
+            with adapter.transaction():
+                adapter.execute('INSERT INTO items VALUES (1)')
+            # Not committed with the inner transaction, so rolled back along with the outer one
+            assert adapter.in_transaction
+            raise ValueError()
+    assert values(adapter) == []
+
+
+@pytest.mark.parametrize('immediate', [True, False])
+def test_immediate_transaction_takes_write_lock(adapter, tmp_path, immediate):
+    other = sqlite3.connect(str(tmp_path / 'test.db'), timeout=0)
+    try:
+        with adapter.transaction(immediate=immediate):
+            if immediate:
+                with pytest.raises(sqlite3.OperationalError, match='locked'):
+                    other.execute('BEGIN IMMEDIATE')
+            else:
+                # Deferred transactions take it once they write
+                other.execute('BEGIN IMMEDIATE')
+                other.rollback()
+                adapter.execute_update('INSERT INTO items VALUES (1)')
+                with pytest.raises(sqlite3.OperationalError, match='locked'):
+                    other.execute('BEGIN IMMEDIATE')
+    finally:
+        other.close()
+    assert values(adapter) == ([] if immediate else [1])
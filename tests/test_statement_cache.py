@@ -0,0 +1,45 @@
+from common.statement_cache import StatementCache
+
+
+class Statements:
+    def __init__(self):
+        self.prepared = []
+        self.closed = []
+
+    def prepare(self, statement: str) -> tuple:
+        self.prepared.append(statement)
+        return statement, len(self.prepared)
+
+    def close(self, stmt: tuple):
+        self.closed.append(stmt[0])
+
+
+def test_statements_reused():
+    statements = Statements()
+    cache = StatementCache(2, statements.prepare, statements.close)
+    assert cache.get('a') is cache.get('a')
+    assert statements.prepared == ['a']
+
+
+def test_least_recently_used_evicted():
+    statements = Statements()
+    cache = StatementCache(2, statements.prepare, statements.close)
+    cache.get('a')
+    cache.get('b')
+    # Using `a` again makes `b` the least recently used
+    cache.get('a')
+    cache.get('c')
+    assert statements.closed == ['b']
+    assert 'a' in cache and 'c' in cache and len(cache) == 2
+    cache.get('b')
+    assert statements.closed == ['b', 'a']
+    assert statements.prepared == ['a', 'b', 'c', 'b']
+
+
+def test_clear_closes_all():
+    statements = Statements()
+    cache = StatementCache(3, statements.prepare, statements.close)
+    for statement in ('a', 'b'):
+        cache.get(statement)
+    cache.clear()
+    assert sorted(statements.closed) == ['a', 'b'] and len(cache) == 0
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+from server.async_symbol_store import AsyncSymbolStore
+from server.metrics import MetricsRegistry
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+from server.store_cache import StoreCache, StoreCacheMetrics
+
+
+class FakeStore:
+    def __init__(self, project: str):
+        self.project = project
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def cache(max_stores: int = 2, idle_timeout: float = 0):
+    opened = {}
+
+    def factory(project: str) -> FakeStore:
+        store = opened[project] = FakeStore(project)
+        return store
+
+    metrics = StoreCacheMetrics(MetricsRegistry())
+    return StoreCache(factory, max_stores, idle_timeout, metrics), opened, metrics
+
+
+async def use(stores: StoreCache, project: str) -> FakeStore:
+    async with stores.use(project) as store:
+        return store
+
+
+def test_evicts_least_recently_used():
+    async def scenario():
+        stores, opened, metrics = cache(max_stores=2)
+        a = await use(stores, 'a')
+        b = await use(stores, 'b')
+        assert await use(stores, 'a') is a
+        c = await use(stores, 'c')
+        # b was the least recently used
+        assert b.closed and not a.closed and not c.closed
+        assert len(stores) == 2
+        assert metrics.hits.value == 1
+        assert metrics.misses.value == 3
+        assert metrics.evictions.value == 1
+        assert metrics.open.value == 2
+
+        # An evicted store is reopened when used again
+        assert await use(stores, 'b') is not b
+        assert a.closed and not c.closed
+
+    asyncio.run(scenario())
+
+
+def test_pinned_and_used_stores_not_evicted():
+    async def scenario():
+        stores, opened, metrics = cache(max_stores=1)
+        stores.pin('a')
+        async with stores.use('b') as b:
+            await use(stores, 'c')
+            # Neither the pinned store nor the one in use are evicted, exceeding the bound meanwhile
+            assert not opened['a'].closed and not b.closed
+            assert opened['c'].closed
+
+        # Once it's no longer used, b is evicted
+        assert b.closed and not opened['a'].closed
+        assert len(stores) == 1
+
+    asyncio.run(scenario())
+
+
+def test_pins_are_counted():
+    async def scenario():
+        stores, opened, metrics = cache(max_stores=0)
+        stores.pin('a')
+        stores.pin('a')
+        stores.unpin('a')
+        await use(stores, 'a')
+        assert not opened['a'].closed
+
+        stores.unpin('a')
+        await use(stores, 'a')
+        assert opened['a'].closed
+        # Unpinning a closed (or unknown) store does nothing
+        stores.unpin('a')
+        stores.unpin('b')
+        assert len(stores) == 0
+
+    asyncio.run(scenario())
+
+
+def test_idle_sweep():
+    async def scenario():
+        stores, opened, metrics = cache(max_stores=10, idle_timeout=60)
+        for project in 'abc':
+            await use(stores, project)
+        stores.pin('b')
+        # a was last used long ago
+        stores._entries['a'].last_used = time.monotonic() - 120
+        stores._entries['b'].last_used = time.monotonic() - 120
+
+        await stores.evict_idle()
+        assert opened['a'].closed
+        assert not opened['b'].closed and not opened['c'].closed
+        assert len(stores) == 2
+
+    asyncio.run(scenario())
+
+
+def test_sweeper_closes_idle_stores():
+    async def scenario():
+        stores, opened, metrics = cache(max_stores=10, idle_timeout=0.05)
+        stores.start()
+        try:
+            await use(stores, 'a')
+            await asyncio.sleep(0.2)
+            assert opened['a'].closed
+            assert len(stores) == 0
+        finally:
+            stores.close()
+
+    asyncio.run(scenario())
+
+
+def test_closes_async_stores(tmp_path):
+    async def scenario():
+        metrics = StoreCacheMetrics(MetricsRegistry())
+        stores = StoreCache(lambda project: AsyncSymbolStore(
+            project, lambda: PySqliteSymbolStore(str(tmp_path / f'{project}.db'))), 1, 0, metrics)
+        async with stores.use('a') as store:
+            assert await store.get_sequence() == 0
+        async with stores.use('b') as store:
+            assert await store.get_sequence() == 0
+        assert len(stores) == 1
+        stores.close()
+        assert metrics.open.value == 0
+
+    asyncio.run(scenario())
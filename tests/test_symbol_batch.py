@@ -0,0 +1,78 @@
+import random
+
+from common.codecs import BINARY_CODEC, BINARY_SCHEMAS, FIELD_SYMBOLS
+from common.symbol import Symbol, SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_CLASS
+from common.symbol_batch import SymbolBatch, signature_symbol_type
+
+
+def random_symbols(rng: random.Random, count: int):
+    symbols = []
+    for i in range(count):
+        cls = f'Lcom/example/C{rng.randrange(10)};'
+        symbol_type = rng.choice((SYMBOL_TYPE_FIELD, SYMBOL_TYPE_METHOD, SYMBOL_TYPE_CLASS))
+        signature = {SYMBOL_TYPE_CLASS: cls, SYMBOL_TYPE_METHOD: f'{cls}->m{i}(I)V',
+                     SYMBOL_TYPE_FIELD: f'{cls}->f{i}:I'}
+        symbols.append(Symbol(symbol_type, signature[symbol_type], rng.choice((None, f'name{i}')),
+                              timestamp=rng.choice((None, rng.randrange(1 << 40))),
+                              author=rng.choice((None, 'alice', 'bob'))))
+    return symbols
+
+
+def test_from_symbols_round_trip():
+    symbols = random_symbols(random.Random(0), 500)
+    batch = SymbolBatch.from_symbols(symbols)
+    assert len(batch) == len(symbols)
+    assert list(batch) == symbols
+    assert batch[10:20] == symbols[10:20]
+    assert batch.rows == [(symbol.author, symbol.symbol_type, symbol.canonical_signature, symbol.name,
+                           symbol.timestamp) for symbol in symbols]
+    # Classes and authors are shared by the batch's symbols
+    assert len(batch.classes) == len({symbol.canonical_signature.partition('->')[0] for symbol in symbols})
+    assert len(batch.authors) == len({symbol.author for symbol in symbols})
+    assert SymbolBatch.from_symbols(batch) is batch
+
+
+def test_empty_batch():
+    batch = SymbolBatch.from_symbols([])
+    assert len(batch) == 0
+    assert list(batch) == []
+    assert batch.rows == []
+    assert list(SymbolBatch.concatenate([batch, batch])) == []
+
+
+def test_concatenate():
+    rng = random.Random(1)
+    parts = [random_symbols(rng, count) for count in (0, 1, 50, 200)]
+    batch = SymbolBatch.concatenate([SymbolBatch.from_symbols(part) if i % 2 else part
+                                     for i, part in enumerate(parts)])
+    assert list(batch) == [symbol for part in parts for symbol in part]
+    assert len(batch.classes) == len(set(batch.classes))
+    assert len(batch.authors) == len(set(batch.authors))
+
+
+def test_stamped():
+    symbols = random_symbols(random.Random(2), 100)
+    stamped = SymbolBatch.from_symbols(symbols).stamped(1234, 'carol')
+    assert list(stamped) == [symbol.clone(timestamp=1234).authored('carol') for symbol in symbols]
+
+
+def test_signature_symbol_type():
+    for symbol in random_symbols(random.Random(3), 100):
+        assert signature_symbol_type(symbol.canonical_signature) == symbol.symbol_type
+
+
+def test_binary_schemas_round_trip_batches():
+    # Every command carrying symbols round trips batches (as well as lists) of them
+    rng = random.Random(4)
+    for tag, (typ, fields) in BINARY_SCHEMAS.items():
+        symbols_fields = [name for name, kind in fields if kind == FIELD_SYMBOLS]
+        if not symbols_fields:
+            continue
+        for count in (0, 1, 300):
+            symbols = random_symbols(rng, count)
+            command = typ(**{name: SymbolBatch.from_symbols(symbols) if kind == FIELD_SYMBOLS else None
+                             for name, kind in fields})
+            decoded = BINARY_CODEC.decode(BINARY_CODEC.encode(command))
+            for name in symbols_fields:
+                assert isinstance(getattr(decoded, name), SymbolBatch)
+                assert list(getattr(decoded, name)) == symbols
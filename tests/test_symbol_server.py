@@ -0,0 +1,196 @@
+import asyncio
+
+from common.codecs import JSON_CODEC
+from common.commands import Subscribe, UpstreamSymbols, FullSyncRequest, FullSyncComplete, Handshake, HandshakeResponse
+from common.consts import PROTOCOL_VERSION
+from common.symbol import Symbol, SYMBOL_TYPE_METHOD
+from server.config import ServerConfig
+from server.default_symbol_server import DefaultSymbolServer
+from server.pysqlite_symbol_store import PySqliteSymbolStore
+from server.utils import recv_packet, send_packet
+
+
+class FailingSymbolStore(PySqliteSymbolStore):
+    def push_symbols(self, symbols):
+        raise OSError('disk I/O error')
+
+
+class FailingSymbolServer(DefaultSymbolServer):
+    def _get_store(self, project):
+        return FailingSymbolStore(str((self._store_directory / project).with_suffix('.db')))
+
+
+async def connect(port: int, name: str):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    await send_packet(writer, name.encode('utf-8'))
+    return reader, writer
+
+
+async def handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, version: int = PROTOCOL_VERSION):
+    await send_command(writer, Handshake(version, [JSON_CODEC.name]))
+    response = await recv_command(reader)
+    assert isinstance(response, HandshakeResponse) and response.codec == JSON_CODEC.name
+
+
+async def send_command(writer: asyncio.StreamWriter, command):
+    await send_packet(writer, JSON_CODEC.encode(command))
+
+
+async def recv_command(reader: asyncio.StreamReader):
+    return JSON_CODEC.decode(await asyncio.wait_for(recv_packet(reader), 5))
+
+
+async def until(predicate, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_failed_commit_keeps_connection(tmp_path):
+    async def scenario():
+        server = FailingSymbolServer('127.0.0.1', 0, tmp_path, None)
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await connect(port, 'alice')
+            await send_command(writer, Subscribe('project'))
+            await send_command(writer, UpstreamSymbols('project', [Symbol(SYMBOL_TYPE_METHOD, 'La;->m()V', 'renamed')],
+                                                       False))
+            # The connection outlives the failed commit, still handling commands
+            await send_command(writer, FullSyncRequest('project', 0))
+            response = await recv_command(reader)
+            assert isinstance(response, FullSyncComplete)
+            assert len(server.clients) == 1
+
+            writer.close()
+            await until(lambda: not server.clients)
+            assert not server.subscriber_counts()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server._stores.close()
+
+    asyncio.run(scenario())
+
+
+class PagedSymbolServer(DefaultSymbolServer):
+    # Full syncs in pages of FULL_SYNC_PAGE_SYMBOLS, calling `during_paging` once the first one was sent
+    FULL_SYNC_PAGE_SYMBOLS = 7
+
+    def __init__(self, *args, during_paging=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = []
+        self._during_paging = during_paging
+
+    async def push_symbols(self, client, project, symbols):
+        self.pages.append(len(symbols))
+        if len(self.pages) == 1 and self._during_paging is not None:
+            self._during_paging()
+        await super().push_symbols(client, project, symbols)
+
+
+def method(i: int, name: str = 'name', timestamp: int = 1) -> Symbol:
+    return Symbol(SYMBOL_TYPE_METHOD, f'La;->m{i:03}()V', f'{name}{i}', timestamp=timestamp, author='alice')
+
+
+def push(directory, symbols: list):
+    store = PySqliteSymbolStore(str(directory / 'project.db'))
+    try:
+        store.push_symbols(symbols)
+    finally:
+        store.close()
+
+
+async def full_sync(port: int, request: FullSyncRequest) -> tuple:
+    # The symbols a full sync sent, in order, and its FullSyncComplete
+    reader, writer = await connect(port, 'alice')
+    try:
+        await handshake(reader, writer)
+        await send_command(writer, request)
+        received = []
+        while True:
+            command = await recv_command(reader)
+            if isinstance(command, FullSyncComplete):
+                return received, command
+            received.extend((symbol.canonical_signature, symbol.name) for symbol in command.symbols)
+    finally:
+        writer.close()
+
+
+def test_split_page_bounded():
+    class SmallPagesServer(DefaultSymbolServer):
+        FULL_SYNC_PAGE_BYTES = 500
+
+    symbols = [method(i, 'n' * (i % 7) * 20) for i in range(40)] + [method(40, 'n' * 1000)]
+    pages = list(SmallPagesServer.split_page(symbols))
+    assert [symbol for page in pages for symbol in page] == symbols
+    for page in pages:
+        size = sum(SmallPagesServer.SYMBOL_ENCODING_OVERHEAD + len(symbol.canonical_signature) + len(symbol.name) +
+                   len(symbol.author) for symbol in page)
+        # Symbols larger than a page are sent in a page of their own
+        assert size <= SmallPagesServer.FULL_SYNC_PAGE_BYTES or len(page) == 1
+    assert pages[-1] == symbols[-1:]
+
+
+def test_full_sync_pages_bounded(tmp_path):
+    async def scenario():
+        push(tmp_path, [method(i) for i in range(50)])
+        server = PagedSymbolServer('127.0.0.1', 0, tmp_path, None, ServerConfig(snapshot_rebuild_changes=0))
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            for request in (FullSyncRequest('project', 0), FullSyncRequest('project', 0, 0)):
+                server.pages.clear()
+                received, complete = await full_sync(port, request)
+                assert received == [(symbol.canonical_signature, symbol.name) for symbol in map(method, range(50))]
+                assert complete.seq == 50
+                assert server.pages == [7] * 7 + [1]
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server._stores.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_sync_continues_past_writes(tmp_path):
+    # Symbols both already sent and not yet sent are renamed (and new ones added) while paging
+    written = [method(i, 'renamed', 2) for i in (0, 3, 20, 40)] + [method(i) for i in range(50, 55)]
+
+    async def scenario():
+        push(tmp_path, [method(i) for i in range(50)])
+        server = PagedSymbolServer('127.0.0.1', 0, tmp_path, None, ServerConfig(snapshot_rebuild_changes=0),
+                                   during_paging=lambda: push(tmp_path, written))
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        latest = {symbol.canonical_signature: symbol.name for symbol in map(method, range(50))}
+        latest.update((symbol.canonical_signature, symbol.name) for symbol in written)
+        try:
+            # By timestamp, every symbol is sent once, in order, and the sync completes at the sequence number it
+            # started at, so the next one sends everything changed while paging
+            received, complete = await full_sync(port, FullSyncRequest('project', 0))
+            signatures = [signature for signature, _ in received]
+            assert signatures == sorted(set(signatures))
+            assert set(signatures) >= {symbol.canonical_signature for symbol in map(method, range(50))}
+            assert complete.seq == 50
+            received, complete = await full_sync(port, FullSyncRequest('project', 0, complete.seq))
+            assert received == [(symbol.canonical_signature, symbol.name) for symbol in written]
+            assert complete.seq == 59
+
+            # By sequence number, symbols changed while paging are sent (again) after those that weren't
+            server.pages.clear()
+            server._during_paging = lambda: push(tmp_path, [method(i, 'again', 3) for i in (1, 30)])
+            latest.update((symbol.canonical_signature, symbol.name) for symbol in (method(1, 'again', 3),
+                                                                                   method(30, 'again', 3)))
+            received, complete = await full_sync(port, FullSyncRequest('project', 0, 0))
+            assert dict(received) == latest
+            assert received[-2:] == [(method(1).canonical_signature, 'again1'), (method(30).canonical_signature,
+                                                                                 'again30')]
+            assert complete.seq == 61
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server._stores.close()
+
+    asyncio.run(scenario())